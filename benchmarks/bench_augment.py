@@ -0,0 +1,36 @@
+"""
+BatchAugmenterのスループット(images/sec)を測る。
+
+$ python benchmarks/bench_augment.py --batch_size 50 128 512
+"""
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+
+from mlbase.dataset.augment import BatchAugmenter
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--batch_size", type=int, nargs="+", default=[50, 128, 512])
+    parser.add_argument("--seconds", type=float, default=2.0)
+    args = parser.parse_args()
+
+    augmenter = BatchAugmenter(seed=0)
+    rng = np.random.default_rng(0)
+    for batch_size in args.batch_size:
+        images = rng.integers(0, 256, size=[batch_size, 32, 32, 3], dtype=np.uint8)
+        augmenter(images)
+
+        count = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < args.seconds:
+            augmenter(images)
+            count += batch_size
+        elapsed = time.perf_counter() - start
+        print(f"batch_size={batch_size}: {count / elapsed:.0f} images/sec")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+cifarのバイナリ読み込みのベンチマーク。
+旧実装(1レコードずつ読むもの)とfixed_recordによる実装を比較する。
+
+$ python benchmarks/bench_fixed_record.py --count 50000
+"""
+import sys
+import time
+import tempfile
+import itertools as it
+from argparse import ArgumentParser
+from pathlib import Path
+
+import numpy as np
+
+from mlbase.template.cifar.train import Data, load_image_binary, CIFAR10_RECORD, CIFAR100_RECORD
+
+
+def legacy_load_image_binary(path) -> Data:
+    clabels = []
+    flabels = []
+    images = []
+    with open(path, 'rb') as f:
+        for i in it.count():
+            data = f.read(32 * 32 * 3 + 2)
+            if not data:
+                break
+            sys.stdout.write(f"{i}\r")
+            clabel = data[0]
+            flabel = data[1]
+            image = list(data[2:])
+            clabels.append(clabel)
+            flabels.append(flabel)
+            images.append(image)
+    clabels = np.array(clabels)
+    flabels = np.array(flabels)
+    images_np = np.array(images, dtype=np.uint8)
+    images_np = images_np.reshape([-1, 3, 32, 32]).transpose([0, 2, 3, 1])
+    return Data(images=images_np, coarse_labels=clabels, fine_labels=flabels)
+
+
+def write_dummy(path, count, label_bytes):
+    rng = np.random.default_rng(0)
+    rng.integers(0, 256, size=[count, label_bytes + 32 * 32 * 3], dtype=np.uint8).tofile(str(path))
+
+
+def timeit(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        # ビューのままだと読み込みが遅延するので、一度全体に触れる
+        int(result.images.sum())
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--count", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path100 = Path(tmp) / "cifar100.bin"
+        path10 = Path(tmp) / "cifar10.bin"
+        write_dummy(path100, args.count, 2)
+        write_dummy(path10, args.count, 1)
+
+        legacy_time, legacy = timeit(lambda: legacy_load_image_binary(path100), 1)
+        for mmap in [True, False]:
+            new_time, new = timeit(lambda: load_image_binary(path100, CIFAR100_RECORD, mmap=mmap), args.repeat)
+            assert np.array_equal(legacy.images, new.images)
+            assert np.array_equal(legacy.coarse_labels, new.coarse_labels)
+            assert np.array_equal(legacy.fine_labels, new.fine_labels)
+            speedup = legacy_time / new_time
+            print(f"cifar100 mmap={mmap}: {new_time:.4f}[s] (legacy {legacy_time:.4f}[s], x{speedup:.1f})")
+
+        cifar10_time, _ = timeit(lambda: load_image_binary(path10, CIFAR10_RECORD), args.repeat)
+        print(f"cifar10 mmap=True: {cifar10_time:.4f}[s]")
+
+
+if __name__ == '__main__':
+    main()
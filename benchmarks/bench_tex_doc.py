@@ -0,0 +1,45 @@
+"""
+split_tex_docのベンチマーク。
+以前の状態遷移による実装と比較し、1秒あたりの単語数を表示する。
+
+$ python benchmarks/bench_tex_doc.py --lines 20000
+"""
+import random
+import time
+from argparse import ArgumentParser
+
+from mlbase.arxiv2vec.preprocess.tex_doc import split_tex_doc, legacy_split_tex_doc
+
+WORDS = ["we", "show", "that", "the", "operator", "is", "bounded,", "$x$", "$f(x) = x^2$", "$$\\int_0^1 g$$", "and."]
+
+
+def make_lines(count, seed=0):
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(WORDS) for _ in range(rng.randint(80, 200))) + "\n" for _ in range(count)]
+
+
+def timeit(fn, lines, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = sum(len(fn(line)) for line in lines)
+        best = min(best, time.perf_counter() - start)
+    return best, count
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--lines", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    lines = make_lines(args.lines)
+    legacy_time, legacy_count = timeit(legacy_split_tex_doc, lines, 1)
+    new_time, new_count = timeit(split_tex_doc, lines, args.repeat)
+    assert legacy_count == new_count
+    print(f"legacy: {legacy_count / legacy_time:,.0f} tokens/s")
+    print(f"split_tex_doc: {new_count / new_time:,.0f} tokens/s (x{legacy_time / new_time:.1f})")
+
+
+if __name__ == '__main__':
+    main()
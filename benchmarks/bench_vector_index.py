@@ -0,0 +1,61 @@
+"""
+近傍探索の索引のベンチマーク。
+文書数を変えながら、exactとivf(nprobeごと)の1質問あたりの時間とexactに対するrecall@kを表示する。
+
+$ python benchmarks/bench_vector_index.py --sizes 100000 1000000
+"""
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+
+from mlbase.arxiv2vec.index import build_index
+
+
+def make_vectors(count, dim, clusters, seed=0):
+    """
+    文書ベクトルに近いように、いくつかの中心の周りに散らばったベクトルを作る
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=[clusters, dim])
+    return (centers[rng.integers(0, clusters, count)] + 0.5 * rng.normal(size=[count, dim])).astype(np.float32)
+
+
+def measure(index, queries, k, **kwargs):
+    start = time.perf_counter()
+    ids = np.concatenate([index.search(query, k, **kwargs)[0] for query in queries])
+    return (time.perf_counter() - start) / len(queries), ids
+
+
+def recall(ids, expected):
+    return np.mean([len(set(a) & set(b)) / len(b) for a, b in zip(ids, expected)])
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--dim", type=int, default=50)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobes", type=int, nargs="+", default=[1, 4, 8, 32])
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        vectors = make_vectors(size + args.queries, args.dim, clusters=1000)
+        vectors, queries = vectors[:size], vectors[size:]
+
+        exact = build_index(vectors, "exact")
+        exact_time, expected = measure(exact, queries, args.k)
+        print(f"n={size} exact: {exact_time * 1000:.2f}[ms/query]")
+
+        start = time.perf_counter()
+        ivf = build_index(vectors, "ivf")
+        print(f"n={size} ivf nlist={ivf.params['nlist']} build: {time.perf_counter() - start:.1f}[s]")
+        for nprobe in args.nprobes:
+            ivf_time, ids = measure(ivf, queries, args.k, nprobe=nprobe)
+            print(f"n={size} ivf nprobe={nprobe}: {ivf_time * 1000:.2f}[ms/query] "
+                  f"recall@{args.k}={recall(ids, expected):.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,5 @@
+import os
 from argparse import Namespace
-import pickle
-import json
 from typing import (
     Optional,
     Callable,
@@ -10,6 +9,13 @@ from typing import (
 )
 
 from mlbase.lazy import numpy as np
+from mlbase.arxiv2vec import model as model_io
+from mlbase.arxiv2vec import server
+from mlbase.arxiv2vec import index as vector_index
+from mlbase.arxiv2vec import similarity
+from mlbase.arxiv2vec.vector_store import VectorStore
+from mlbase.logger import info, error
+from mlbase.arxiv2vec.dataset import metadata
 
 Model = NewType("Model", object)
 _ACTIONS: Dict[str, Callable[[Model, Namespace], None]] = {}
@@ -41,7 +47,18 @@ def run(args: Namespace):
 
 
 def load_model(path: str) -> Model:
-    return cast(Model, pickle.load(open(path, "rb")))
+    return cast(Model, model_io.load(path))
+
+
+def load_model_or_connect(args: Namespace) -> Model:
+    """
+    同じモデルの推論サーバーが動いていればそこに処理を送るモデルを、動いていなければ読み込んだモデルを返す。
+    """
+    if not args.no_server:
+        remote = server.connect(args.server_socket, model_path=args.load_model)
+        if remote is not None:
+            return cast(Model, remote)
+    return load_model(args.load_model)
 
 
 @by_action_name()
@@ -49,20 +66,34 @@ def show_vector(model: Model, args: Namespace):
     """
     文章に対し評価し、そのベクトルを表示する
     """
-    for input_ in args.input_texts:
-        text = _get_input_text(input_)
-        vec = model.infer_vector(text)
+    vectors = model.infer_vectors(map(_get_input_text, args.input_texts), jobs=args.jobs)
+    for input_, vec in zip(args.input_texts, vectors):
         print(input_)
         print(vec)
 
 
 @by_action_name()
 def compare(model: Model, args: Namespace):
-    vec_l = model.infer_vector(_get_input_text(args.input_texts[0]))
-    vec_r = model.infer_vector(_get_input_text(args.input_texts[1]))
-    vec_l /= np.sqrt(sum(vec_l * vec_l))
-    vec_r /= np.sqrt(sum(vec_r * vec_r))
-    print("cos = ", sum(vec_r * vec_l))
+    """
+    文章どうしのコサイン類似度を計算する。
+    2つの文章で出力先が無ければ類似度を表示し、それ以外は類似度行列(またはtop_k件)を表示するか書き出す
+    """
+    vectors = np.array(model.infer_vectors(map(_get_input_text, args.input_texts), jobs=args.jobs))
+    if args.output:
+        similarity.write_similarity(args.output, args.input_texts, vectors, top_k=args.top_k,
+                                    block_size=args.block_size)
+    elif len(vectors) == 2 and not args.top_k:
+        vec_l, vec_r = similarity.normalize(vectors)
+        print("cos = ", float(vec_l @ vec_r))
+    elif args.top_k:
+        for input_, row in zip(args.input_texts, similarity.top_k_similar(vectors, args.top_k, args.block_size)):
+            print(f"--- INPUT: {input_}")
+            for i, cos in row[row["index"] >= 0].tolist():
+                print(f"{cos:.6f}", args.input_texts[i])
+    else:
+        for head, block in similarity.similarity_blocks(vectors, args.block_size):
+            for input_, row in zip(args.input_texts[head:], block):
+                print(input_, " ".join(f"{cos:.4f}" for cos in row))
 
 
 @by_action_name()
@@ -70,36 +101,62 @@ def find_neighbors(model: Model, args: Namespace):
     """
     近傍探索を行う
     """
-    targets = _load_train_data_to_show(args.train_data)
-    for input_ in args.input_texts:
-        print(f"--- INPUT: {input_}")
-        print("".join(open(input_).readlines()))
-        vec = model.infer_vector(_get_input_text(input_))
-        top_scores = model.find_neighbors(vec)
-        for order, (i, score) in enumerate(top_scores):
-            print("---", order + 1, i, score)
-            print(targets[i]["title"])
-            print(targets[i]["id"])
-            print(targets[i]["summary"][:160])
+    with _load_train_data_to_show(args.train_data, getattr(model, "train_source", None)) as targets:
+        vectors = model.infer_vectors(map(_get_input_text, args.input_texts), jobs=args.jobs)
+        for input_, vec in zip(args.input_texts, vectors):
+            print(f"--- INPUT: {input_}")
+            print("".join(open(input_).readlines()))
+            top_scores = model.find_neighbors(vec, args.k)
+            for order, (i, score) in enumerate(top_scores):
+                print("---", order + 1, i, score)
+                paper = targets[i]
+                print(paper["title"])
+                print(paper["id"])
+                print(paper["summary"][:160])
+
+
+def build_index(model: Model, args: Namespace):
+    """
+    訓練文書のベクトルから近傍探索の索引を作り、モデルの隣に保存する
+    """
+    params = {"nlist": args.nlist, "nprobe": args.nprobe} if args.index_type == "ivf" else {}
+    index = vector_index.build_index(model.doc_vectors(), args.index_type, **params)
+    index.save(vector_index.index_path(args.load_model))
 
 
 def _get_input_text(fname: str) -> str:
     return "".join(open(fname))
 
 
-def _load_train_data_to_show(train_data: str):
-    return json.load(open(train_data))
+def _load_train_data_to_show(train_data: str, train_source: Optional[dict] = None):
+    """
+    モデルが訓練時の作成元を持っていれば、それと同じものかを確認して開く。
+    """
+    if train_source is None:
+        return metadata.open_metadata_store(train_data)
+    if os.path.abspath(train_data) != train_source["train_data"]:
+        error(f"モデルは{train_source['train_data']}から作った訓練データで訓練されています。")
+    return metadata.open_metadata_store(train_data, expected_stamp=train_source["stamp"])
 
 
 @by_action_name()
 def output_vectors(model: Model, args: Namespace):
     """
-    文章に対し評価し、そのベクトルを書き込む
+    文章に対し評価し、そのベクトルを書き込む。
+    output_storeを指定すると、chunk_size件ごとにチャンクとして追記し、既に保存済みの入力は読み飛ばす
     """
+    if args.output_store:
+        with VectorStore(args.output_store, chunk_size=args.chunk_size) as store:
+            done = store.done_ids()
+            todo = [input_ for input_ in dict.fromkeys(args.input_texts) if input_ not in done]
+            info(f"{len(done)}件は保存済み、{len(todo)}件を処理します。")
+            for head in range(0, len(todo), args.chunk_size):
+                batch = todo[head:head + args.chunk_size]
+                for input_, vec in zip(batch, model.infer_vectors(map(_get_input_text, batch), jobs=args.jobs)):
+                    store.append(input_, vec)
+                store.flush()
+        return
+
     texts = args.input_texts.copy()
-    vectors = []
-    for input_ in args.input_texts:
-        text = _get_input_text(input_)
-        vectors.append(model.infer_vector(text))
-    vectors = np.array(vectors)
+    vectors = np.array(model.infer_vectors(map(_get_input_text, args.input_texts), jobs=args.jobs))
     np.savez(args.output_npz, texts=texts, vectors=vectors)
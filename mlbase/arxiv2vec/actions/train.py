@@ -1,26 +1,28 @@
 from mlbase.arxiv2vec.model import Doc2VecModel
-from mlbase.arxiv2vec.preprocess import TeXMixedTextPreprocessor, SimplePreprocessor, AbsPreprocessor
+from mlbase.arxiv2vec.corpus import LineCorpus
+from mlbase.arxiv2vec.token_cache import load_or_build_token_cache
+from mlbase.arxiv2vec import preprocess
+from mlbase.arxiv2vec.preprocess import AbsPreprocessor
+from mlbase.arxiv2vec.dataset import json_arxiv
 
 
 def run(args, *_, **__):
     preprocesser = get_preprocessor(args.preprocess, args)
     model = get_model(args.model, preprocesser, args)
-    train_docs = get_train_docs(args)
-    model.train(train_docs)
-    model.save(args.save_model)
+    if args.token_cache:
+        model.train_corpus(load_or_build_token_cache(args.token_cache, args.train_data, preprocesser, jobs=args.jobs))
+    else:
+        model.train(get_train_docs(args), jobs=args.jobs)
+    model.train_source = json_arxiv.load_source(args.train_data)
+    model.save(args.save_model, save_format=args.save_format)
 
 
 def get_train_docs(args):
-    return open(args.train_data)
+    return LineCorpus(args.train_data)
 
 
 def get_preprocessor(name, args) -> AbsPreprocessor:
-    if name == "tex":
-        return TeXMixedTextPreprocessor()
-    elif name == "simple":
-        return SimplePreprocessor()
-    else:
-        raise NotImplementedError()
+    return preprocess.get_preprocessor(name)
 
 
 def get_model(name, preprocesser, args):
@@ -1,6 +1,10 @@
 from mlbase.utils.cli import Command
+from mlbase.arxiv2vec import server
+from mlbase.arxiv2vec import index as vector_index
+from mlbase.arxiv2vec import similarity
 from mlbase.arxiv2vec.actions import train, infer
-from mlbase.arxiv2vec.dataset import json_arxiv, merge_json
+from mlbase.arxiv2vec.dataset import json_arxiv, merge_json, metadata
+from mlbase.arxiv2vec.preprocess import preprocessor_type
 
 
 def arxiv2vec_command():
@@ -8,6 +12,8 @@ def arxiv2vec_command():
     cmd >> dataset_command()
     cmd >> infer_command()
     cmd >> train_command()
+    cmd >> serve_command()
+    cmd >> build_index_command()
 
     return cmd
 
@@ -19,20 +25,37 @@ def dataset_command():
     cmd = Command("dataset", "データセットを整理するコマンド")
 
     cmd_json = Command("json_arxiv", "arXivのデータを今回用に加工") << cmd
-    cmd_json.option('--input', required=True, nargs='+')
+    cmd_json.option('--input', nargs='+')
+    cmd_json.option('--merged', help="merge_jsonの出力。find_neighborsと文書番号を揃えるため、こちらを使う")
     cmd_json.option('--output', required=True)
+    cmd_json.option("--jobs", type=int, default=1, help="並列に処理する入力ファイル数")
 
     @cmd_json
     def run_json_arxiv(args, *_, **__):
-        json_arxiv.run(args.input, args.output)
+        if bool(args.input) == bool(args.merged):
+            raise Exception("--inputと--mergedのどちらか一方を指定してください。")
+        if args.merged:
+            json_arxiv.from_merged(args.merged, args.output)
+        else:
+            json_arxiv.run(args.input, args.output, jobs=args.jobs)
 
     cmd_merge_json = Command("merge_json", "jsonファイルの統合") << cmd
     cmd_merge_json.option('--input', required=True, nargs='+')
-    cmd_merge_json.option('--output', required=True)
+    cmd_merge_json.option('--output', required=True, help="JSONLのシャードを置くディレクトリ")
+    cmd_merge_json.option("--jobs", type=int, default=1, help="並列に処理する入力ファイル数")
+
+    cmd_merge_json.option("--incremental", action="store_true", help="統合済みの論文を索引で判定し、差分だけを追記する")
 
     @cmd_merge_json
     def run_merge_json(args, *_, **__):
-        merge_json(args.input, args.output)
+        merge_json.run(args.input, args.output, jobs=args.jobs, incremental=args.incremental)
+
+    cmd_metadata = Command("metadata", "近傍の表示に使うメタデータを作成") << cmd
+    cmd_metadata.option('--train_data', required=True, help="merge_jsonの出力")
+
+    @cmd_metadata
+    def run_metadata(args, *_, **__):
+        metadata.open_metadata_store(args.train_data).close()
 
     return cmd
 
@@ -46,38 +69,99 @@ def infer_command():
     cmd_show_vector = Command("show_vector", "ベクトル表示") << cmd
     cmd_show_vector.option('--load_model')
     cmd_show_vector.option('input_texts', nargs="+")
+    cmd_show_vector.option("--jobs", type=int, default=1, help="前処理のプロセス数")
 
     @cmd_show_vector
     def run_show_vector(args, *_, **__):
-        model = infer.load_model(args.load_model)
+        model = infer.load_model_or_connect(args)
         infer.run_action("show_vector", model, args)
 
     cmd_compare = Command("compare", "比較") << cmd
+    cmd_compare.option("--load_model")
+    cmd_compare.option("input_texts", nargs="+")
+    cmd_compare.option("--output", help="類似度の出力先(.npyか.csv)")
+    cmd_compare.option("--top_k", type=int, help="各文章について類似度の大きいものだけを残す件数")
+    cmd_compare.option("--block_size", type=int, default=1024, help="一度に計算する類似度行列の行数")
+    cmd_compare.option("--jobs", type=int, default=1, help="前処理のプロセス数")
 
     @cmd_compare
     def run_compare(args, *_, **__):
-        model = infer.load_model(args.load_model)
+        if args.output:
+            similarity.check_output_path(args.output)
+        model = infer.load_model_or_connect(args)
         infer.run_action("compare", model, args)
 
     cmd_find_neighbors = Command("find_neighbors", "近傍探索") << cmd
     cmd_find_neighbors.option("--train_data")
     cmd_find_neighbors.option("--load_model")
     cmd_find_neighbors.option("--input_texts", nargs="+")
+    cmd_find_neighbors.option("--k", type=int, default=10, help="表示する近傍の数")
+    cmd_find_neighbors.option("--jobs", type=int, default=1, help="前処理のプロセス数")
 
     @cmd_find_neighbors
     def run_find_neighbors(args, *_, **__):
-        model = infer.load_model(args.load_model)
+        model = infer.load_model_or_connect(args)
         infer.run_action("find_neighbors", model, args)
 
     cmd_output_vectors = Command("output_vectors", "ベクトル保存") << cmd
     cmd_output_vectors.option("--load_model")
     cmd_output_vectors.option("--input_texts", nargs="+")
+    cmd_output_vectors.option("--output_npz", help="全ベクトルをまとめて書き出す.npzファイル")
+    cmd_output_vectors.option("--output_store", help="ベクトルをチャンクごとに追記するディレクトリ。中断しても続きから再開できる")
+    cmd_output_vectors.option("--chunk_size", type=int, default=1024, help="output_storeの1チャンクの件数")
+    cmd_output_vectors.option("--jobs", type=int, default=1, help="前処理のプロセス数")
 
     @cmd_output_vectors
     def run_output_vectors(args, *_, **__):
-        model = infer.load_model(args.load_model)
+        if not (args.output_npz or args.output_store):
+            raise Exception("--output_npzか--output_storeを指定してください。")
+        model = infer.load_model_or_connect(args)
         infer.run_action("output_vectors", model, args)
 
+    for sub in [cmd_show_vector, cmd_compare, cmd_find_neighbors, cmd_output_vectors]:
+        sub.option("--server_socket", default=server.default_socket_path(), help="推論サーバーのソケット")
+        sub.option("--no_server", action="store_true", help="推論サーバーが動いていても使わない")
+
+    return cmd
+
+
+def serve_command():
+    """
+    serveコマンド
+    """
+    cmd = Command("serve", "モデルを読み込んだまま推論リクエストを受け付ける")
+    cmd.option("--load_model", required=True)
+    cmd.option("--server_socket", default=server.default_socket_path())
+    cmd.option("--workers", type=int, default=1, help="推論を行うプロセス数")
+    cmd.option("--max_batch", type=int, default=32, help="まとめて処理するリクエスト数の上限")
+    cmd.option("--batch_window", type=float, default=0.005, help="リクエストをまとめるために待つ秒数")
+
+    @cmd
+    def run_serve(args, *_, **__):
+        inference_server = server.InferenceServer(args.load_model, args.server_socket, workers=args.workers,
+                                                  max_batch=args.max_batch, batch_window=args.batch_window)
+        try:
+            inference_server.run()
+        except KeyboardInterrupt:
+            pass
+
+    return cmd
+
+
+def build_index_command():
+    """
+    build_indexコマンド
+    """
+    cmd = Command("build_index", "近傍探索の索引をモデルの隣に作る")
+    cmd.option("--load_model", required=True)
+    cmd.option("--index_type", choices=sorted(vector_index.index_type), default="ivf")
+    cmd.option("--nlist", type=int, help="ivfのクラスタ数。省略時は4√文書数")
+    cmd.option("--nprobe", type=int, default=8, help="ivfの探索時に調べるクラスタ数")
+
+    @cmd
+    def run_build_index(args, *_, **__):
+        infer.build_index(infer.load_model(args.load_model), args)
+
     return cmd
 
 
@@ -87,8 +171,12 @@ def train_command():
     """
     cmd = Command("train", "訓練する")
     cmd.option("--model", required=True)
-    cmd.option("--preprocess", required=True)
+    cmd.option("--preprocess", required=True, choices=sorted(preprocessor_type))
     cmd.option("--train_data", required=True)
     cmd.option("--save_model", required=True)
+    cmd.option("--save_format", choices=["pickle", "dir"], default="pickle",
+               help="dirならmmapで読み込めるディレクトリ形式で保存する")
+    cmd.option("--jobs", type=int, default=1, help="前処理のプロセス数")
+    cmd.option("--token_cache", help="前処理済みコーパスを置くディレクトリ。指定すると2回目以降は前処理を省略する")
     cmd(train.run)
     return cmd
@@ -0,0 +1,41 @@
+"""
+Doc2Vecの訓練用コーパス。
+gensimはbuild_vocabとtrainでコーパスを複数回走査するので、リストに展開せずに毎回先頭から読み直す。
+"""
+from typing import Iterable, Iterator
+
+from mlbase.lazy import gensim
+
+
+class LineCorpus:
+    """
+    テキストファイルの1行を1文書とし、イテレートのたびにファイルを開き直す
+    """
+
+    def __init__(self, path: str) -> None:
+        self.__path = path
+
+    def __iter__(self) -> Iterator[str]:
+        with open(self.__path) as f:
+            yield from f
+
+
+class TaggedCorpus:
+    """
+    文書をイテレートのたびに前処理し、通し番号をタグにしたTaggedDocumentとして返す
+    """
+
+    def __init__(self, docs: Iterable[str], preprocessor) -> None:
+        """
+        Args:
+            docs: 何度でもイテレートできる文書の列(LineCorpusやリスト)
+            preprocessor: AbsPreprocessor
+        """
+        if iter(docs) is docs:
+            raise TypeError("1回しか走査できないイテレータはコーパスに使えません。LineCorpusを使ってください。")
+        self.__docs = docs
+        self.__preprocessor = preprocessor
+
+    def __iter__(self):
+        for i, words in enumerate(self.__preprocessor.preprocess_lines(self.__docs)):
+            yield gensim.models.doc2vec.TaggedDocument(words, [i])
@@ -1,13 +1,67 @@
+"""
+Doc2Vecの訓練データ(1行1文書のsummary)を作る。
+
+訓練データのi行目が文書番号iになり、find_neighborsはmerge_jsonの出力のi番目の論文を表示する。
+merge_jsonで重複を除いた場合(incremental)は入力の論文と順番や件数が変わるので、
+訓練データは必ずfrom_mergedでmerge_jsonの出力から作ること。
+
+from_mergedは訓練データの隣(train.txt.source.json)に作成元のmerge_jsonの出力とその状態を書く。
+trainはこれをモデルに保存し、find_neighborsは訓練後に作成元が更新されていないかを確認する。
+"""
 import json
 import os
+import shutil
+import tempfile
+
+from typing import Optional
 
+from mlbase.arxiv2vec.dataset import merge_json, metadata
+from mlbase.arxiv2vec.dataset.json_stream import iter_json_array
+from mlbase.arxiv2vec.dataset.parallel import map_files, write_atomically
 from mlbase.arxiv2vec.dataset.utils import fix_needless_new_line
 
 
-def run(inputs: str, output: str):
+def run(inputs: str, output: str, jobs: int = 1):
+    """
+    各論文のsummaryを1行1文書で書き出す。入力ファイルごとに並列に処理し、入力の順に連結する。
+    """
+    output_abs = os.path.abspath(output)
+    # 以前にfrom_mergedで作ったものの作成元の情報は当てはまらなくなる
+    if os.path.exists(source_path(output_abs)):
+        os.remove(source_path(output_abs))
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(output_abs)) as tmp:
+        parts = [os.path.join(tmp, f"part-{i:05d}.txt") for i in range(len(inputs))]
+        map_files(_summaries, zip(map(os.path.abspath, inputs), parts), jobs)
+        with open(output_abs, "w") as f_out:
+            for part in parts:
+                with open(part) as f_in:
+                    shutil.copyfileobj(f_in, f_out)
+
+
+def from_merged(merged: str, output: str) -> int:
+    """
+    merge_jsonの出力からmerge_json.iter_papersと同じ順で訓練データを作る。書いた行数を返す。
+    """
     output_abs = os.path.abspath(output)
-    with open(output_abs, "w") as f_out:
-        for input_ in inputs:
-            input_abs = os.path.abspath(input_)
-            for obj in json.load(open(input_abs)):
-                f_out.write(fix_needless_new_line(obj["summary"]) + "\n")
+    source = {"train_data": os.path.abspath(merged), "stamp": metadata.source_stamp(merged)}
+    count = write_atomically(output_abs, (paper["summary"] for paper in merge_json.iter_papers(merged)))
+    write_atomically(source_path(output_abs), [json.dumps(source)])
+    return count
+
+
+def source_path(output: str) -> str:
+    return f"{output}.source.json"
+
+
+def load_source(output: str) -> Optional[dict]:
+    """
+    from_mergedで作った訓練データなら、作成元のmerge_jsonの出力(train_data)とその状態(stamp)を返す。
+    """
+    if not os.path.exists(source_path(output)):
+        return None
+    with open(source_path(output)) as f:
+        return json.load(f)
+
+
+def _summaries(input_: str, output: str) -> int:
+    return write_atomically(output, (fix_needless_new_line(obj["summary"]) for obj in iter_json_array(input_)))
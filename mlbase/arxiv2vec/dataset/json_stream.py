@@ -0,0 +1,86 @@
+"""
+JSONの配列をファイル全体を読み込まずに要素ごとに読む。
+"""
+import json
+from typing import Any, Iterator
+
+_DECODER = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+_DELIMITERS = _WHITESPACE + ",]"
+
+
+def iter_json_array(path: str, chunk_size: int = 1 << 16) -> Iterator[Any]:
+    """
+    ファイルのトップレベルの配列の要素を順に返す。メモリに持つのは読み込み途中の要素1つとチャンク1つ分だけ。
+    >>> import io, tempfile
+    >>> with tempfile.NamedTemporaryFile("w", suffix=".json") as f:
+    ...     _ = f.write('[{"id": 1}, {"id": "a,]"} ,3.5]')
+    ...     f.flush()
+    ...     list(iter_json_array(f.name, chunk_size=4))
+    [{'id': 1}, {'id': 'a,]'}, 3.5]
+    """
+    with open(path) as f:
+        reader = _Reader(f, chunk_size)
+        reader.expect("[")
+        if reader.peek() == "]":
+            reader.expect("]")
+        else:
+            while True:
+                yield reader.value()
+                if reader.peek() == "]":
+                    reader.expect("]")
+                    break
+                reader.expect(",")
+        if reader.peek() != "":
+            raise ValueError(f"{path}: 配列の後に余分なデータがあります。")
+
+
+class _Reader:
+    def __init__(self, f, chunk_size: int) -> None:
+        self.__f = f
+        self.__chunk_size = chunk_size
+        self.__buffer = ""
+        self.__pos = 0
+        self.__eof = False
+
+    def __fill(self) -> bool:
+        if self.__eof:
+            return False
+        chunk = self.__f.read(self.__chunk_size)
+        if not chunk:
+            self.__eof = True
+            return False
+        self.__buffer = self.__buffer[self.__pos:] + chunk
+        self.__pos = 0
+        return True
+
+    def peek(self) -> str:
+        """
+        空白を読み飛ばし、次の文字を返す。ファイルの終わりなら空文字列。
+        """
+        while True:
+            while self.__pos < len(self.__buffer) and self.__buffer[self.__pos] in _WHITESPACE:
+                self.__pos += 1
+            if self.__pos < len(self.__buffer) or not self.__fill():
+                return self.__buffer[self.__pos:self.__pos + 1]
+
+    def expect(self, c: str):
+        found = self.peek()
+        if found != c:
+            raise ValueError(f"{c!r}が必要な位置に{found!r}があります。")
+        self.__pos += 1
+
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                obj, end = _DECODER.raw_decode(self.__buffer, self.__pos)
+            except json.JSONDecodeError:
+                if self.__fill():
+                    continue
+                raise
+            # 数値はチャンクの境界で途切れていても途中まで読めてしまうので、区切りが見えるまで読んでから確定する
+            if (end == len(self.__buffer) or self.__buffer[end] not in _DELIMITERS) and self.__fill():
+                continue
+            self.__pos = end
+            return obj
@@ -1,17 +1,214 @@
+"""
+論文のJSONファイルを統合する。
+
+出力はディレクトリで、入力ファイルごとにpart-00000.jsonlのような1行1論文のJSONLを置く。
+シャードの番号順に読めば入力の順に並ぶ。
+
+incrementalを指定した場合は、出力ディレクトリのindex.sqliteに統合済みの入力ファイルと論文を記録し、
+大きさと更新時刻が変わった入力ファイルだけを読み、新しいか内容が変わった論文だけを新しいシャードに追記する。
+索引は文書番号ごとの論文のidと、idごとの最新の行の位置を持つ。
+新しい論文は末尾の文書番号になり、内容が変わった論文は元の文書番号のまま最新の行を読む。
+そのため追記しても既存の論文の文書番号は変わらない(同じidの古い行はシャードに残る)。
+
+重複を除くと入力の論文と順番や件数が変わるので、Doc2Vecの訓練データはjson_arxiv.from_merged
+(arxiv2vec dataset json_arxiv --merged)でこの出力から作り、文書番号をiter_papersの順に揃える。
+"""
+import hashlib
 import json
 import os
+import sqlite3
+import tempfile
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
 
+from mlbase.logger import info
+
+from mlbase.arxiv2vec.dataset.json_stream import iter_json_array
+from mlbase.arxiv2vec.dataset.parallel import map_files, write_atomically
 from mlbase.arxiv2vec.dataset.utils import fix_needless_new_line
 
 
-def run(inputs: str, output: str):
-    output_abs = os.path.abspath(output)
-    data: list = []
-    for input_ in inputs:
-        input_abs = os.path.abspath(input_)
-        data += json.load(open(input_abs))
-    for i, data_per_paper in enumerate(data):
-        data[i]["summary"] = fix_needless_new_line(data[i]["summary"])
+INDEX_NAME = "index.sqlite"
+
+
+def run(inputs: str, output: str, jobs: int = 1, incremental: bool = False):
+    if incremental:
+        return run_incremental(inputs, output, jobs=jobs)
+
+    output_path = Path(output).absolute()
+    output_path.mkdir(parents=True, exist_ok=True)
+    for old in [*output_path.glob("part-*.jsonl"), output_path / INDEX_NAME]:
+        if old.exists():
+            old.unlink()
+    shards = [str(output_path / shard_name(i)) for i in range(len(inputs))]
+    map_files(_merge_file, zip(map(os.path.abspath, inputs), shards), jobs)
+
+
+def shard_name(i: int) -> str:
+    return f"part-{i:05d}.jsonl"
+
+
+def _merge_file(input_: str, output: str) -> int:
+    return write_atomically(output, (json.dumps(fix_paper(obj)) for obj in iter_json_array(input_)))
+
+
+def fix_paper(obj: dict) -> dict:
+    obj["summary"] = fix_needless_new_line(obj["summary"])
+    return obj
+
+
+def paper_hash(obj: dict) -> str:
+    return hashlib.sha1(json.dumps(obj, sort_keys=True).encode()).hexdigest()
+
+
+class MergeIndex:
+    """
+    統合済みの入力ファイルと論文の索引
+    """
+
+    def __init__(self, path) -> None:
+        self.__conn = sqlite3.connect(str(path))
+        self.__conn.executescript("""
+            CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER);
+            CREATE TABLE IF NOT EXISTS papers (id TEXT PRIMARY KEY, hash TEXT, shard TEXT, offset INTEGER);
+            CREATE TABLE IF NOT EXISTS docs (doc INTEGER PRIMARY KEY, id TEXT);
+        """)
+
+    def is_merged(self, path: str) -> bool:
+        stat = os.stat(path)
+        row = self.__conn.execute("SELECT size, mtime_ns FROM files WHERE path = ?", (path, )).fetchone()
+        return row == (stat.st_size, stat.st_mtime_ns)
+
+    def mark_merged(self, path: str):
+        stat = os.stat(path)
+        self.__conn.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?)", (path, stat.st_size, stat.st_mtime_ns))
+
+    def hash_of(self, paper_id: str) -> Optional[str]:
+        row = self.__conn.execute("SELECT hash FROM papers WHERE id = ?", (paper_id, )).fetchone()
+        return row and row[0]
+
+    def put(self, paper_id: str, hash_: str, shard: str, offset: int, new_doc: bool):
+        """
+        論文の最新の行の位置を記録する。new_docなら末尾の文書番号に割り当てる。
+        """
+        self.__conn.execute("INSERT OR REPLACE INTO papers VALUES (?, ?, ?, ?)", (paper_id, hash_, shard, offset))
+        if new_doc:
+            # docはINTEGER PRIMARY KEYなので、省略すると最大値+1が振られる
+            self.__conn.execute("INSERT INTO docs (id) VALUES (?)", (paper_id, ))
+
+    def locations(self) -> Iterator[Tuple[str, int]]:
+        """
+        文書番号の順に、最新の行の(シャード, バイト位置)を返す。
+        """
+        yield from self.__conn.execute(
+            "SELECT papers.shard, papers.offset FROM docs JOIN papers ON docs.id = papers.id ORDER BY docs.doc"
+        )
+
+    def commit(self):
+        self.__conn.commit()
+
+    def close(self):
+        self.__conn.close()
+
+
+def run_incremental(inputs: List[str], output: str, jobs: int = 1) -> Dict[str, int]:
+    """
+    変更のあった入力ファイルの、新しいか内容の変わった論文だけを新しいシャードに追記する。
+    Returns:
+        読んだファイル数、追記した論文数、読み飛ばした論文数
+    """
+    output_path = Path(output).absolute()
+    output_path.mkdir(parents=True, exist_ok=True)
+    new_index = not (output_path / INDEX_NAME).exists()
+    index = MergeIndex(output_path / INDEX_NAME)
+    stats = {"files": 0, "appended": 0, "skipped": 0}
+    try:
+        if new_index:
+            _import_shards(index, output_path)
+        changed = [path for path in dict.fromkeys(map(os.path.abspath, inputs)) if not index.is_merged(path)]
+        if not changed:
+            info("更新された入力ファイルはありません。")
+            return stats
+
+        with tempfile.TemporaryDirectory(dir=output_path) as tmp:
+            fixed = [os.path.join(tmp, f"{i:05d}.jsonl") for i in range(len(changed))]
+            map_files(_merge_file, zip(changed, fixed), jobs)
+
+            shards = sorted(output_path.glob("part-*.jsonl"))
+            shard = shard_name(int(shards[-1].name[5:10]) + 1 if shards else 0)
+            offset = 0
+            with open(os.path.join(tmp, shard), "wb") as f_out:
+                for path in fixed:
+                    with open(path, "rb") as f_in:
+                        for line in f_in:
+                            obj = json.loads(line)
+                            hash_ = paper_hash(obj)
+                            old_hash = index.hash_of(obj["id"])
+                            if old_hash == hash_:
+                                stats["skipped"] += 1
+                                continue
+                            f_out.write(line)
+                            index.put(obj["id"], hash_, shard, offset, new_doc=old_hash is None)
+                            offset += len(line)
+                            stats["appended"] += 1
+            stats["files"] = len(changed)
+            if stats["appended"]:
+                os.replace(os.path.join(tmp, shard), output_path / shard)
+            # シャードを置いてから索引を確定するので、途中で落ちても次回に同じファイルを読み直す
+            for path in changed:
+                index.mark_merged(path)
+            index.commit()
+        info(f"{stats['files']}ファイルから{stats['appended']}件を追記、{stats['skipped']}件は統合済みでした。")
+        return stats
+    finally:
+        index.close()
+
+
+def _import_shards(index: MergeIndex, output_path: Path):
+    """
+    索引の無いディレクトリ(全体を統合したもの)の既存のシャードを索引に登録する。
+    文書番号は1行ずつ割り当てるので、同じidが複数あってもiter_papersの件数と順番は統合時のまま変わらない
+    (どの行も同じidの最後の内容を読む)。
+    入力ファイルは登録しないので、次の統合で読み直し、同じ内容の論文は読み飛ばす。
+    """
+    shards = sorted(output_path.glob("part-*.jsonl"))
+    for shard in shards:
+        offset = 0
+        with open(shard, "rb") as f:
+            for line in f:
+                obj = json.loads(line)
+                index.put(obj["id"], paper_hash(obj), shard.name, offset, new_doc=True)
+                offset += len(line)
+    index.commit()
+    if shards:
+        info(f"既存の{len(shards)}シャードを索引に登録しました。")
+
+
+def iter_papers(path: str) -> Iterator[dict]:
+    """
+    runの出力を文書番号の順に読む。以前の形式(1つのJSONの配列)のファイルも読める。
+    incrementalで統合したものは、各論文を最初に統合したときの位置に、最後に追記した内容で返す。
+    """
+    if not os.path.isdir(path):
+        yield from iter_json_array(path)
+        return
+    if not (Path(path) / INDEX_NAME).exists():
+        for shard in sorted(Path(path).glob("part-*.jsonl")):
+            with open(shard) as f:
+                for line in f:
+                    yield json.loads(line)
+        return
 
-    with open(output_abs, "w") as f_out:
-        json.dump(data, f_out)
+    index = MergeIndex(Path(path) / INDEX_NAME)
+    files: Dict[str, BinaryIO] = {}
+    try:
+        for shard, offset in index.locations():
+            if shard not in files:
+                files[shard] = open(Path(path) / shard, "rb")
+            f = files[shard]
+            f.seek(offset)
+            yield json.loads(f.readline())
+    finally:
+        for f in files.values():
+            f.close()
+        index.close()
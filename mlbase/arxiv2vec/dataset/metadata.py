@@ -0,0 +1,134 @@
+"""
+近傍の表示に使う論文のメタデータを、文書番号で直接読めるように保存する。
+
+/path/to/store/metadata.jsonl: 1行1論文のJSON(id, title, summaryのみ)
+/path/to/store/offsets.npy: i番目の論文がmetadata.jsonlの[offsets[i], offsets[i + 1])にあるint64の配列
+/path/to/store/meta.json: 作成元のファイルの大きさと更新時刻。変わっていれば作り直す
+"""
+import json
+import os
+import shutil
+from array import array
+from pathlib import Path
+from typing import Iterable, List, Optional, Sequence
+
+from mlbase.lazy import numpy as np
+from mlbase.logger import info, error
+from mlbase.arxiv2vec.dataset import merge_json
+
+FIELDS = ("id", "title", "summary")
+_META = "meta.json"
+_FORMAT = "mlbase.arxiv2vec_metadata"
+_VERSION = 1
+
+
+def default_store_path(train_data: str) -> Path:
+    """
+    merge_jsonの出力ディレクトリならその中に、ファイルならその隣に置く。
+    """
+    if os.path.isdir(train_data):
+        return Path(train_data) / "metadata"
+    return Path(f"{train_data}.metadata")
+
+
+def source_stamp(train_data: str) -> List[list]:
+    if os.path.isdir(train_data):
+        paths = sorted(Path(train_data).glob("part-*.jsonl")) + [Path(train_data) / merge_json.INDEX_NAME]
+    else:
+        paths = [Path(train_data)]
+    return [[path.name, path.stat().st_size, path.stat().st_mtime_ns] for path in paths if path.exists()]
+
+
+def build_metadata_store(papers: Iterable[dict], path, stamp=None, fields: Sequence[str] = FIELDS):
+    """
+    Args:
+        papers: 文書番号の順の論文
+        path: 出力ディレクトリ
+        stamp: meta.jsonに記録する作成元の情報
+        fields: 残す項目
+    """
+    path = Path(path)
+    tmp = path.parent / f".{path.name}.tmp{os.getpid()}"
+    if tmp.exists():
+        shutil.rmtree(tmp)
+    tmp.mkdir(parents=True)
+
+    offsets = array("q", [0])
+    with open(tmp / "metadata.jsonl", "wb") as f:
+        for paper in papers:
+            line = json.dumps({key: paper.get(key) for key in fields}, ensure_ascii=False).encode() + b"\n"
+            f.write(line)
+            offsets.append(offsets[-1] + len(line))
+    np.save(tmp / "offsets.npy", np.frombuffer(offsets, dtype=np.int64))
+    with open(tmp / _META, "w") as f:
+        json.dump({"format": _FORMAT, "version": _VERSION, "fields": list(fields), "source": stamp}, f, indent=2)
+
+    if path.exists():
+        shutil.rmtree(path)
+    os.rename(tmp, path)
+
+
+class MetadataStore:
+    """
+    i番目の論文をインデックスから位置を求めて1回の読み込みで取り出す。
+    """
+
+    def __init__(self, path) -> None:
+        path = Path(path)
+        with open(path / _META) as f:
+            self.meta = json.load(f)
+        if self.meta.get("format") != _FORMAT:
+            raise Exception(f"{path}は{_FORMAT}の形式ではありません。")
+        self.__offsets = np.load(path / "offsets.npy", mmap_mode="r")
+        self.__fd = os.open(path / "metadata.jsonl", os.O_RDONLY)
+
+    def __len__(self):
+        return len(self.__offsets) - 1
+
+    def __getitem__(self, i: int) -> dict:
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        head, tail = int(self.__offsets[i]), int(self.__offsets[i + 1])
+        return json.loads(os.pread(self.__fd, tail - head, head))
+
+    def take(self, ids: Iterable[int]) -> List[dict]:
+        return [self[i] for i in ids]
+
+    def close(self):
+        if self.__fd is not None:
+            os.close(self.__fd)
+            self.__fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+def open_metadata_store(train_data: str, expected_stamp: Optional[list] = None) -> MetadataStore:
+    """
+    train_dataのメタデータを開く。無いか、train_dataが更新されていれば作り直す。
+    Args:
+        expected_stamp: モデルの訓練時のtrain_dataのsource_stamp。
+            現在と異なれば文書番号がモデルとずれている可能性があるので警告する。
+            訓練時のメタデータが残っていれば、作り直さずにそれを使う。
+    """
+    path = default_store_path(train_data)
+    stamp = source_stamp(train_data)
+    wanted = stamp if expected_stamp is None else expected_stamp
+    if (path / _META).exists():
+        store = MetadataStore(path)
+        if store.meta["source"] == wanted:
+            if wanted != stamp:
+                error(f"{train_data}はモデルの訓練後に更新されています。訓練時のメタデータ({path})を使います。")
+            return store
+        store.close()
+    if wanted != stamp:
+        error(
+            f"{train_data}はモデルの訓練後に更新されていて、訓練時のメタデータがありません。"
+            "現在の内容で作り直すので、表示する論文が文書番号とずれている可能性があります。"
+        )
+    info(f"メタデータを作成します: {path}")
+    build_metadata_store(merge_json.iter_papers(train_data), path, stamp=stamp)
+    return MetadataStore(path)
@@ -0,0 +1,35 @@
+"""
+入力ファイルごとの処理をプロセスプールで並列に行う。
+"""
+import multiprocessing
+import os
+from typing import Callable, Iterable, List, Tuple
+
+
+def map_files(fn: Callable[[str, str], int], jobs: Iterable[Tuple[str, str]], processes: int = 1) -> List[int]:
+    """
+    (入力, 出力)の組ごとにfnを実行する。fnは出力を書き終えて件数を返す。
+    Args:
+        fn: モジュールのトップレベルの関数(プロセスに渡すため)
+        jobs: (入力, 出力)の列
+        processes(int): プロセス数。1以下なら同じプロセスで実行する
+    """
+    jobs = list(jobs)
+    if processes <= 1 or len(jobs) <= 1:
+        return [fn(input_, output) for input_, output in jobs]
+    with multiprocessing.Pool(min(processes, len(jobs))) as pool:
+        return pool.starmap(fn, jobs, chunksize=1)
+
+
+def write_atomically(path: str, lines: Iterable[str]) -> int:
+    """
+    一時ファイルに書いてから名前を変える。書いた行数を返す。
+    """
+    tmp = f"{path}.tmp{os.getpid()}"
+    count = 0
+    with open(tmp, "w") as f:
+        for line in lines:
+            f.write(line + "\n")
+            count += 1
+    os.replace(tmp, path)
+    return count
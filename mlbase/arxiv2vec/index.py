@@ -0,0 +1,227 @@
+"""
+文書ベクトルの近傍探索の索引。コサイン類似度の大きい順に返す。
+
+- exact: 全件とのブロックごとの行列積による厳密な探索
+- ivf: 球面k-meansでベクトルをクラスタに分け、質問に近いnprobe個のクラスタだけを調べる近似探索
+
+保存先のディレクトリにはmanifest.jsonと配列ごとの.npyを置き、読み込み時はmmapする。
+"""
+import json
+import os
+import shutil
+from abc import ABCMeta, abstractmethod
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+from mlbase.lazy import numpy as np
+
+_MANIFEST = "manifest.json"
+_FORMAT = "mlbase.vector_index"
+_VERSION = 1
+
+index_type: Dict[str, type] = {}
+
+
+def by_index_name(name: str) -> Callable[[type], type]:
+    def _register(cls):
+        assert name not in index_type
+        index_type[name] = cls
+        cls.name = name
+        return cls
+
+    return _register
+
+
+def normalize(vectors: "np.ndarray") -> "np.ndarray":
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norm = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norm, 1e-12)
+
+
+def _top_k(scores: "np.ndarray", k: int) -> "np.ndarray":
+    """
+    各行の値の大きい順にk個の列番号
+    """
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return np.zeros([scores.shape[0], 0], dtype=np.int64)
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, part, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(part, order, axis=1)
+
+
+class VectorIndex(metaclass=ABCMeta):
+    def __init__(self, arrays: Dict[str, "np.ndarray"], params: dict) -> None:
+        self.arrays = arrays
+        self.params = params
+
+    @classmethod
+    @abstractmethod
+    def build(cls, vectors: "np.ndarray", **params) -> "VectorIndex":
+        """
+        [文書数, 次元]のベクトルから索引を作る。
+        """
+        pass
+
+    @abstractmethod
+    def __len__(self):
+        pass
+
+    @abstractmethod
+    def search(self, queries: "np.ndarray", k: int = 10) -> Tuple["np.ndarray", "np.ndarray"]:
+        """
+        Args:
+            queries: [質問数, 次元]
+            k(int): 返す件数
+        Returns:
+            文書の番号とコサイン類似度。どちらも[質問数, k]
+        """
+        pass
+
+    def save(self, path):
+        """
+        一時ディレクトリに書き出してから名前を変える。
+        """
+        path = Path(path)
+        tmp = path.parent / f".{path.name}.tmp{os.getpid()}"
+        if tmp.exists():
+            shutil.rmtree(tmp)
+        tmp.mkdir(parents=True)
+        for key, array in self.arrays.items():
+            np.save(tmp / f"{key}.npy", array, allow_pickle=False)
+        manifest = {
+            "format": _FORMAT,
+            "version": _VERSION,
+            "type": self.name,
+            "params": self.params,
+            "arrays": sorted(self.arrays),
+        }
+        with open(tmp / _MANIFEST, "w") as f:
+            json.dump(manifest, f, indent=2)
+        if path.exists():
+            shutil.rmtree(path)
+        os.rename(tmp, path)
+
+
+@by_index_name("exact")
+class ExactIndex(VectorIndex):
+    @classmethod
+    def build(cls, vectors: "np.ndarray", block_size: int = 65536) -> "ExactIndex":
+        return cls({"vectors": normalize(vectors)}, {"block_size": block_size})
+
+    def __len__(self):
+        return len(self.arrays["vectors"])
+
+    def search(self, queries, k=10):
+        queries = normalize(np.atleast_2d(queries))
+        vectors = self.arrays["vectors"]
+        block_size = self.params["block_size"]
+        best_ids = np.zeros([len(queries), 0], dtype=np.int64)
+        best_scores = np.zeros([len(queries), 0], dtype=np.float32)
+        for head in range(0, len(vectors), block_size):
+            scores = queries @ vectors[head:head + block_size].T
+            top = _top_k(scores, k)
+            ids = np.concatenate([best_ids, top + head], axis=1)
+            scores = np.concatenate([best_scores, np.take_along_axis(scores, top, axis=1)], axis=1)
+            top = _top_k(scores, k)
+            best_ids = np.take_along_axis(ids, top, axis=1)
+            best_scores = np.take_along_axis(scores, top, axis=1)
+        return best_ids, best_scores
+
+
+def spherical_kmeans(vectors: "np.ndarray", n_clusters: int, iterations: int = 10, seed: int = 0,
+                     block_size: int = 65536) -> "np.ndarray":
+    """
+    正規化済みのベクトルを内積で割り当てるk-means。中心も正規化する。
+    """
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assign = _assign(vectors, centroids, block_size)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, vectors)
+        empty = np.bincount(assign, minlength=n_clusters) == 0
+        # 空のクラスタは適当なベクトルで置き直す
+        sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()), replace=False)]
+        centroids = normalize(sums)
+    return centroids
+
+
+def _assign(vectors, centroids, block_size):
+    return np.concatenate([
+        np.argmax(vectors[head:head + block_size] @ centroids.T, axis=1)
+        for head in range(0, len(vectors), block_size)
+    ])
+
+
+@by_index_name("ivf")
+class IVFIndex(VectorIndex):
+    @classmethod
+    def build(cls, vectors: "np.ndarray", nlist: Optional[int] = None, nprobe: int = 8, train_size: int = 256,
+              iterations: int = 10, seed: int = 0) -> "IVFIndex":
+        """
+        Args:
+            vectors: [文書数, 次元]
+            nlist(int): クラスタ数。省略時は4√文書数
+            nprobe(int): 探索時に調べるクラスタ数
+            train_size(int): k-meansに使うクラスタあたりのベクトル数
+            iterations(int): k-meansの反復回数
+            seed(int): 乱数のシード
+        """
+        vectors = normalize(vectors)
+        nlist = min(nlist or int(4 * np.sqrt(len(vectors))) or 1, len(vectors))
+        rng = np.random.default_rng(seed)
+        sample = vectors[rng.choice(len(vectors), min(len(vectors), nlist * train_size), replace=False)]
+        centroids = spherical_kmeans(sample, nlist, iterations=iterations, seed=seed)
+        assign = _assign(vectors, centroids, 65536)
+        ids = np.argsort(assign, kind="stable")
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=nlist))]).astype(np.int64)
+        arrays = {"centroids": centroids, "ids": ids.astype(np.int64), "vectors": vectors[ids], "offsets": offsets}
+        return cls(arrays, {"nlist": nlist, "nprobe": nprobe})
+
+    def __len__(self):
+        return len(self.arrays["ids"])
+
+    def search(self, queries, k=10, nprobe: Optional[int] = None):
+        queries = normalize(np.atleast_2d(queries))
+        nprobe = min(nprobe or self.params["nprobe"], self.params["nlist"])
+        centroids, ids, vectors, offsets = (self.arrays[key] for key in ["centroids", "ids", "vectors", "offsets"])
+        probes = _top_k(queries @ centroids.T, nprobe)
+
+        result_ids = np.full([len(queries), k], -1, dtype=np.int64)
+        result_scores = np.full([len(queries), k], -np.inf, dtype=np.float32)
+        for i, query in enumerate(queries):
+            ranges = [(offsets[p], offsets[p + 1]) for p in probes[i]]
+            candidates = np.concatenate([np.arange(head, tail) for head, tail in ranges])
+            if len(candidates) == 0:
+                continue
+            scores = np.concatenate([vectors[head:tail] @ query for head, tail in ranges])
+            top = _top_k(scores[None], k)[0]
+            result_ids[i, :len(top)] = ids[candidates[top]]
+            result_scores[i, :len(top)] = scores[top]
+        return result_ids, result_scores
+
+
+def build_index(vectors: "np.ndarray", name: str = "exact", **params) -> VectorIndex:
+    if name not in index_type:
+        raise NotImplementedError(name)
+    return index_type[name].build(vectors, **params)
+
+
+def load_index(path, mmap_mode: Optional[str] = "r") -> VectorIndex:
+    path = Path(path)
+    with open(path / _MANIFEST) as f:
+        manifest = json.load(f)
+    if manifest.get("format") != _FORMAT:
+        raise Exception(f"{path}は{_FORMAT}の形式ではありません。")
+    arrays = {key: np.load(path / f"{key}.npy", mmap_mode=mmap_mode) for key in manifest["arrays"]}
+    return index_type[manifest["type"]](arrays, manifest["params"])
+
+
+def index_path(model_path: str) -> Path:
+    """
+    モデルの隣に置く索引のパス。ディレクトリ形式のモデルならその中に置く。
+    """
+    if os.path.isdir(model_path):
+        return Path(model_path) / "index"
+    return Path(f"{model_path}.index")
@@ -1,7 +1,21 @@
+import json
+import os
 import pickle
-from typing import Iterator
+import shutil
+from pathlib import Path
+from typing import Iterable, List, Optional
 
 from mlbase.lazy import gensim
+from mlbase.logger import error
+from mlbase.arxiv2vec.corpus import TaggedCorpus
+from mlbase.arxiv2vec.index import index_path, load_index
+from mlbase.arxiv2vec.preprocess import preprocessor_manifest, preprocessor_from_manifest
+from mlbase.arxiv2vec.preprocess.parallel import ParallelPreprocessor
+
+_MANIFEST = "manifest.json"
+_FORMAT = "mlbase.arxiv2vec_model"
+_VERSION = 1
+_GENSIM_MODEL = "doc2vec.model"
 
 
 def get_doc2vec(*args, **kwargs):
@@ -13,34 +27,147 @@ def get_tagged_document(*args, **kwargs):
 
 
 class Doc2VecModel:
+    # 近傍探索の索引。loadでモデルの隣に索引があれば設定する
+    __index = None
+    # 訓練データの作成元(json_arxiv.load_source)。find_neighborsで作成元の更新を確認する
+    train_source: Optional[dict] = None
+
     def __init__(self, preprocessor):
         self.__preprocessor = preprocessor
         self.__model = None
 
-    def train(self, train_docs: Iterator[str]):
-        train_corpus = [
-            get_tagged_document(self.__preprocessor.preprocess(txt),
-                                [i]) for i, txt in enumerate(train_docs)
-        ]
+    def train(self, train_docs: Iterable[str], jobs: int = 1):
+        # gensimのスレッドが動き出す前にプロセスプールを作るため、訓練の間はプールを使い回す
+        with ParallelPreprocessor(self.__preprocessor, jobs) as preprocessor:
+            self.train_corpus(TaggedCorpus(train_docs, preprocessor))
+
+    def train_corpus(self, train_corpus):
+        """
+        前処理済みのTaggedDocumentの列で訓練する。
+        """
         model = get_doc2vec(vector_size=50)
         model.build_vocab(train_corpus)
         model.train(train_corpus, total_examples=model.corpus_count, epochs=500)
         self.__model = model
 
-    def save(self, path: str):
-        # ディレクトリ作成
-        pickle.dump(self, open(path, "wb"))
+    def save(self, path: str, save_format: str = "pickle"):
+        """
+        Args:
+            path: 出力先
+            save_format: "pickle"なら全体を1ファイルに、"dir"ならsave_dirの形式で保存する
+        """
+        if save_format == "dir":
+            self.save_dir(path)
+        elif save_format == "pickle":
+            pickle.dump(self, open(path, "wb"))
+            # 以前のモデルの索引が残っていると、別の文書番号を返してしまう
+            if index_path(path).exists():
+                shutil.rmtree(index_path(path))
+        else:
+            raise NotImplementedError(save_format)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop("_Doc2VecModel__index", None)
+        return state
+
+    def save_dir(self, path: str):
+        """
+        gensimの形式で保存し、配列はすべて別の.npyにする。前処理はマニフェストに名前と設定を書く。
+        load_dirでmmapで読めるので、読み込みが速く、複数の推論プロセスでページキャッシュを共有できる。
+        """
+        path = Path(path)
+        tmp = path.parent / f".{path.name}.tmp{os.getpid()}"
+        if tmp.exists():
+            shutil.rmtree(tmp)
+        tmp.mkdir(parents=True)
+
+        self.__model.save(str(tmp / _GENSIM_MODEL), sep_limit=0)
+        manifest = {
+            "format": _FORMAT,
+            "version": _VERSION,
+            "model": "doc2vec",
+            "gensim_model": _GENSIM_MODEL,
+            "preprocessor": preprocessor_manifest(self.__preprocessor),
+            "train_source": self.train_source,
+        }
+        with open(tmp / _MANIFEST, "w") as f:
+            json.dump(manifest, f, indent=2)
+
+        if path.exists():
+            shutil.rmtree(path)
+        os.rename(tmp, path)
+
+    @classmethod
+    def load_dir(cls, path: str, mmap: str = "r") -> "Doc2VecModel":
+        path = Path(path)
+        with open(path / _MANIFEST) as f:
+            manifest = json.load(f)
+        if manifest.get("format") != _FORMAT:
+            raise Exception(f"{path}は{_FORMAT}の形式ではありません。")
+
+        model = cls(preprocessor_from_manifest(manifest["preprocessor"]))
+        model.__model = gensim.models.Doc2Vec.load(str(path / manifest["gensim_model"]), mmap=mmap)
+        model.train_source = manifest.get("train_source")
+        return model
 
     def infer_vector(self, text: str):
         input_ = self.__preprocessor.preprocess(text)
         return self.__model.infer_vector(input_, steps=50)
 
-    def find_neighbors(self, vec):
-        return self.__model.docvecs.most_similar([vec])
+    def infer_vectors(self, texts: Iterable[str], jobs: int = 1) -> List:
+        """
+        複数の文章の前処理をjobsプロセスで行い、入力と同じ順でベクトルを返す。
+        """
+        with ParallelPreprocessor(self.__preprocessor, jobs) as preprocessor:
+            return [self.__model.infer_vector(words, steps=50) for words in preprocessor.preprocess_lines(texts)]
+
+    def doc_vectors(self):
+        """
+        訓練文書のベクトル。i行目が通し番号iの文書
+        """
+        return self.__model.docvecs.vectors_docs
+
+    def attach_index(self, index):
+        self.__index = index
+
+    def find_neighbors(self, vec, k: int = 10):
+        """
+        索引があればそれを、なければgensimの全件探索を使い、(文書番号, コサイン類似度)を近い順にk個返す。
+        """
+        if self.__index is None:
+            return self.__model.docvecs.most_similar([vec], topn=k)
+        ids, scores = self.__index.search(vec, k)
+        return [(int(i), float(score)) for i, score in zip(ids[0], scores[0]) if i >= 0]
 
 
 def load(path: str):
-    return pickle.load(open(path, "rb"))
+    """
+    ディレクトリならsave_dirの形式、ファイルならpickleとして読み込む。
+    build_indexで作った索引がモデルの隣にあれば、近傍探索に使う。
+    """
+    if os.path.isdir(path):
+        model = Doc2VecModel.load_dir(path)
+    else:
+        model = pickle.load(open(path, "rb"))
+    attach_index_if_valid(model, index_path(path))
+    return model
+
+
+def attach_index_if_valid(model, path) -> bool:
+    """
+    索引があり、文書数がモデルと一致すればモデルに設定する。
+    一致しなければ別のモデルのものなので、警告を出して使わない。
+    """
+    if not Path(path).exists():
+        return False
+    index = load_index(path)
+    count = len(model.doc_vectors())
+    if len(index) != count:
+        error(f"{path}の文書数({len(index)})がモデル({count})と異なるので使いません。build_indexで作り直してください。")
+        return False
+    model.attach_index(index)
+    return True
 
 
 def infer(model, document):
@@ -1,5 +1,5 @@
 from abc import ABCMeta, abstractmethod
-from typing import List, Iterator
+from typing import Dict, List, Iterator, Iterable, Optional
 
 from mlbase.lazy import gensim
 from mlbase.arxiv2vec.preprocess.tex_doc import split_tex_doc
@@ -14,7 +14,52 @@ class AbsPreprocessor(metaclass=ABCMeta):
     def preprocess(self, line: str) -> List[str]:
         pass
 
+    def settings(self) -> dict:
+        """
+        前処理の結果を左右する設定。コンストラクタのキーワード引数と一致させる。
+        前処理済みコーパスのキャッシュの区別と、保存したモデルからの復元に使う。
+        """
+        return {}
 
+    def preprocess_lines(self, lines: Iterable[str]) -> Iterator[List[str]]:
+        """
+        行ごとに前処理した結果を入力と同じ順で返す。
+        """
+        return map(self.preprocess, lines)
+
+
+preprocessor_type: Dict[str, type] = {}
+
+
+def register_preprocessor(name: str):
+    """
+    前処理のクラスを名前で登録する。名前はtrainコマンドの--preprocessとモデルのマニフェストで使う。
+    """
+
+    def _register(cls):
+        assert name not in preprocessor_type
+        preprocessor_type[name] = cls
+        cls.name = name
+        return cls
+
+    return _register
+
+
+def get_preprocessor(name: str, settings: Optional[dict] = None) -> AbsPreprocessor:
+    if name not in preprocessor_type:
+        raise NotImplementedError(name)
+    return preprocessor_type[name](**(settings or {}))
+
+
+def preprocessor_manifest(preprocessor: AbsPreprocessor) -> dict:
+    return {"name": preprocessor.name, "settings": preprocessor.settings()}
+
+
+def preprocessor_from_manifest(manifest: dict) -> AbsPreprocessor:
+    return get_preprocessor(manifest["name"], manifest["settings"])
+
+
+@register_preprocessor("simple")
 class SimplePreprocessor(AbsPreprocessor):
     def __init__(self, deacc: bool = False, min_len: int = 2, max_len: int = 15) -> None:
         self.__deacc = deacc
@@ -22,9 +67,13 @@ class SimplePreprocessor(AbsPreprocessor):
         self.__max_len = max_len
 
     def preprocess(self, line: str) -> List[str]:
-        return simple_preprocess(deacc=self.__deacc, min_len=self.__min_len, max_len=self.__max_len)
+        return simple_preprocess(line, deacc=self.__deacc, min_len=self.__min_len, max_len=self.__max_len)
+
+    def settings(self) -> dict:
+        return {"deacc": self.__deacc, "min_len": self.__min_len, "max_len": self.__max_len}
 
 
+@register_preprocessor("tex")
 class TeXMixedTextPreprocessor(AbsPreprocessor):
     """
     $で囲まれた範囲を一つの単語とみなす
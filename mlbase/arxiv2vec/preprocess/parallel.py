@@ -0,0 +1,81 @@
+"""
+前処理を複数プロセスで行う。
+"""
+import itertools as it
+import multiprocessing
+from collections import deque
+from typing import Iterable, Iterator, List, Optional
+
+from mlbase.arxiv2vec.preprocess import AbsPreprocessor
+
+_WORKER_PREPROCESSOR: Optional[AbsPreprocessor] = None
+
+
+def _init_worker(preprocessor: AbsPreprocessor):
+    global _WORKER_PREPROCESSOR
+    _WORKER_PREPROCESSOR = preprocessor
+
+
+def _preprocess_chunk(lines: List[str]) -> List[List[str]]:
+    return [_WORKER_PREPROCESSOR.preprocess(line) for line in lines]
+
+
+class ParallelPreprocessor(AbsPreprocessor):
+    """
+    行をchunksize行ずつまとめてプロセスプールに渡し、入力と同じ順で結果を返す。
+    投入済みのチャンク数に上限があるので、入力全体をメモリに持たない。
+    プールは最初に使うときに作り、closeするまで使い回す。
+    """
+
+    def __init__(self, preprocessor: AbsPreprocessor, jobs: int = 1, chunksize: int = 256,
+                 max_pending: Optional[int] = None) -> None:
+        """
+        Args:
+            preprocessor: 各プロセスで使う前処理
+            jobs(int): プロセス数。1以下なら同じプロセスで処理する
+            chunksize(int): 1回に渡す行数
+            max_pending(int): 同時に投入しておくチャンク数。省略時はjobsの4倍
+        """
+        self.__preprocessor = preprocessor
+        self.__jobs = jobs
+        self.__chunksize = chunksize
+        self.__max_pending = max_pending or 4 * jobs
+        self.__pool = None
+
+    def preprocess(self, line: str) -> List[str]:
+        return self.__preprocessor.preprocess(line)
+
+    def settings(self) -> dict:
+        return self.__preprocessor.settings()
+
+    def preprocess_lines(self, lines: Iterable[str]) -> Iterator[List[str]]:
+        if self.__jobs <= 1:
+            yield from self.__preprocessor.preprocess_lines(lines)
+            return
+
+        if self.__pool is None:
+            self.__pool = multiprocessing.Pool(self.__jobs, initializer=_init_worker,
+                                               initargs=(self.__preprocessor, ))
+        pending: deque = deque()
+        lines = iter(lines)
+        while True:
+            chunk = list(it.islice(lines, self.__chunksize))
+            if not chunk:
+                break
+            pending.append(self.__pool.apply_async(_preprocess_chunk, (chunk, )))
+            if len(pending) >= self.__max_pending:
+                yield from pending.popleft().get()
+        while pending:
+            yield from pending.popleft().get()
+
+    def close(self):
+        if self.__pool is not None:
+            self.__pool.close()
+            self.__pool.join()
+            self.__pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
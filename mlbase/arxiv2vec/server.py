@@ -0,0 +1,294 @@
+"""
+arxiv2vecの推論サーバーとそのクライアント。
+
+サーバーはUnixソケットで1行1リクエストのJSONを受け取り、同時に届いたリクエストをまとめて
+ワーカープロセスに渡す。ワーカーはモデルを一度だけ読み込み、バッチ内の全文章をまとめて推論する。
+
+リクエスト: {"id": 1, "action": "show_vector", "params": {"texts": ["..."]}}
+レスポンス: {"id": 1, "result": {...}} または {"id": 1, "error": "..."}
+"""
+import asyncio
+import itertools as it
+import json
+import os
+import socket
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+from typing import Callable, Dict, List, Optional, Tuple
+
+from mlbase.lazy import numpy as np
+from mlbase.logger import info
+from mlbase.utils.misc import get_tool_path
+
+_HANDLERS: Dict[str, Callable] = {}
+_WORKER_MODEL = None
+
+
+def default_socket_path() -> str:
+    return str(get_tool_path().cache / "arxiv2vec.sock")
+
+
+def by_endpoint(name: Optional[str] = None):
+    def _endpoint(fn: Callable):
+        key = name or fn.__name__
+        assert key not in _HANDLERS
+        _HANDLERS[key] = fn
+        return fn
+
+    return _endpoint
+
+
+@by_endpoint()
+def show_vector(model, vectors, params):
+    return {"vectors": [vec.tolist() for vec in vectors]}
+
+
+@by_endpoint()
+def output_vectors(model, vectors, params):
+    return {"vectors": [vec.tolist() for vec in vectors]}
+
+
+@by_endpoint()
+def compare(model, vectors, params):
+    vec_l, vec_r = vectors
+    return {"cos": float(np.dot(vec_l, vec_r) / np.sqrt(np.dot(vec_l, vec_l) * np.dot(vec_r, vec_r)))}
+
+
+@by_endpoint()
+def find_neighbors(model, vectors, params):
+    k = params.get("k", 10)
+    return {"neighbors": [[[tag, float(score)] for tag, score in model.find_neighbors(vec, k)] for vec in vectors]}
+
+
+def _init_worker(model_path: str):
+    from mlbase.arxiv2vec.model import load
+
+    global _WORKER_MODEL
+    _WORKER_MODEL = load(model_path)
+
+
+def _run_batch(requests: List[Tuple[str, dict]]) -> List[Tuple[bool, object]]:
+    """
+    ワーカーで実行する。バッチ内の全文章を一度に推論してから、リクエストごとに結果を作る。
+    Returns:
+        リクエストごとの(成功したか, 結果またはエラーメッセージ)
+    """
+    texts = [text for _, params in requests for text in params.get("texts", [])]
+    inferred = iter(_WORKER_MODEL.infer_vectors(texts)) if texts else iter([])
+    results = []
+    for action, params in requests:
+        if "texts" in params:
+            vectors = [next(inferred) for _ in params["texts"]]
+        else:
+            vectors = [np.asarray(vec, dtype=np.float32) for vec in params.get("vectors", [])]
+        try:
+            results.append((True, _HANDLERS[action](_WORKER_MODEL, vectors, params)))
+        except Exception as e:
+            results.append((False, f"{type(e).__name__}: {e}"))
+    return results
+
+
+class InferenceServer:
+    def __init__(self, model_path: str, socket_path: str, workers: int = 1, max_batch: int = 32,
+                 batch_window: float = 0.005) -> None:
+        """
+        Args:
+            model_path: モデルのパス。ディレクトリ形式ならワーカー間で重みをページキャッシュで共有する
+            socket_path: Unixソケットのパス
+            workers(int): ワーカープロセス数
+            max_batch(int): 1バッチのリクエスト数の上限
+            batch_window(float): 最初のリクエストから他のリクエストを待つ秒数
+        """
+        self.__model_path = os.path.abspath(model_path)
+        self.__socket_path = socket_path
+        self.__workers = workers
+        self.__max_batch = max_batch
+        self.__batch_window = batch_window
+        self.__loop: Optional[asyncio.AbstractEventLoop] = None
+        self.__stopped: Optional[asyncio.Event] = None
+
+    def run(self, ready: Optional[threading.Event] = None):
+        """
+        stopが呼ばれるまでサーバーを動かす。
+        """
+        asyncio.run(self.serve(ready))
+
+    def stop(self):
+        """
+        他のスレッドから呼べる。
+        """
+        if self.__loop is not None:
+            self.__loop.call_soon_threadsafe(self.__stopped.set)
+
+    async def serve(self, ready: Optional[threading.Event] = None):
+        self.__loop = asyncio.get_running_loop()
+        self.__stopped = asyncio.Event()
+        os.makedirs(os.path.dirname(os.path.abspath(self.__socket_path)), exist_ok=True)
+        _remove_stale_socket(self.__socket_path)
+
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(self.__workers, mp_context=context, initializer=_init_worker,
+                                 initargs=(self.__model_path, )) as pool:
+            # モデルの読み込みに失敗した場合は起動時に分かるようにする
+            await asyncio.gather(*[self.__loop.run_in_executor(pool, _run_batch, []) for _ in range(self.__workers)])
+
+            queue: asyncio.Queue = asyncio.Queue()
+            server = await asyncio.start_unix_server(lambda r, w: self.__handle_client(r, w, queue),
+                                                     path=self.__socket_path)
+            batcher = asyncio.create_task(self.__batcher(queue, pool))
+            info(f"推論サーバーを起動しました: {self.__socket_path} (model={self.__model_path})")
+            if ready is not None:
+                ready.set()
+            try:
+                async with server:
+                    await self.__stopped.wait()
+            finally:
+                batcher.cancel()
+                if os.path.exists(self.__socket_path):
+                    os.unlink(self.__socket_path)
+
+    async def __handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, queue: asyncio.Queue):
+        tasks = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                except ValueError as e:
+                    # 壊れた行でも接続は切らずにエラーを返す
+                    self.__respond(writer, {}, False, f"invalid request: {e}")
+                    continue
+                if not isinstance(request, dict):
+                    self.__respond(writer, {}, False, "invalid request: not a JSON object")
+                    continue
+                if request.get("action") == "ping":
+                    self.__respond(writer, request, True, {"model": self.__model_path, "pid": os.getpid()})
+                    continue
+                if request.get("action") not in _HANDLERS:
+                    self.__respond(writer, request, False, f"unknown action: {request.get('action')}")
+                    continue
+                future = self.__loop.create_future()
+                await queue.put((request, future))
+                task = asyncio.create_task(self.__reply(writer, request, future))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.wait(tasks)
+        finally:
+            writer.close()
+
+    async def __reply(self, writer, request, future):
+        ok, result = await future
+        self.__respond(writer, request, ok, result)
+        await writer.drain()
+
+    def __respond(self, writer, request, ok, result):
+        response = {"id": request.get("id"), ("result" if ok else "error"): result}
+        writer.write(json.dumps(response).encode() + b"\n")
+
+    async def __batcher(self, queue: asyncio.Queue, pool: ProcessPoolExecutor):
+        slots = asyncio.Semaphore(self.__workers)
+        while True:
+            batch = [await queue.get()]
+            deadline = self.__loop.time() + self.__batch_window
+            while len(batch) < self.__max_batch:
+                timeout = deadline - self.__loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await slots.acquire()
+            asyncio.create_task(self.__run_batch(batch, pool, slots))
+
+    async def __run_batch(self, batch, pool, slots):
+        try:
+            requests = [(request["action"], request.get("params", {})) for request, _ in batch]
+            try:
+                results = await self.__loop.run_in_executor(pool, _run_batch, requests)
+            except Exception as e:
+                results = [(False, f"{type(e).__name__}: {e}")] * len(batch)
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+        finally:
+            slots.release()
+
+
+def _remove_stale_socket(socket_path: str):
+    if not os.path.exists(socket_path):
+        return
+    if connect(socket_path) is not None:
+        raise Exception(f"{socket_path}で既にサーバーが動いています。")
+    os.unlink(socket_path)
+
+
+class RemoteError(Exception):
+    pass
+
+
+class RemoteModel:
+    """
+    推論サーバーに処理を送るモデル。Doc2VecModelと同じ推論用のメソッドを持つ。
+    """
+
+    def __init__(self, socket_path: str) -> None:
+        self.__socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.__socket.connect(socket_path)
+        self.__file = self.__socket.makefile("rwb")
+        self.__ids = it.count()
+
+    def request(self, action: str, **params) -> dict:
+        request_id = next(self.__ids)
+        self.__file.write(json.dumps({"id": request_id, "action": action, "params": params}).encode() + b"\n")
+        self.__file.flush()
+        line = self.__file.readline()
+        if not line:
+            raise RemoteError("サーバーとの接続が切れました。")
+        response = json.loads(line)
+        assert response["id"] == request_id
+        if "error" in response:
+            raise RemoteError(response["error"])
+        return response["result"]
+
+    def infer_vector(self, text: str):
+        return self.infer_vectors([text])[0]
+
+    def infer_vectors(self, texts, jobs: int = 1):
+        vectors = self.request("show_vector", texts=list(texts))["vectors"]
+        return [np.asarray(vec, dtype=np.float32) for vec in vectors]
+
+    def find_neighbors(self, vec, k: int = 10):
+        neighbors = self.request("find_neighbors", vectors=[np.asarray(vec).tolist()], k=k)["neighbors"][0]
+        return [(tag, score) for tag, score in neighbors]
+
+    def close(self):
+        self.__file.close()
+        self.__socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+def connect(socket_path: str, model_path: Optional[str] = None) -> Optional[RemoteModel]:
+    """
+    サーバーが動いていれば接続したRemoteModelを、動いていなければNoneを返す。
+    model_pathを指定した場合は、サーバーのモデルが異なればNoneを返す。
+    """
+    if not socket_path or not os.path.exists(socket_path):
+        return None
+    try:
+        remote = RemoteModel(socket_path)
+        status = remote.request("ping")
+    except (ConnectionError, FileNotFoundError, RemoteError):
+        return None
+    if model_path is not None and os.path.abspath(model_path) != status["model"]:
+        remote.close()
+        return None
+    return remote
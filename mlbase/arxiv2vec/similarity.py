@@ -0,0 +1,79 @@
+"""
+複数の文章のベクトルの間のコサイン類似度を、行のブロックごとの行列積で計算する。
+"""
+import csv
+from typing import Iterator, List, Optional, Tuple
+
+from mlbase.lazy import numpy as np
+from mlbase.arxiv2vec.index import ExactIndex, normalize
+
+NEIGHBOR_DTYPE = [("index", "<i8"), ("cos", "<f4")]
+OUTPUT_SUFFIXES = (".npy", ".csv")
+
+
+def similarity_blocks(vectors: "np.ndarray", block_size: int = 1024) -> Iterator[Tuple[int, "np.ndarray"]]:
+    """
+    類似度行列を上からblock_size行ずつ返す。
+    Returns:
+        (先頭の行番号, [行数, 全件数]の類似度)の列
+    """
+    vectors = normalize(vectors)
+    for head in range(0, len(vectors), block_size):
+        yield head, vectors[head:head + block_size] @ vectors.T
+
+
+def top_k_similar(vectors: "np.ndarray", k: int, block_size: int = 1024) -> "np.ndarray":
+    """
+    各行について自分自身を除いて類似度の大きい順にk件。
+    質問もblock_size行ずつに分けて探索するので、一度に作る類似度はblock_size×block_sizeで済む。
+    Returns:
+        NEIGHBOR_DTYPEの[件数, k]の配列。候補が足りなければindexは-1
+    """
+    index = ExactIndex.build(vectors, block_size=block_size)
+    result = np.zeros([len(vectors), k], dtype=NEIGHBOR_DTYPE)
+    result["index"] = -1
+    for head in range(0, len(vectors), block_size):
+        ids, scores = index.search(vectors[head:head + block_size], k + 1)
+        for i, (row_ids, row_scores) in enumerate(zip(ids, scores), head):
+            keep = row_ids != i
+            row_ids, row_scores = row_ids[keep][:k], row_scores[keep][:k]
+            result["index"][i, :len(row_ids)] = row_ids
+            result["cos"][i, :len(row_ids)] = row_scores
+    return result
+
+def check_output_path(path: str):
+    """
+    write_similarityで書き出せる拡張子か確認する。推論の前に呼んで、誤った指定で推論が無駄にならないようにする。
+    """
+    if not path.endswith(OUTPUT_SUFFIXES):
+        raise Exception(f"{path}: 出力は{'か'.join(OUTPUT_SUFFIXES)}にしてください。")
+
+
+def write_similarity(path: str, names: List[str], vectors: "np.ndarray", top_k: Optional[int] = None,
+                     block_size: int = 1024):
+    """
+    拡張子が.npyならnumpyの配列、.csvならCSVで書き出す。
+    top_kを指定しなければ[件数, 件数]の類似度行列を、指定すればtop_k_similarの結果を書く。
+    """
+    check_output_path(path)
+    if path.endswith(".npy"):
+        if top_k:
+            np.save(path, top_k_similar(vectors, top_k, block_size))
+            return
+        out = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=(len(vectors), len(vectors)))
+        for head, block in similarity_blocks(vectors, block_size):
+            out[head:head + len(block)] = block
+        out.flush()
+    else:
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            if top_k:
+                writer.writerow(["input", "rank", "neighbor", "cos"])
+                for name, row in zip(names, top_k_similar(vectors, top_k, block_size)):
+                    for rank, (i, cos) in enumerate(row[row["index"] >= 0].tolist()):
+                        writer.writerow([name, rank + 1, names[i], f"{cos:.6f}"])
+                return
+            writer.writerow([""] + names)
+            for head, block in similarity_blocks(vectors, block_size):
+                for name, row in zip(names[head:], block):
+                    writer.writerow([name] + [f"{cos:.6f}" for cos in row])
@@ -0,0 +1,174 @@
+"""
+前処理済みのコーパスをディスクに保存する。
+前処理の種類と設定、入力ファイルごとにディレクトリを分けるので、Doc2Vecの設定だけを変えた再訓練では前処理を省略できる。
+
+/path/to/token_cache/<key>/meta.json: 前処理の種類と設定、入力ファイル、文書数
+/path/to/token_cache/<key>/vocab.jsonl: 1行1単語の語彙(改行等を含んでも読めるようJSONの文字列で書く)。行番号が単語ID
+/path/to/token_cache/<key>/tokens.npy: 全文書の単語IDをつなげたint32の配列
+/path/to/token_cache/<key>/offsets.npy: i番目の文書がtokens[offsets[i]:offsets[i + 1]]となるint64の配列
+"""
+import hashlib
+import json
+import os
+import shutil
+from array import array
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+from mlbase.lazy import numpy as np
+from mlbase.lazy import gensim
+from mlbase.logger import info
+from mlbase.utils.array_tree import type_name
+from mlbase.arxiv2vec.corpus import LineCorpus
+from mlbase.arxiv2vec.preprocess.parallel import ParallelPreprocessor
+
+_META = "meta.json"
+_FORMAT = "mlbase.token_cache"
+_VERSION = 2
+_CHUNK = 1 << 20
+
+
+def token_cache_key(preprocessor, train_data: str) -> dict:
+    """
+    キャッシュを区別する情報。入力ファイルは更新を検出できるよう大きさと更新時刻も含める。
+    """
+    stat = os.stat(train_data)
+    return {
+        "preprocessor": type_name(type(preprocessor)),
+        "settings": preprocessor.settings(),
+        "train_data": os.path.abspath(train_data),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+    }
+
+
+def token_cache_path(root, key: dict) -> Path:
+    digest = hashlib.sha1(json.dumps(key, sort_keys=True).encode()).hexdigest()[:16]
+    return Path(root) / digest
+
+
+def write_token_cache(path, tokenized: Iterable[List[str]], key: Optional[dict] = None):
+    """
+    単語列の列をキャッシュとして書き出す。単語IDは配列に追記していくので、コーパス全体をメモリに持たない。
+    Args:
+        path: 出力ディレクトリ
+        tokenized: 文書ごとの単語のリスト
+        key: meta.jsonに記録する情報
+    """
+    path = Path(path)
+    tmp = path.parent / f".{path.name}.tmp{os.getpid()}"
+    if tmp.exists():
+        shutil.rmtree(tmp)
+    tmp.mkdir(parents=True)
+
+    vocab: dict = {}
+    token_count = 0
+    offsets = array("q", [0])
+    with open(tmp / "tokens.bin", "wb") as f_tokens:
+        buffer = array("i")
+        for words in tokenized:
+            for word in words:
+                buffer.append(vocab.setdefault(word, len(vocab)))
+            token_count += len(words)
+            offsets.append(token_count)
+            if len(buffer) >= _CHUNK:
+                buffer.tofile(f_tokens)
+                buffer = array("i")
+        buffer.tofile(f_tokens)
+
+    _raw_to_npy(tmp / "tokens.bin", tmp / "tokens.npy", np.int32, token_count)
+    np.save(tmp / "offsets.npy", np.frombuffer(offsets, dtype=np.int64))
+    with open(tmp / "vocab.jsonl", "w") as f:
+        for word in vocab:
+            f.write(json.dumps(word) + "\n")
+    meta = {
+        "format": _FORMAT,
+        "version": _VERSION,
+        "key": key,
+        "document_count": len(offsets) - 1,
+        "token_count": token_count,
+        "vocab_size": len(vocab),
+    }
+    with open(tmp / _META, "w") as f:
+        json.dump(meta, f, indent=2)
+
+    try:
+        os.rename(tmp, path)
+    except OSError:
+        # 他のプロセスが先に作成した場合はそちらを使う
+        shutil.rmtree(tmp)
+        if not (path / _META).exists():
+            raise
+
+
+def _raw_to_npy(raw: Path, npy: Path, dtype, count: int):
+    """
+    追記で作った生の配列を、チャンクごとにコピーして.npyにする。
+    """
+    out = np.lib.format.open_memmap(npy, mode="w+", dtype=dtype, shape=(count, ))
+    if count:
+        src = np.memmap(raw, dtype=dtype, mode="r", shape=(count, ))
+        for head in range(0, count, _CHUNK):
+            out[head:head + _CHUNK] = src[head:head + _CHUNK]
+        del src
+    out.flush()
+    del out
+    raw.unlink()
+
+
+class TokenCorpus:
+    """
+    write_token_cacheで保存したコーパス。配列はmmapで読み、イテレートのたびに先頭から走査する。
+    """
+
+    def __init__(self, path) -> None:
+        path = Path(path)
+        with open(path / _META) as f:
+            self.meta = json.load(f)
+        if self.meta.get("format") != _FORMAT or self.meta.get("version") != _VERSION:
+            raise Exception(f"{path}は{_FORMAT}(version {_VERSION})の形式ではありません。")
+        with open(path / "vocab.jsonl") as f:
+            self.vocab = [json.loads(line) for line in f]
+        self.tokens = np.load(path / "tokens.npy", mmap_mode="r")
+        self.offsets = np.load(path / "offsets.npy", mmap_mode="r")
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def words(self, i: int) -> List[str]:
+        vocab = self.vocab
+        return [vocab[j] for j in self.tokens[self.offsets[i]:self.offsets[i + 1]].tolist()]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield gensim.models.doc2vec.TaggedDocument(self.words(i), [i])
+
+
+def _is_current(path: Path) -> bool:
+    if not (path / _META).exists():
+        return False
+    with open(path / _META) as f:
+        return json.load(f).get("version") == _VERSION
+
+
+def load_or_build_token_cache(root, train_data: str, preprocessor, jobs: int = 1) -> TokenCorpus:
+    """
+    キャッシュがあればそれを、無ければ前処理して保存したものを返す。
+    Args:
+        root: キャッシュを置くディレクトリ
+        train_data: 1行1文書のテキストファイル
+        preprocessor: AbsPreprocessor
+        jobs(int): 前処理のプロセス数
+    """
+    key = token_cache_key(preprocessor, train_data)
+    path = token_cache_path(root, key)
+    if _is_current(path):
+        info(f"前処理済みのコーパスを使います: {path}")
+    else:
+        if path.exists():
+            # 以前の形式のキャッシュは作り直す
+            shutil.rmtree(path)
+        info(f"前処理してコーパスを保存します: {path}")
+        with ParallelPreprocessor(preprocessor, jobs) as parallel:
+            write_token_cache(path, parallel.preprocess_lines(LineCorpus(train_data)), key)
+    return TokenCorpus(path)
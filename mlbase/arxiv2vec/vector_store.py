@@ -0,0 +1,158 @@
+"""
+追記していくベクトルの保存先。
+
+/path/to/store/manifest.json: 次元、型、確定したチャンクの一覧
+/path/to/store/chunk-00000.npy: [件数, 次元]のベクトル
+/path/to/store/chunk-00000.ids.json: 各ベクトルのid(入力ファイル名など)のリスト
+
+チャンクを書いてからマニフェストを置き換えるので、途中で落ちてもマニフェストにあるチャンクまでは残る。
+"""
+import json
+import os
+from pathlib import Path
+from typing import Iterator, List, Optional, Set
+
+from mlbase.lazy import numpy as np
+
+_MANIFEST = "manifest.json"
+_FORMAT = "mlbase.vector_store"
+_VERSION = 1
+
+
+class ChunkedArray:
+    """
+    チャンクの配列をコピーせずに縦に連結したものとして扱う読み込み専用のビュー
+    """
+
+    def __init__(self, chunks: List["np.ndarray"], dim: int, dtype) -> None:
+        self.__chunks = chunks
+        self.__offsets = np.concatenate([[0], np.cumsum([len(chunk) for chunk in chunks])]).astype(np.int64)
+        self.shape = (int(self.__offsets[-1]), dim)
+        self.dtype = np.dtype(dtype)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            i = key + len(self) if key < 0 else key
+            if not 0 <= i < len(self):
+                raise IndexError(key)
+            c = int(np.searchsorted(self.__offsets, i, side="right")) - 1
+            return self.__chunks[c][i - self.__offsets[c]]
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step == 1:
+                return self.__slice(start, stop)
+            key = np.arange(start, stop, step)
+        ids = np.asarray(key, dtype=np.int64)
+        ids = np.where(ids < 0, ids + len(self), ids)
+        chunk_ids = np.searchsorted(self.__offsets, ids, side="right") - 1
+        result = np.empty([len(ids), self.shape[1]], dtype=self.dtype)
+        for c in np.unique(chunk_ids):
+            mask = chunk_ids == c
+            result[mask] = self.__chunks[c][ids[mask] - self.__offsets[c]]
+        return result
+
+    def __slice(self, start, stop):
+        parts = []
+        for c, chunk in enumerate(self.__chunks):
+            head, tail = max(start, self.__offsets[c]), min(stop, self.__offsets[c + 1])
+            if head < tail:
+                parts.append(chunk[head - self.__offsets[c]:tail - self.__offsets[c]])
+        if len(parts) == 1:
+            return parts[0]
+        return np.concatenate(parts) if parts else np.zeros([0, self.shape[1]], dtype=self.dtype)
+
+    def __array__(self, dtype=None, copy=None):
+        array = self[:]
+        return array if dtype is None else array.astype(dtype)
+
+    def iter_chunks(self) -> Iterator["np.ndarray"]:
+        return iter(self.__chunks)
+
+
+class VectorStore:
+    def __init__(self, path, dim: Optional[int] = None, chunk_size: int = 1024, dtype="float32") -> None:
+        """
+        Args:
+            path: 保存先のディレクトリ。既にあれば続きから追記する
+            dim(int): ベクトルの次元。省略時は最初に追加したベクトルから決める
+            chunk_size(int): 1チャンクの件数
+            dtype: 保存する型
+        """
+        self.__path = Path(path)
+        self.__chunk_size = chunk_size
+        self.__buffer: List["np.ndarray"] = []
+        self.__buffer_ids: List[str] = []
+        if (self.__path / _MANIFEST).exists():
+            with open(self.__path / _MANIFEST) as f:
+                self.__manifest = json.load(f)
+            if self.__manifest.get("format") != _FORMAT:
+                raise Exception(f"{path}は{_FORMAT}の形式ではありません。")
+        else:
+            self.__path.mkdir(parents=True, exist_ok=True)
+            self.__manifest = {"format": _FORMAT, "version": _VERSION, "dim": dim, "dtype": np.dtype(dtype).str,
+                               "chunks": []}
+
+    def __len__(self):
+        return sum(chunk["count"] for chunk in self.__manifest["chunks"]) + len(self.__buffer)
+
+    @property
+    def ids(self) -> List[str]:
+        """
+        確定したベクトルのid
+        """
+        ids: List[str] = []
+        for chunk in self.__manifest["chunks"]:
+            with open(self.__path / chunk["ids"]) as f:
+                ids += json.load(f)
+        return ids
+
+    def done_ids(self) -> Set[str]:
+        return set(self.ids) | set(self.__buffer_ids)
+
+    def append(self, id_: str, vector):
+        vector = np.asarray(vector, dtype=self.__manifest["dtype"])
+        if self.__manifest["dim"] is None:
+            self.__manifest["dim"] = int(vector.shape[0])
+        assert vector.shape == (self.__manifest["dim"], )
+        self.__buffer.append(vector)
+        self.__buffer_ids.append(id_)
+        if len(self.__buffer) >= self.__chunk_size:
+            self.flush()
+
+    def flush(self):
+        """
+        追加済みのベクトルをチャンクとして確定する。
+        """
+        if not self.__buffer:
+            return
+        name = f"chunk-{len(self.__manifest['chunks']):05d}"
+        np.save(self.__path / f"{name}.npy", np.stack(self.__buffer))
+        with open(self.__path / f"{name}.ids.json", "w") as f:
+            json.dump(self.__buffer_ids, f)
+        chunk = {"file": f"{name}.npy", "ids": f"{name}.ids.json", "count": len(self.__buffer)}
+        self.__manifest["chunks"].append(chunk)
+        tmp = self.__path / f"{_MANIFEST}.tmp{os.getpid()}"
+        with open(tmp, "w") as f:
+            json.dump(self.__manifest, f, indent=2)
+        os.replace(tmp, self.__path / _MANIFEST)
+        self.__buffer = []
+        self.__buffer_ids = []
+
+    def vectors(self, mmap_mode: Optional[str] = "r") -> ChunkedArray:
+        """
+        確定したチャンクをmmapで開き、連結したビューを返す。
+        """
+        chunks = [np.load(self.__path / chunk["file"], mmap_mode=mmap_mode) for chunk in self.__manifest["chunks"]]
+        return ChunkedArray(chunks, self.__manifest["dim"] or 0, self.__manifest["dtype"])
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
@@ -4,12 +4,15 @@ from typing import Optional
 from mlbase.utils.cli import Command, PluginManger, LocalPluginType
 from mlbase.config import load_config, load_no_config, MLBaseConfig
 from mlbase.note import note_command
-from mlbase.template.cifar.train import train_cifar_command
+from mlbase.template.cifar.train import train_cifar_command, host_cifar_command
+from mlbase.template.cifar.evaluate import evaluate_cifar_command
+from mlbase.template.cifar.parallel import train_cifar_parallel_command
 from mlbase.dataset.rough_estimate import rough_estimate_command
 from mlbase.kaggle import kaggle_command
 from mlbase.arxiv2vec.cli import arxiv2vec_command
 from mlbase.cli.tree import show_tree
 from mlbase.estimate import estimate_command
+from mlbase.lr_schedule import lr_schedule_command
 
 META_CONFIG = ".meta:running:config"
 META_NO_CONFIG = ".meta:running:no_config"
@@ -51,7 +54,12 @@ def build(config: Optional[MLBaseConfig] = None) -> Command:
     cmd_dataset = Command("dataset", "データセットに関するコマンドです。") << cmd
     cmd_dataset >> rough_estimate_command()
 
-    cmd >> Command("research", "研究段階のもののコマンドです。") >> train_cifar_command()
+    cmd_research = Command("research", "研究段階のもののコマンドです。") << cmd
+    cmd_research >> train_cifar_command()
+    cmd_research >> evaluate_cifar_command()
+    cmd_research >> host_cifar_command()
+    cmd_research >> train_cifar_parallel_command()
+    cmd_research >> lr_schedule_command()
 
     cmd >> arxiv2vec_command()
 
@@ -0,0 +1,89 @@
+"""
+画像バッチ全体に対して一度にデータ拡張を行う。
+"""
+from typing import Optional, Sequence
+
+from mlbase.lazy import numpy as np
+
+CIFAR100_MEAN = (129.3, 124.1, 112.4)
+CIFAR100_STD = (68.2, 65.4, 70.4)
+
+
+class BatchAugmenter:
+    """
+    [N, H, W, C]のuint8画像に、パディングつきランダムクロップ、左右反転、チャンネルごとの正規化を行う。
+    クロップと反転は1回のインデックス参照にまとめて行う。
+
+    >>> augmenter = BatchAugmenter(pad=2, mean=[0, 0, 0], std=[1, 1, 1], seed=0)
+    >>> images = np.arange(2 * 4 * 4 * 3, dtype=np.uint8).reshape([2, 4, 4, 3])
+    >>> augmenter(images).shape, augmenter(images).dtype
+    ((2, 4, 4, 3), dtype('float32'))
+    >>> bool((augmenter.normalize(images) == images).all())
+    True
+    """
+
+    def __init__(
+        self,
+        pad: int = 4,
+        flip: bool = True,
+        mean: Optional[Sequence[float]] = CIFAR100_MEAN,
+        std: Optional[Sequence[float]] = CIFAR100_STD,
+        seed: Optional[int] = None,
+    ) -> None:
+        """
+        Args:
+            pad(int): クロップ前に上下左右に加える0の幅。0ならクロップしない。
+            flip(bool): 確率1/2で左右反転するか
+            mean: チャンネルごとの平均。Noneなら引かない。
+            std: チャンネルごとの標準偏差。Noneなら割らない。
+            seed: 乱数のシード。複数スレッドから呼ぶと乱数の割り当て順は定まらない。
+        """
+        assert pad >= 0
+        self.__pad = pad
+        self.__flip = flip
+        self.__mean = None if mean is None else np.asarray(mean, dtype=np.float32)
+        self.__inv_std = None if std is None else 1.0 / np.asarray(std, dtype=np.float32)
+        self.__rng = np.random.default_rng(seed)
+
+    def __call__(self, images: "np.ndarray") -> "np.ndarray":
+        return self.normalize(self.crop_and_flip(images))
+
+    def crop_and_flip(self, images: "np.ndarray") -> "np.ndarray":
+        n, h, w, _ = images.shape
+        pad = self.__pad
+        if pad == 0 and not self.__flip:
+            return images
+
+        if pad > 0:
+            images = np.pad(images, [(0, 0), (pad, pad), (pad, pad), (0, 0)], mode="constant")
+        offset_y = self.__rng.integers(0, 2 * pad + 1, size=n)
+        offset_x = self.__rng.integers(0, 2 * pad + 1, size=n)
+        rows = offset_y[:, None] + np.arange(h)
+        cols = offset_x[:, None] + np.arange(w)
+        if self.__flip:
+            flipped = self.__rng.random(n) < 0.5
+            cols = np.where(flipped[:, None], cols[:, ::-1], cols)
+
+        return images[np.arange(n)[:, None, None], rows[:, :, None], cols[:, None, :]]
+
+    def normalize(self, images: "np.ndarray") -> "np.ndarray":
+        """
+        正規化のみ行う。評価時の入力に使う。
+        """
+        output = images.astype(np.float32)
+        if self.__mean is not None:
+            output -= self.__mean
+        if self.__inv_std is not None:
+            output *= self.__inv_std
+        return output
+
+
+def get_augmenter(config: Optional[dict], seed: Optional[int] = None) -> Optional[BatchAugmenter]:
+    """
+    ハイパーパラメータのaugmentationの設定からBatchAugmenterを作る。
+    Args:
+        config: pad, flip, mean, stdを持つ辞書。Noneならデータ拡張をしない。
+    """
+    if config is None:
+        return None
+    return BatchAugmenter(seed=seed, **config)
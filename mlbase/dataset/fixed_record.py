@@ -0,0 +1,63 @@
+"""
+固定長レコードのバイナリデータセットを読み込む。
+ファイル全体を構造化dtypeの配列として扱うため、レコードごとのPython処理は発生しない。
+"""
+import os
+from typing import List, Tuple
+
+from mlbase.lazy import numpy as np
+
+Field = Tuple[str, str, tuple]
+
+
+def record_dtype(fields: List[Field]) -> "np.dtype":
+    """
+    レコードの構造化dtypeを作成する。
+    Args:
+        fields: (フィールド名, 型, 形状)のリスト。ファイル上の並び順に指定する。
+
+    >>> record_dtype([("label", "u1", ()), ("image", "u1", (3, 2, 2))]).itemsize
+    13
+    """
+    return np.dtype([(name, dtype, shape) for name, dtype, shape in fields])
+
+
+def read_records(path, dtype: "np.dtype", mmap: bool = True) -> "np.ndarray":
+    """
+    固定長レコードのファイルを構造化配列として読み込む。
+    Args:
+        path: 入力ファイル
+        dtype: record_dtypeで作成したレコードの型
+        mmap(bool): Trueならnp.memmapで読み込み専用にマップする。Falseならnp.fromfileで読み込む。
+    Return: shapeが[レコード数]の構造化配列
+    """
+    dtype = np.dtype(dtype)
+    size = os.path.getsize(path)
+    if size % dtype.itemsize != 0:
+        raise Exception(f"{path}のサイズ({size})がレコード長({dtype.itemsize})の倍数ではありません。")
+
+    if size == 0:
+        return np.empty([0], dtype=dtype)
+    if mmap:
+        return np.memmap(path, dtype=dtype, mode="r")
+    return np.fromfile(path, dtype=dtype)
+
+
+def read_records_from_files(paths, dtype: "np.dtype", mmap: bool = True) -> "np.ndarray":
+    """
+    複数ファイルのレコードを連結して読み込む。
+    ファイルが1つの場合はコピーせずにread_recordsの結果を返す。
+    """
+    records = [read_records(path, dtype, mmap=mmap) for path in paths]
+    if not records:
+        raise FileNotFoundError("読み込むファイルが指定されていません。")
+    if len(records) == 1:
+        return records[0]
+    return np.concatenate(records)
+
+
+def chw_to_hwc(images: "np.ndarray") -> "np.ndarray":
+    """
+    NCHWの画像配列をNHWCのビューに変換する(コピーしない)。
+    """
+    return images.transpose([0, 2, 3, 1])
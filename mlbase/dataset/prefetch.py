@@ -0,0 +1,179 @@
+"""
+バッチのジェネレータを別スレッドで先読みする。
+"""
+import queue
+import threading
+import time
+from typing import Callable, Iterable, Optional
+
+_END = object()
+
+
+class _Error:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+class Prefetcher:
+    """
+    sourceから取り出した要素をワーカースレッドでtransformし、上限つきのキューに溜めておく。
+    要素はsourceの順番のまま返す。
+
+    sourceはロックをとって1つずつ取り出すので、並列になるのはtransformだけ。
+    sourceの生成自体が重い場合はその処理をtransformに移すこと。
+    取り出したがまだ返していない要素はqueue_size個までで、それ以上は先に取り出さない。
+
+    >>> with Prefetcher(range(5), num_workers=2, transform=lambda x: x * 2) as batches:
+    ...     list(batches)
+    [0, 2, 4, 6, 8]
+    """
+
+    def __init__(
+        self,
+        source: Iterable,
+        num_workers: int = 1,
+        queue_size: int = 4,
+        transform: Optional[Callable] = None,
+        poll_interval: float = 0.1,
+    ) -> None:
+        """
+        Args:
+            source: batchnizer等のバッチを生成するもの。ワーカー間ではロックをとって順番に取り出す。
+            num_workers(int): ワーカースレッド数
+            queue_size(int): 先読みしておくバッチ数の上限(transform中と順番待ちのものを含む)
+            transform: 取り出した要素に適用する関数。ロックの外で並列に実行される。
+            poll_interval(float): 終了を確認する間隔(秒)
+        """
+        assert num_workers > 0
+        assert queue_size > 0
+        self.__source = iter(source)
+        self.__transform = transform
+        self.__poll_interval = poll_interval
+        self.__num_workers = num_workers
+
+        self.__lock = threading.Lock()
+        self.__consumed_cond = threading.Condition(self.__lock)
+        self.__queue_size = queue_size
+        self.__queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.__stop = threading.Event()
+        self.__exhausted = False
+        self.__produced = 0
+
+        self.__pending: dict = {}
+        self.__consumed = 0
+        self.__finished_workers = 0
+        self.__wait_time = 0.0
+
+        self.__threads = [threading.Thread(target=self.__work, daemon=True) for _ in range(num_workers)]
+        for thread in self.__threads:
+            thread.start()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        # close後(例外で自動的に閉じた場合を含む)は、ワーカーが終了の印を入れずに止まっていることがある
+        if self.__stop.is_set():
+            raise StopIteration
+        while self.__consumed not in self.__pending:
+            if self.__finished_workers == self.__num_workers:
+                raise StopIteration
+            start = time.perf_counter()
+            try:
+                seq, item = self.__queue.get(timeout=self.__poll_interval)
+            except queue.Empty:
+                # 別のスレッドからcloseされた場合に待ち続けないよう、定期的に確認する
+                if self.__stop.is_set():
+                    raise StopIteration
+                continue
+            finally:
+                self.__wait_time += time.perf_counter() - start
+            if item is _END:
+                self.__finished_workers += 1
+            else:
+                self.__pending[seq] = item
+
+        item = self.__pending.pop(self.__consumed)
+        with self.__consumed_cond:
+            self.__consumed += 1
+            self.__consumed_cond.notify_all()
+        if isinstance(item, _Error):
+            self.close()
+            raise item.error
+        return item
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def close(self):
+        """
+        ワーカーを止めて終了を待つ。
+        """
+        self.__stop.set()
+        for thread in self.__threads:
+            thread.join()
+        close_source = getattr(self.__source, "close", None)
+        if close_source is not None:
+            close_source()
+
+    @property
+    def wait_time(self) -> float:
+        """
+        取り出し側がキューが空で待たされた合計時間(秒)
+        """
+        return self.__wait_time
+
+    @property
+    def count(self) -> int:
+        """
+        取り出した要素数
+        """
+        return self.__consumed
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.__consumed,
+            "wait_time": self.__wait_time,
+            "wait_per_batch": self.__wait_time / self.__consumed if self.__consumed else 0.0,
+        }
+
+    def __work(self):
+        while not self.__stop.is_set():
+            with self.__consumed_cond:
+                # 順番待ちが溜まりすぎないよう、先読みはqueue_size個まで
+                while self.__produced - self.__consumed >= self.__queue_size and not self.__stop.is_set():
+                    self.__consumed_cond.wait(self.__poll_interval)
+                if self.__exhausted or self.__stop.is_set():
+                    break
+                seq = self.__produced
+                try:
+                    item = next(self.__source)
+                except StopIteration:
+                    self.__exhausted = True
+                    break
+                except Exception as e:
+                    self.__exhausted = True
+                    item = _Error(e)
+                self.__produced += 1
+
+            if self.__transform is not None and not isinstance(item, _Error):
+                try:
+                    item = self.__transform(item)
+                except Exception as e:
+                    item = _Error(e)
+
+            if not self.__put((seq, item)):
+                return
+        self.__put((None, _END))
+
+    def __put(self, obj) -> bool:
+        while not self.__stop.is_set():
+            try:
+                self.__queue.put(obj, timeout=self.__poll_interval)
+                return True
+            except queue.Full:
+                continue
+        return False
@@ -0,0 +1,274 @@
+"""
+ndarrayのNamedTuple(Dataのようなもの)を、固定件数のシャードに分けたレコードファイルとして保存する。
+
+ディレクトリ構成:
+/path/to/records/manifest.json: フィールドの型と形状、シャードの一覧
+/path/to/records/shard-00000.rec: レコードの列。各レコードは[長さ(u4), CRC32(u4), 本体]
+/path/to/records/shard-00000.idx.npy: 各レコードの先頭位置(int64の.npy、末尾はファイルサイズ)
+
+本体は1件分の全フィールドをつなげたバイト列で、compressionを指定するとzlibかlzmaで圧縮する。
+"""
+import json
+import lzma
+import os
+import shutil
+import struct
+import zlib
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+from mlbase.lazy import numpy as np
+from mlbase.utils.array_tree import import_type, type_name
+from mlbase.dataset.prefetch import Prefetcher
+
+_MANIFEST = "manifest.json"
+_FORMAT = "mlbase.record"
+_VERSION = 1
+_HEADER = struct.Struct("<II")
+
+_COMPRESSORS = {
+    None: (lambda b: b, lambda b: b),
+    "zlib": (zlib.compress, zlib.decompress),
+    "lzma": (lzma.compress, lzma.decompress),
+}
+
+
+class RecordCorruptedError(Exception):
+    def __init__(self, path, index):
+        super().__init__(f"{path}の{index}件目のレコードが壊れています(CRC不一致)")
+
+
+def _shard_name(i: int) -> str:
+    return f"shard-{i:05d}"
+
+
+def _row_dtype(fields: dict) -> "np.dtype":
+    return np.dtype([(name, spec["dtype"], tuple(spec["shape"])) for name, spec in fields.items()])
+
+
+class RecordWriter:
+    """
+    バッチを追記していき、records_per_shard件ごとにシャードを切り替える。
+    データ全体をメモリに載せずに書き出せる。
+    """
+
+    def __init__(self, directory, records_per_shard: int = 10000, compression: Optional[str] = None) -> None:
+        """
+        Args:
+            directory: 出力ディレクトリ。closeするまでは一時ディレクトリに書く。
+            records_per_shard(int): 1シャードの件数
+            compression: None, "zlib", "lzma"のいずれか
+        """
+        assert records_per_shard > 0
+        assert compression in _COMPRESSORS
+        self.__directory = Path(directory)
+        self.__tmp = self.__directory.parent / f".{self.__directory.name}.tmp{os.getpid()}"
+        if self.__tmp.exists():
+            shutil.rmtree(self.__tmp)
+        self.__tmp.mkdir(parents=True)
+        self.__records_per_shard = records_per_shard
+        self.__compression = compression
+        self.__compress = _COMPRESSORS[compression][0]
+
+        self.__type: Optional[str] = None
+        self.__fields: Optional[dict] = None
+        self.__shards: List[dict] = []
+        self.__file = None
+        self.__offsets: List[int] = []
+        self.__count = 0
+
+    def write(self, data):
+        """
+        Args:
+            data: 各フィールドが先頭の次元を件数とするndarrayのNamedTuple
+        """
+        arrays = {name: np.asarray(value) for name, value in zip(data._fields, data)}
+        if self.__fields is None:
+            self.__type = type_name(type(data))
+            self.__fields = {
+                name: {"dtype": array.dtype.str, "shape": list(array.shape[1:])} for name, array in arrays.items()
+            }
+        rows = np.empty(len(arrays[data._fields[0]]), dtype=_row_dtype(self.__fields))
+        for name, array in arrays.items():
+            rows[name] = array
+
+        for row in rows:
+            self.__write_record(row.tobytes())
+
+    def close(self):
+        """
+        manifestを書いて出力ディレクトリに移す。
+        一度もwriteしていなければ型が決まらないので、何も作らずに例外を投げる。
+        """
+        self.__close_shard()
+        if self.__type is None:
+            shutil.rmtree(self.__tmp, ignore_errors=True)
+            raise Exception(f"{self.__directory}に書くデータがありません。空のデータでも1度はwriteしてください。")
+        manifest = {
+            "format": _FORMAT,
+            "version": _VERSION,
+            "type": self.__type,
+            "fields": self.__fields,
+            "count": self.__count,
+            "records_per_shard": self.__records_per_shard,
+            "compression": self.__compression,
+            "shards": self.__shards,
+        }
+        with open(self.__tmp / _MANIFEST, "w") as f:
+            json.dump(manifest, f, indent=2)
+        if self.__directory.exists():
+            shutil.rmtree(self.__directory)
+        os.rename(self.__tmp, self.__directory)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *_):
+        if exc_type is None:
+            self.close()
+        else:
+            if self.__file is not None:
+                self.__file.close()
+            shutil.rmtree(self.__tmp, ignore_errors=True)
+
+    def __write_record(self, payload: bytes):
+        if self.__file is None:
+            name = _shard_name(len(self.__shards))
+            self.__file = open(self.__tmp / f"{name}.rec", "wb")
+            self.__offsets = [0]
+
+        body = self.__compress(payload)
+        self.__file.write(_HEADER.pack(len(body), zlib.crc32(body)))
+        self.__file.write(body)
+        self.__offsets.append(self.__offsets[-1] + _HEADER.size + len(body))
+        self.__count += 1
+
+        if len(self.__offsets) - 1 == self.__records_per_shard:
+            self.__close_shard()
+
+    def __close_shard(self):
+        if self.__file is None:
+            return
+        self.__file.close()
+        self.__file = None
+        name = _shard_name(len(self.__shards))
+        np.save(self.__tmp / f"{name}.idx.npy", np.asarray(self.__offsets, dtype=np.int64))
+        self.__shards.append({"file": f"{name}.rec", "index": f"{name}.idx.npy", "count": len(self.__offsets) - 1})
+
+
+def write_records(directory, data, records_per_shard: int = 10000, compression: Optional[str] = None):
+    """
+    dataをまとめて書き出す。
+    """
+    with RecordWriter(directory, records_per_shard=records_per_shard, compression=compression) as writer:
+        writer.write(data)
+
+
+class RecordReader:
+    """
+    i件目のレコードをインデックスから位置を求めて1回の読み込みで取り出す。
+    os.preadで読むので、複数スレッドから同時に使える。
+    """
+
+    def __init__(self, directory, verify: bool = True) -> None:
+        """
+        Args:
+            directory: write_recordsの出力ディレクトリ
+            verify(bool): 読み込み時にCRCを確認するか
+        """
+        self.__directory = Path(directory)
+        with open(self.__directory / _MANIFEST) as f:
+            manifest = json.load(f)
+        if manifest.get("format") != _FORMAT:
+            raise Exception(f"{directory}は{_FORMAT}の形式ではありません。")
+
+        self.__verify = verify
+        self.__type = import_type(manifest["type"])
+        self.__row_dtype = _row_dtype(manifest["fields"])
+        self.__count = manifest["count"]
+        self.__records_per_shard = manifest["records_per_shard"]
+        self.__compression = manifest["compression"]
+        self.__decompress = _COMPRESSORS[self.__compression][1]
+        self.__shards = manifest["shards"]
+        self.__indices = [np.load(self.__directory / shard["index"], mmap_mode="r") for shard in self.__shards]
+        self.__fds = [os.open(self.__directory / shard["file"], os.O_RDONLY) for shard in self.__shards]
+
+    def __len__(self):
+        return self.__count
+
+    @property
+    def num_shards(self) -> int:
+        return len(self.__shards)
+
+    def __getitem__(self, i: int):
+        """
+        i件目のレコード(各フィールドが1件分の配列のNamedTuple)
+        """
+        if not -self.__count <= i < self.__count:
+            raise IndexError(i)
+        return self.__to_data(self.__read_rows([i % self.__count])[0])
+
+    def take(self, ids) -> "object":
+        """
+        idsの各件を集めたバッチ(各フィールドの先頭の次元が件数のNamedTuple)
+        """
+        return self.__to_data(self.__read_rows(ids))
+
+    def read_shard(self, k: int):
+        """
+        k番目のシャード全体
+        """
+        path = self.__directory / self.__shards[k]["file"]
+        with open(path, "rb") as f:
+            buffer = f.read()
+        offsets = self.__indices[k]
+        payloads = [self.__payload(buffer, int(offsets[j]), path, j) for j in range(len(offsets) - 1)]
+        return self.__to_data(self.__rows_from_payloads(payloads))
+
+    def iter_shards(self, num_workers: int = 4, queue_size: int = 4) -> Iterator:
+        """
+        シャードを複数スレッドで先読みしながら順番に返す。
+        """
+        with Prefetcher(range(self.num_shards), num_workers, queue_size, transform=self.read_shard) as shards:
+            yield from shards
+
+    def batches(self, sampler) -> Iterator:
+        """
+        PermutationSampler等が返すインデックスごとにバッチを返す。
+        """
+        for ids in sampler:
+            yield self.take(ids)
+
+    def close(self):
+        for fd in self.__fds:
+            os.close(fd)
+        self.__fds = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def __read_rows(self, ids) -> "np.ndarray":
+        payloads = []
+        for i in ids:
+            k, j = divmod(int(i), self.__records_per_shard)
+            head = int(self.__indices[k][j])
+            tail = int(self.__indices[k][j + 1])
+            buffer = os.pread(self.__fds[k], tail - head, head)
+            payloads.append(self.__payload(buffer, 0, self.__shards[k]["file"], j))
+        return self.__rows_from_payloads(payloads)
+
+    def __payload(self, buffer: bytes, head: int, path, index: int) -> bytes:
+        length, crc = _HEADER.unpack_from(buffer, head)
+        body = buffer[head + _HEADER.size:head + _HEADER.size + length]
+        if self.__verify and zlib.crc32(body) != crc:
+            raise RecordCorruptedError(path, index)
+        return self.__decompress(body)
+
+    def __rows_from_payloads(self, payloads: List[bytes]) -> "np.ndarray":
+        return np.frombuffer(b"".join(payloads), dtype=self.__row_dtype)
+
+    def __to_data(self, rows: "np.ndarray"):
+        return self.__type(**{name: rows[name] for name in self.__row_dtype.names})
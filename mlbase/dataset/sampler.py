@@ -0,0 +1,120 @@
+"""
+エポックごとに非復元抽出でインデックスを取り出すサンプラー。
+"""
+import json
+import os
+from pathlib import Path
+
+from mlbase.lazy import numpy as np
+
+
+class PermutationSampler:
+    """
+    エポックごとにシャッフルしたインデックスをbatch_sizeずつ返す。
+    エポックeの並びは(seed, e)から作る乱数生成器で決まるので、状態は(epoch, cursor)だけで復元できる。
+
+    >>> sampler = PermutationSampler(5, 2, seed=0)
+    >>> ids = [next(sampler) for _ in range(5)]
+    >>> sorted(int(i) for i in np.concatenate(ids)[:5])
+    [0, 1, 2, 3, 4]
+    >>> sampler.state_dict()["epoch"], sampler.state_dict()["cursor"]
+    (2, 0)
+    """
+
+    def __init__(self, total_count: int, batch_size: int, seed: int = 0, rank: int = 0, world_size: int = 1) -> None:
+        """
+        Args:
+            total_count(int): データ数
+            batch_size(int): バッチサイズ
+            seed(int): 乱数のシード
+            rank(int): データ並列で学習する場合のワーカー番号
+            world_size(int): ワーカー数。各エポックの並びをworld_size個に分け、rank番目だけを返す。
+        """
+        assert total_count >= world_size > rank >= 0
+        assert batch_size > 0
+        self.__total_count = total_count
+        self.__batch_size = batch_size
+        self.__seed = seed
+        self.__rank = rank
+        self.__world_size = world_size
+        self.__epoch = 0
+        self.__cursor = 0
+        self.__permutation = self.__make_permutation(0)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> "np.ndarray":
+        chunks = []
+        rest = self.__batch_size
+        while rest > 0:
+            head = self.__cursor
+            tail = min(head + rest, len(self.__permutation))
+            chunks.append(self.__permutation[head:tail])
+            rest -= tail - head
+            self.__cursor = tail
+            if self.__cursor == len(self.__permutation):
+                self.__set_position(self.__epoch + 1, 0)
+        return chunks[0] if len(chunks) == 1 else np.concatenate(chunks)
+
+    @property
+    def epoch(self) -> int:
+        return self.__epoch
+
+    def state_dict(self) -> dict:
+        """
+        再開に必要な状態。json.dumpできる。
+        """
+        return {
+            "seed": self.__seed,
+            "total_count": self.__total_count,
+            "batch_size": self.__batch_size,
+            "rank": self.__rank,
+            "world_size": self.__world_size,
+            "epoch": self.__epoch,
+            "cursor": self.__cursor,
+        }
+
+    def load_state_dict(self, state: dict):
+        keys = ["seed", "total_count", "rank", "world_size"]
+        saved = [state.get(key, default) for key, default in zip(keys, [None, None, 0, 1])]
+        if saved != [self.__seed, self.__total_count, self.__rank, self.__world_size]:
+            raise Exception("サンプラーの設定(seed, total_count, rank, world_size)が保存時と異なります。")
+        self.__batch_size = state["batch_size"]
+        self.__set_position(state["epoch"], state["cursor"])
+
+    def save(self, path):
+        save_sampler_state(path, self.state_dict())
+
+    def load(self, path):
+        self.load_state_dict(load_sampler_state(path))
+
+    def __set_position(self, epoch: int, cursor: int):
+        if epoch != self.__epoch:
+            self.__permutation = self.__make_permutation(epoch)
+        self.__epoch = epoch
+        self.__cursor = cursor
+
+    def __make_permutation(self, epoch: int) -> "np.ndarray":
+        rng = np.random.default_rng([self.__seed, epoch])
+        return rng.permutation(self.__total_count)[self.__rank::self.__world_size]
+
+
+def sampler_state_path(checkpoint) -> Path:
+    """
+    チェックポイントに対応するサンプラーの状態ファイル
+    """
+    return Path(f"{checkpoint}.sampler.json")
+
+
+def save_sampler_state(path, state: dict):
+    path = Path(path)
+    tmp = path.parent / f".{path.name}.tmp{os.getpid()}"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+def load_sampler_state(path) -> dict:
+    with open(path) as f:
+        return json.load(f)
@@ -0,0 +1,194 @@
+"""
+読み込んだデータセット(ndarrayを含むNamedTuple)を共有メモリに置き、同じホストの他のプロセスから読み込み専用で使う。
+
+レジストリのディレクトリに{name}.jsonを置き、共有メモリの名前と配列の形状、ホストしているプロセスのpidを書く。
+ホストしているプロセスが終了していれば、そのエントリは無効とみなす。
+"""
+import fcntl
+import json
+import os
+from contextlib import contextmanager
+from multiprocessing import shared_memory, resource_tracker
+from pathlib import Path
+from typing import Any, Callable, List, Optional, Tuple
+
+from mlbase.lazy import numpy as np
+from mlbase.utils.array_tree import dump_tree, load_tree
+from mlbase.utils.misc import get_tool_path
+
+_ATTACHED: List[shared_memory.SharedMemory] = []
+# このプロセスで作成した共有メモリ(resource_trackerの管理下に残す)
+_HOSTED_NAMES: set = set()
+
+
+def default_registry() -> Path:
+    return get_tool_path().cache / "shared_datasets"
+
+
+def _is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _open_shared_memory(name: str) -> shared_memory.SharedMemory:
+    """
+    既存の共有メモリを開く。
+    開いた側のプロセスの終了時に共有メモリが消されないよう、resource_trackerの管理から外す。
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # python3.12以前
+        shm = shared_memory.SharedMemory(name=name)
+        if name not in _HOSTED_NAMES:
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+def _as_array(shm: shared_memory.SharedMemory, spec: dict) -> "np.ndarray":
+    array = np.ndarray(spec["shape"], dtype=np.dtype(spec["dtype"]), buffer=shm.buf)
+    array.setflags(write=False)
+    return array
+
+
+@contextmanager
+def _locked(path: Path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class SharedDatasetHost:
+    """
+    データセットを共有メモリにコピーしてレジストリに登録する。
+    closeすると登録を消して共有メモリを解放する(既に読み込んでいるプロセスのビューはそのまま使える)。
+    """
+
+    def __init__(self, name: str, obj, registry=None) -> None:
+        """
+        Args:
+            name(str): 登録名
+            obj: ndarrayを含むNamedTuple
+            registry: レジストリのディレクトリ
+        """
+        self.__name = name
+        self.__registry = Path(registry) if registry is not None else default_registry()
+        self.__blocks: List[shared_memory.SharedMemory] = []
+        self.__arrays: dict = {}
+
+        specs = {}
+
+        def put_array(key, array):
+            array = np.ascontiguousarray(array)
+            shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            self.__blocks.append(shm)
+            _HOSTED_NAMES.add(shm.name)
+            spec = {"shm": shm.name, "shape": list(array.shape), "dtype": array.dtype.str}
+            shared = np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)
+            shared[...] = array
+            shared.setflags(write=False)
+            specs[key] = spec
+            self.__arrays[key] = shared
+
+        try:
+            manifest = dump_tree(obj, put_array)
+            self.__data = load_tree(manifest, self.__arrays.__getitem__)
+            entry = {"pid": os.getpid(), "tree": manifest, "arrays": specs}
+            self.__registry.mkdir(parents=True, exist_ok=True)
+            path = self.__entry_path()
+            tmp = path.parent / f".{path.name}.tmp{os.getpid()}"
+            with open(tmp, "w") as f:
+                json.dump(entry, f)
+            os.replace(tmp, path)
+        except Exception:
+            self.__release()
+            raise
+
+    @property
+    def data(self):
+        """
+        共有メモリ上のデータセット(読み込み専用)
+        """
+        return self.__data
+
+    def close(self):
+        path = self.__entry_path()
+        if path.exists():
+            with open(path) as f:
+                pid = json.load(f).get("pid")
+            if pid == os.getpid():
+                path.unlink()
+        self.__release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def __entry_path(self) -> Path:
+        return self.__registry / f"{self.__name}.json"
+
+    def __release(self):
+        self.__arrays = {}
+        self.__data = None
+        for shm in self.__blocks:
+            try:
+                shm.close()
+            except BufferError:
+                # ビューが残っている場合はマップを残し、名前だけ消す
+                pass
+            shm.unlink()
+            _HOSTED_NAMES.discard(shm.name)
+        self.__blocks = []
+
+
+def attach_dataset(name: str, registry=None) -> Optional[Any]:
+    """
+    ホストされているデータセットを読み込み専用のビューとして取得する。
+    ホストされていなければNoneを返す。
+    """
+    registry = Path(registry) if registry is not None else default_registry()
+    path = registry / f"{name}.json"
+    if not path.exists():
+        return None
+    with open(path) as f:
+        entry = json.load(f)
+    if not _is_alive(entry["pid"]):
+        return None
+
+    blocks = {}
+    try:
+        for key, spec in entry["arrays"].items():
+            blocks[key] = _open_shared_memory(spec["shm"])
+    except FileNotFoundError:
+        for shm in blocks.values():
+            shm.close()
+        return None
+
+    _ATTACHED.extend(blocks.values())
+    return load_tree(entry["tree"], lambda key: _as_array(blocks[key], entry["arrays"][key]))
+
+
+def attach_or_host(name: str, load: Callable[[], Any], registry=None) -> Tuple[Any, Optional[SharedDatasetHost]]:
+    """
+    ホストされていれば読み込み、されていなければloadで読み込んでホストする。
+    同時に起動したプロセスが二重に読み込まないよう、レジストリのロックファイルで排他する。
+    Return: (データセット, ホストした場合はSharedDatasetHost)
+    """
+    registry = Path(registry) if registry is not None else default_registry()
+    with _locked(registry / f"{name}.lock"):
+        data = attach_dataset(name, registry)
+        if data is not None:
+            return data, None
+        host = SharedDatasetHost(name, load(), registry)
+        return host.data, host
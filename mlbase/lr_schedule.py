@@ -0,0 +1,161 @@
+"""
+学習率のスケジュールをハイパーパラメータのファイルで指定し、ステップごとの値を配列にしておく。
+訓練中は配列を引くだけで学習率が決まる。
+
+ハイパーパラメータの例:
+global:
+  learning_rate: 0.1
+  total_step: 300000
+lr_schedule:
+  type: warmup
+  warmup_steps: 1000
+  then:
+    type: cosine
+    min_lr: 0.0001
+
+>>> table = compile_schedule({"type": "step", "every": 2, "gamma": 0.5}, base_lr=1.0, total_step=5)
+>>> table[1:].tolist()
+[1.0, 1.0, 0.5, 0.5, 0.25]
+"""
+import sys
+from typing import Callable, Dict, Optional
+
+import mlbase.hyper_param as hp
+from mlbase.utils.cli import Command
+from mlbase.lazy import numpy as np
+
+LR_SCHEDULE_COLLECTION = "lr_schedule"
+# lr_scheduleがない場合は、以前の固定の減衰(100000ステップごとに0.2倍)と同じにする
+DEFAULT_SCHEDULE = {"type": "step", "every": 100000, "gamma": 0.2}
+
+_SCHEDULES: Dict[str, Callable] = {}
+
+
+def schedule_type(name: str):
+    """
+    スケジュールを登録する。
+    登録する関数は(steps, base_lr, total_step, **設定)を受け取り、各ステップの学習率の配列を返す。
+    stepsは1始まりのステップ数の配列。
+    """
+
+    def _register(fn: Callable):
+        assert name not in _SCHEDULES
+        _SCHEDULES[name] = fn
+        return fn
+
+    return _register
+
+
+@schedule_type("constant")
+def constant(steps, base_lr, total_step):
+    return np.full(steps.shape, base_lr, dtype=np.float64)
+
+
+@schedule_type("step")
+def step_decay(steps, base_lr, total_step, every, gamma):
+    """
+    everyステップごとにgamma倍する
+    """
+    return base_lr * gamma ** ((steps - 1) // every)
+
+
+@schedule_type("piecewise")
+def piecewise(steps, base_lr, total_step, boundaries, values):
+    """
+    boundaries[i]ステップまではvalues[i]、最後の境界より後はvalues[-1]
+    """
+    assert len(values) == len(boundaries) + 1
+    return np.asarray(values, dtype=np.float64)[np.searchsorted(boundaries, steps, side="left")]
+
+
+@schedule_type("cosine")
+def cosine(steps, base_lr, total_step, min_lr=0.0):
+    progress = (steps - 1) / max(total_step - 1, 1)
+    return min_lr + (base_lr - min_lr) * 0.5 * (1 + np.cos(np.pi * progress))
+
+
+@schedule_type("warmup")
+def warmup(steps, base_lr, total_step, warmup_steps, then=None):
+    """
+    warmup_stepsまで線形に上げ、その後はthenのスケジュールに従う
+    """
+    after = compile_schedule(then, base_lr, total_step)[steps]
+    scale = np.minimum(steps / warmup_steps, 1.0)
+    return after * scale
+
+
+@schedule_type("one_cycle")
+def one_cycle(steps, base_lr, total_step, pct_start=0.3, div_factor=25.0, final_div_factor=1e4):
+    """
+    base_lr/div_factorからbase_lrまでコサインで上げ、base_lr/div_factor/final_div_factorまで下げる
+    """
+    initial_lr = base_lr / div_factor
+    final_lr = initial_lr / final_div_factor
+    peak = max(int(total_step * pct_start), 1)
+
+    def _anneal(start, end, progress):
+        return end + (start - end) * 0.5 * (1 + np.cos(np.pi * progress))
+
+    up = _anneal(initial_lr, base_lr, (steps - 1) / peak)
+    down = _anneal(base_lr, final_lr, (steps - 1 - peak) / max(total_step - 1 - peak, 1))
+    return np.where(steps - 1 < peak, up, down)
+
+
+def compile_schedule(config: Optional[dict], base_lr: float, total_step: int) -> "np.ndarray":
+    """
+    スケジュールの設定から、ステップ数をインデックスとする学習率の配列を作る。
+    Args:
+        config: typeとスケジュールごとの設定を持つ辞書。Noneなら定数。
+        base_lr(float): 基準の学習率
+        total_step(int): 全ステップ数
+    Return: shapeが[total_step + 1]の配列。i番目がステップiの学習率(0番目は1番目と同じ)。
+    """
+    config = {"type": "constant"} if config is None else dict(config)
+    name = config.pop("type")
+    if name not in _SCHEDULES:
+        raise Exception(f"不明なスケジュールです: {name}")
+
+    steps = np.arange(1, total_step + 1)
+    values = _SCHEDULES[name](steps, base_lr, total_step, **config)
+    return np.concatenate([values[:1], values]).astype(np.float32)
+
+
+def get_schedule_config() -> dict:
+    """
+    読み込み済みのハイパーパラメータからスケジュールの設定を取り出す。
+    """
+    return hp.get_all().get(LR_SCHEDULE_COLLECTION) or DEFAULT_SCHEDULE
+
+
+def compile_schedule_from_hyper_param() -> "np.ndarray":
+    return compile_schedule(
+        get_schedule_config(), hp.get_hyper_param("learning_rate"), hp.get_hyper_param("total_step")
+    )
+
+
+def dump_schedule(table: "np.ndarray", output=sys.stdout, every: int = 1):
+    """
+    学習率の推移をCSVで書き出す
+    """
+    print("step,learning_rate", file=output)
+    for step in range(1, len(table), every):
+        print(f"{step},{table[step]:.8g}", file=output)
+
+
+def lr_schedule_command() -> Command:
+    cmd = Command("lr_schedule", "ハイパーパラメータの学習率スケジュールをCSVで出力する")
+    cmd.option("--param", required=True)
+    cmd.option("--output", help="出力先のCSV。省略すると標準出力")
+    cmd.option("--every", type=int, default=1, help="何ステップごとに出力するか")
+
+    @cmd
+    def run_lr_schedule(args, *_, **__):
+        hp.open_hyper_param(args.param)
+        table = compile_schedule_from_hyper_param()
+        if args.output is None:
+            dump_schedule(table, every=args.every)
+        else:
+            with open(args.output, "w") as f:
+                dump_schedule(table, f, every=args.every)
+
+    return cmd
@@ -23,20 +23,31 @@ __B__
 __A__
 """
 
-from typing import Callable
+from typing import Callable, Optional
+
+from mlbase.utils.step_timer import StepTimer
 
 
 class StepManager():
-    def __init__(self, initial_step=1, final_step=None):
+    def __init__(self, initial_step=1, final_step=None, timer: Optional[StepTimer] = None):
+        """
+        Args:
+            timer: 指定するとステップごとの時間を計測する
+        """
         self.__initial_step = initial_step
         self.__final_step = final_step
         self.__current_step = initial_step
         self.__finished = False
+        self.__timer = timer
         self.__check_finished()
 
     def __call__(self, func: Callable[[], None]):
+        if self.__timer is not None:
+            self.__timer.start()
         while not self.__finished:
             func()
+            if self.__timer is not None:
+                self.__timer.step()
             self.__current_step += 1
             self.__check_finished()
 
@@ -0,0 +1,131 @@
+"""
+train_cifarのチェックポイントを別プロセスで評価する。
+チェックポイントのディレクトリを監視し、新しいものを評価して結果をJSONLに追記する。
+
+$ mlbase research train_cifar --validate_interval 0 --output ckpt ... &
+$ mlbase research evaluate_cifar --checkpoint_dir ckpt --metrics ckpt/metrics.jsonl ...
+"""
+import json
+import time
+from importlib import import_module
+from pathlib import Path
+from typing import Optional, Set
+
+import mlbase.hyper_param as hp
+from mlbase.utils.cli import Command
+from mlbase.logger import info, error
+from mlbase.utils.checkpoint import CheckpointManager, CheckpointEntry
+from mlbase.utils.misc import restore_variables
+from mlbase.dataset.augment import get_augmenter
+from mlbase.template.cifar.train import (
+    DataSet,
+    load_dataset,
+    add_dataset_options,
+    get_cifar_interface,
+    apply_if_to_module,
+    validate,
+    validate_metrics,
+)
+from mlbase.lazy import tensorflow as tf
+
+
+def load_evaluated_steps(metrics_path) -> Set[int]:
+    """
+    評価済みのステップ
+    """
+    if metrics_path is None or not Path(metrics_path).exists():
+        return set()
+    with open(metrics_path) as f:
+        return {json.loads(line)["step"] for line in f if line.strip()}
+
+
+def append_metrics(metrics_path, record: dict):
+    with open(metrics_path, "a") as f:
+        f.write(json.dumps(record) + "\n")
+
+
+def run(args, *_, **__):
+    hp.open_hyper_param(args.param)
+    dataset: DataSet = load_dataset(args)
+    augmenter = get_augmenter(hp.get_all().get("augmentation"))
+    total_step = hp.get_hyper_param("total_step")
+
+    model_if = get_cifar_interface()
+    module = hp.get_hyper_param("model", dtype=import_module)
+    _, score, logits = apply_if_to_module(model_if, module)
+
+    manager = CheckpointManager(args.checkpoint_dir)
+    evaluated = load_evaluated_steps(args.metrics)
+    last_step = max(evaluated, default=0)
+    failed: Set[int] = set()  # 読み込めなかったステップ。チェックポイントは原子的に書かれるので再試行しない
+
+    with tf.Session() as sess:
+        sess.run(tf.global_variables_initializer())
+        while True:
+            for entry in manager.entries():
+                if entry.step in evaluated or entry.step in failed:
+                    continue
+                try:
+                    values = manager.restore(entry)
+                except Exception as e:
+                    # 世代管理で消された、壊れている等
+                    error(f"{entry.path}を読み込めませんでした(以降スキップします): {e}")
+                    failed.add(entry.step)
+                    last_step = max(last_step, entry.step)
+                    continue
+
+                restore_variables(sess, values)
+                start = time.time()
+                if logits is None:
+                    accuracy = validate(
+                        sess, dataset.test, dataset.meta, score, model_if, augmenter, batch_size=args.batch_size
+                    )
+                    record = _record(entry, accuracy, time.time() - start)
+                else:
+                    metrics = validate_metrics(
+                        sess, dataset.test, dataset.meta, logits, model_if, augmenter, batch_size=args.batch_size
+                    )
+                    accuracy = metrics.fine.accuracy
+                    record = _record(entry, accuracy, time.time() - start, metrics.summary())
+                append_metrics(args.metrics, record)
+                info(f"step {entry.step}: {accuracy}")
+                evaluated.add(entry.step)
+                last_step = max(last_step, entry.step)
+
+            if args.once or last_step >= total_step:
+                break
+            time.sleep(args.poll_interval)
+
+
+def _record(entry: CheckpointEntry, accuracy, elapsed, metrics: Optional[dict] = None) -> dict:
+    record = {
+        "step": entry.step,
+        "checkpoint": entry.path,
+        "accuracy": float(accuracy),
+        "elapsed": elapsed,
+        "time": time.time(),
+    }
+    if metrics is not None:
+        record["metrics"] = metrics
+    return record
+
+
+def evaluate_cifar_command() -> Command:
+    cmd = Command("evaluate_cifar", "cifar100のチェックポイントを監視して評価する")
+    cmd(run)
+    cmd.option("--checkpoint_dir", required=True, help="train_cifarの--output")
+    add_dataset_options(cmd)
+    cmd.option("--param", required=True)
+    cmd.option("--metrics", required=True, help="評価結果を追記するJSONLファイル")
+    cmd.option("--batch_size", type=int, default=1000)
+    cmd.option("--poll_interval", type=float, default=30.0, help="チェックポイントを確認する間隔(秒)")
+    cmd.option("--once", action="store_true", help="既存のチェックポイントを評価したら終了する")
+    return cmd
+
+
+def main():
+    evaluate_cifar_command().start()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,261 @@
+"""
+cifarのデータ並列の訓練(CPU)。
+N個のワーカープロセスがサンプラーの別々のシャードで学習し、sync_everyステップごとにパラメータを平均する。
+データセットは共有メモリに置き、各ワーカーはそれを参照する。
+"""
+import json
+import os
+import queue
+import time
+import multiprocessing
+from importlib import import_module
+from typing import List, NamedTuple, Optional
+
+import mlbase.hyper_param as hp
+from mlbase.utils.cli import Command
+from mlbase.logger import info
+from mlbase.utils.allreduce import SharedAverager
+from mlbase.utils.checkpoint import CheckpointManager
+from mlbase.utils.misc import snapshot_variables
+from mlbase.dataset.augment import get_augmenter
+from mlbase.dataset.prefetch import Prefetcher
+from mlbase.dataset.sampler import PermutationSampler
+from mlbase.dataset.shared import attach_dataset, attach_or_host
+from mlbase.lr_schedule import compile_schedule_from_hyper_param
+from mlbase.template.cifar.train import (
+    get_cifar_interface,
+    apply_if_to_module,
+    sampled_batchnizer,
+    augment_batch,
+    load_cached,
+    add_dataset_options,
+)
+from mlbase.lazy import (
+    tensorflow as tf,
+    numpy as np,
+)
+
+
+class WorkerConfig(NamedTuple):
+    param: str
+    shared_dataset: str
+    output: Optional[str]
+    max_to_keep: int
+    total_step: int
+    batch_size: int
+    sync_every: int
+    threads: int
+
+
+class WorkerResult(NamedTuple):
+    rank: int
+    steps: int
+    samples: int
+    elapsed: float
+    sync_time: float
+
+
+class RunResult(NamedTuple):
+    num_workers: int
+    steps: int
+    samples_per_sec: float
+    steps_per_sec: float
+    sync_ratio: float
+
+
+def _build(model_if):
+    module = hp.get_hyper_param("model", dtype=import_module)
+    train, _, _ = apply_if_to_module(model_if, module)
+    variables = [v for v in tf.global_variables() if v.dtype.base_dtype.is_floating]
+    return train, variables
+
+
+def count_parameters(param: str) -> int:
+    """
+    平均をとるパラメータの要素数
+    """
+    hp.open_hyper_param(param)
+    with tf.Graph().as_default():
+        _, variables = _build(get_cifar_interface())
+        return int(sum(np.prod(v.shape.as_list()) for v in variables))
+
+
+def _sync(sess, variables, averager: SharedAverager, rank: int):
+    values = sess.run(variables)
+    flat = np.concatenate([value.ravel() for value in values]).astype(np.float32)
+    averaged = averager.average(rank, flat)
+    head = 0
+    for v, value in zip(variables, values):
+        tail = head + value.size
+        v.load(averaged[head:tail].reshape(value.shape), sess)
+        head = tail
+
+
+def _worker(rank: int, world_size: int, config: WorkerConfig, averager: SharedAverager, results):
+    hp.open_hyper_param(config.param)
+    dataset = attach_dataset(config.shared_dataset)
+    seed = hp.get_hyper_param_or_default("seed", default=0)
+    tf.set_random_seed(seed)
+
+    model_if = get_cifar_interface()
+    train, variables = _build(model_if)
+    lr_table = compile_schedule_from_hyper_param()
+    augmenter = get_augmenter(hp.get_all().get("augmentation"), seed=seed + rank)
+    sampler = PermutationSampler(
+        dataset.meta.train_data_count, config.batch_size, seed=seed, rank=rank, world_size=world_size
+    )
+    checkpoints = CheckpointManager(config.output, config.max_to_keep) if rank == 0 and config.output else None
+
+    session_config = tf.ConfigProto(
+        intra_op_parallelism_threads=config.threads,
+        inter_op_parallelism_threads=1,
+    )
+    batches = Prefetcher(
+        sampled_batchnizer(dataset.train, sampler),
+        transform=None if augmenter is None else augment_batch(augmenter),
+    )
+    with tf.Session(config=session_config) as sess, batches:
+        sess.run(tf.global_variables_initializer())
+        # 初期値をそろえる
+        _sync(sess, variables, averager, rank)
+
+        sync_time = 0.0
+        start = time.perf_counter()
+        for i in range(1, config.total_step + 1):
+            img, label_c, label_f, sampler_state = next(batches)
+            feed_dict = model_if.feed_dict(
+                {
+                    "input_images": img,
+                    "coarse_labels": label_c,
+                    "fine_labels": label_f,
+                    "is_training": True,
+                    "learning_rate": lr_table[min(i, len(lr_table) - 1)],
+                }
+            )
+            sess.run(train, feed_dict)
+
+            if world_size > 1 and (i % config.sync_every == 0 or i == config.total_step):
+                sync_start = time.perf_counter()
+                _sync(sess, variables, averager, rank)
+                sync_time += time.perf_counter() - sync_start
+
+            if checkpoints is not None and (i % 10000 == 0 or i == config.total_step):
+                extra = {"sampler": sampler_state, "world_size": world_size}
+                checkpoints.save(i, snapshot_variables(sess), extra=extra)
+        elapsed = time.perf_counter() - start
+
+    if checkpoints is not None:
+        checkpoints.close()
+    averager.close()
+    results.put(
+        WorkerResult(
+            rank=rank,
+            steps=config.total_step,
+            samples=config.total_step * config.batch_size,
+            elapsed=elapsed,
+            sync_time=sync_time,
+        )
+    )
+
+
+def launch(config: WorkerConfig, num_workers: int, num_parameters: int) -> RunResult:
+    """
+    ワーカーを起動し、終了を待って全体のスループットを返す。
+    どれかのワーカーが異常終了したら残りも止める。
+    """
+    context = multiprocessing.get_context("spawn")
+    averager = SharedAverager(num_workers, num_parameters, context)
+    results = context.Queue()
+    workers = [
+        context.Process(target=_worker, args=(rank, num_workers, config, averager, results))
+        for rank in range(num_workers)
+    ]
+    try:
+        for worker in workers:
+            worker.start()
+
+        outputs: List[WorkerResult] = []
+        while len(outputs) < num_workers:
+            try:
+                outputs.append(results.get(timeout=1.0))
+            except queue.Empty:
+                failed = [worker for worker in workers if worker.exitcode not in (None, 0)]
+                if failed:
+                    raise Exception(f"ワーカーが異常終了しました(exitcode={failed[0].exitcode})")
+        for worker in workers:
+            worker.join()
+    finally:
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+        averager.close()
+
+    elapsed = max(output.elapsed for output in outputs)
+    samples = sum(output.samples for output in outputs)
+    return RunResult(
+        num_workers=num_workers,
+        steps=config.total_step,
+        samples_per_sec=samples / elapsed,
+        steps_per_sec=config.total_step / elapsed,
+        sync_ratio=max(output.sync_time for output in outputs) / elapsed,
+    )
+
+
+def run(args, *_, **__):
+    hp.open_hyper_param(args.param)
+    name = args.shared_dataset or f"train_cifar_parallel_{os.getpid()}"
+    _, host = attach_or_host(name, lambda: load_cached(args.data_path, args.cache_path, args.cache_format))
+
+    threads = args.threads_per_worker or max(os.cpu_count() // args.num_workers, 1)
+    config = WorkerConfig(
+        param=args.param,
+        shared_dataset=name,
+        output=args.output,
+        max_to_keep=args.max_to_keep,
+        total_step=hp.get_hyper_param("total_step"),
+        batch_size=args.batch_size,
+        sync_every=args.sync_every,
+        threads=threads,
+    )
+    num_parameters = count_parameters(args.param)
+
+    try:
+        report = {}
+        if args.baseline_steps > 0:
+            # 比較対象は全コアを使う1プロセスの訓練
+            baseline_config = config._replace(output=None, total_step=args.baseline_steps, threads=os.cpu_count())
+            baseline = launch(baseline_config, 1, num_parameters)
+            info(f"baseline(1 process, {os.cpu_count()} threads): {baseline.samples_per_sec:.1f} samples/sec")
+            report["baseline"] = baseline._asdict()
+
+        result = launch(config, args.num_workers, num_parameters)
+        info(f"{args.num_workers} workers: {result.samples_per_sec:.1f} samples/sec (同期 {result.sync_ratio:.1%})")
+        report["parallel"] = result._asdict()
+
+        if args.baseline_steps > 0:
+            speedup = result.samples_per_sec / baseline.samples_per_sec
+            info(f"1プロセスに対する速度比: x{speedup:.2f}")
+            report["speedup_vs_single_process"] = speedup
+
+        if args.report:
+            with open(args.report, "w") as f:
+                json.dump(report, f, indent=2)
+    finally:
+        if host is not None:
+            host.close()
+
+
+def train_cifar_parallel_command() -> Command:
+    cmd = Command("train_cifar_parallel", "cifar100の複数プロセスによるデータ並列の訓練(CPU)")
+    cmd(run)
+    add_dataset_options(cmd)
+    cmd.option("--param", required=True)
+    cmd.option("--output", help="チェックポイントを保存するディレクトリ")
+    cmd.option("--max_to_keep", type=int, default=5)
+    cmd.option("--num_workers", type=int, default=2, help="ワーカープロセス数")
+    cmd.option("--batch_size", type=int, default=50, help="ワーカーあたりのバッチサイズ")
+    cmd.option("--sync_every", type=int, default=1, help="パラメータを平均するステップ間隔")
+    cmd.option("--threads_per_worker", type=int, help="ワーカーあたりのスレッド数。省略するとコア数/ワーカー数")
+    cmd.option("--baseline_steps", type=int, default=0, help="全コアを使う1プロセスでこのステップ数だけ先に実行し、それに対する速度比を計算する")
+    cmd.option("--report", help="スループットをJSONで書き出すファイル")
+    return cmd
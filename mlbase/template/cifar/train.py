@@ -1,14 +1,24 @@
-import sys
-from typing import NamedTuple, List
-import itertools as it
+import atexit
+import signal
+from typing import NamedTuple, List, Optional
 from importlib import import_module
 from pathlib import Path
 
 import mlbase.hyper_param as hp
 from mlbase.utils.cli import Command
+from mlbase.logger import info
 from mlbase.model_interface import ModelInterface, Role
-from mlbase.utils.cache import cache_pickle
-from mlbase.utils.misc import counting_iter, maybe_restore
+from mlbase.utils.cache import cache_pickle, cache_npy
+from mlbase.utils.misc import counting_iter, maybe_restore, snapshot_variables
+from mlbase.utils.step_timer import StepTimer
+from mlbase.utils.metrics import ClassificationMetrics
+from mlbase.lr_schedule import compile_schedule_from_hyper_param
+from mlbase.utils.checkpoint import CheckpointManager, CheckpointEntry
+from mlbase.dataset.fixed_record import record_dtype, read_records_from_files, chw_to_hwc
+from mlbase.dataset.prefetch import Prefetcher
+from mlbase.dataset.augment import BatchAugmenter, get_augmenter
+from mlbase.dataset.shared import attach_or_host
+from mlbase.dataset.sampler import PermutationSampler, sampler_state_path
 from mlbase.lazy import (
     tensorflow as tf,
     numpy as np,
@@ -34,21 +44,36 @@ class DataSet(NamedTuple):
     meta: MetaData
 
 
+CIFAR10_RECORD = [("label", "u1", ()), ("image", "u1", (3, 32, 32))]
+CIFAR100_RECORD = [("coarse_label", "u1", ()), ("fine_label", "u1", ()), ("image", "u1", (3, 32, 32))]
+
+
 def load(data_dir) -> DataSet:
-    coarse_labels_path = Path(data_dir) / 'coarse_label_names.txt'
-    fine_labels_path = Path(data_dir) / 'fine_label_names.txt'
-    test_path = Path(data_dir) / 'test.bin'
-    train_path = Path(data_dir) / 'train.bin'
+    """
+    cifar-100-binaryまたはcifar-10-batches-binのディレクトリを読み込む。
+    """
+    data_dir = Path(data_dir)
+    if (data_dir / 'train.bin').exists():
+        coarse_labels_path = data_dir / 'coarse_label_names.txt'
+        fine_labels_path = data_dir / 'fine_label_names.txt'
+        train_data = load_image_binary(data_dir / 'train.bin')
+        test_data = load_image_binary(data_dir / 'test.bin')
+    else:
+        # cifar10はラベルが1種類なので、coarseとfineに同じものを使う
+        coarse_labels_path = fine_labels_path = data_dir / 'batches.meta.txt'
+        train_paths = sorted(data_dir.glob('data_batch_*.bin'))
+        if not train_paths:
+            raise FileNotFoundError(f"{data_dir}にdata_batch_*.binがありません。")
+        train_data = load_image_binary(train_paths, record=CIFAR10_RECORD)
+        test_data = load_image_binary(data_dir / 'test_batch.bin', record=CIFAR10_RECORD)
 
-    train_data = load_image_binary(train_path)
-    test_data = load_image_binary(test_path)
     meta = load_meta_data(coarse_labels_path, fine_labels_path, train_data, test_data)
     return DataSet(train=train_data, test=test_data, meta=meta)
 
 
 def load_meta_data(coarse_labels_path, fine_labels_path, train_data: Data, test_data: Data) -> MetaData:
-    coarse_labels = [l.rstrip() for l in open(coarse_labels_path)]
-    fine_labels = [l.rstrip() for l in open(fine_labels_path)]
+    coarse_labels = [l.rstrip() for l in open(coarse_labels_path) if l.strip()]
+    fine_labels = [l.rstrip() for l in open(fine_labels_path) if l.strip()]
     train_data_count = len(train_data.images)
     test_data_count = len(test_data.images)
     return MetaData(
@@ -59,27 +84,20 @@ def load_meta_data(coarse_labels_path, fine_labels_path, train_data: Data, test_
     )
 
 
-def load_image_binary(path) -> Data:
-    clabels = []
-    flabels = []
-    images = []
-    with open(path, 'rb') as f:
-        for i in it.count():
-            data = f.read(32 * 32 * 3 + 2)
-            if not data:
-                break
-            sys.stdout.write(f"{i}\r")
-            clabel = data[0]
-            flabel = data[1]
-            image = list(data[2:])
-            clabels.append(clabel)
-            flabels.append(flabel)
-            images.append(image)
-    clabels = np.array(clabels)
-    flabels = np.array(flabels)
-    images_np = np.array(images, dtype=np.uint8)
-    images_np = images_np.reshape([-1, 3, 32, 32]).transpose([0, 2, 3, 1])
-    return Data(images=images_np, coarse_labels=clabels, fine_labels=flabels)
+def load_image_binary(path, record=CIFAR100_RECORD, mmap=True) -> Data:
+    """
+    cifarのバイナリを読み込む。各配列はファイル上のレコード配列のビューになる。
+    Args:
+        path: 入力ファイル。cifar10のtrainのように複数ある場合はリストで渡す(連結時にコピーされる)。
+        record: CIFAR10_RECORDかCIFAR100_RECORD
+        mmap(bool): np.memmapで読み込むか
+    """
+    paths = path if isinstance(path, (list, tuple)) else [path]
+    records = read_records_from_files(paths, record_dtype(record), mmap=mmap)
+    images = chw_to_hwc(records["image"])
+    if "label" in records.dtype.names:
+        return Data(images=images, coarse_labels=records["label"], fine_labels=records["label"])
+    return Data(images=images, coarse_labels=records["coarse_label"], fine_labels=records["fine_label"])
 
 
 def batchnizer(data: Data, batch_size, total_count):
@@ -88,6 +106,27 @@ def batchnizer(data: Data, batch_size, total_count):
         yield data.images[ids], data.coarse_labels[ids], data.fine_labels[ids]
 
 
+def sampled_batchnizer(data: Data, sampler: PermutationSampler):
+    """
+    samplerの順番でバッチを作る。
+    先読みされても再開位置がずれないよう、バッチを取り出した直後のsamplerの状態を一緒に返す。
+    """
+    for ids in sampler:
+        yield data.images[ids], data.coarse_labels[ids], data.fine_labels[ids], sampler.state_dict()
+
+
+def augment_batch(augmenter: BatchAugmenter):
+    """
+    バッチの画像にデータ拡張を行う関数を返す。Prefetcherのtransformに渡す。
+    """
+
+    def _augment(batch):
+        images, *others = batch
+        return (augmenter(images), *others)
+
+    return _augment
+
+
 def batchnizer_in_order(data: Data, batch_size, total_count):
     assert total_count >= 0
     assert batch_size > 0
@@ -117,23 +156,57 @@ class ScoreStore:
         return np.nan if total == 0 else self.__positive / total
 
 
-def validate(sess, test_data: Data, meta: MetaData, score, model_if):
-    test_batch = batchnizer_in_order(test_data, 10, meta.test_data_count)
-    test_score = ScoreStore()
-    for img, label_c, label_f in test_batch:
-        feed_dict = model_if.feed_dict(
-            {
-                "input_images": img,
-                "coarse_labels": label_c,
-                "fine_labels": label_f,
-                "is_training": False,
-            }
-        )
+class CifarMetrics(NamedTuple):
+    coarse: ClassificationMetrics
+    fine: ClassificationMetrics
+
+    def summary(self) -> dict:
+        return {"coarse": self.coarse.summary(), "fine": self.fine.summary()}
+
+
+def _test_feeds(test_data: Data, meta: MetaData, model_if, augmenter: Optional[BatchAugmenter], batch_size):
+    with Prefetcher(batchnizer_in_order(test_data, batch_size, meta.test_data_count)) as test_batch:
+        for img, label_c, label_f in test_batch:
+            feed_dict = model_if.feed_dict(
+                {
+                    "input_images": img if augmenter is None else augmenter.normalize(img),
+                    "coarse_labels": label_c,
+                    "fine_labels": label_f,
+                    "is_training": False,
+                }
+            )
+            yield feed_dict, label_c, label_f
+
 
+def validate(
+    sess, test_data: Data, meta: MetaData, score, model_if, augmenter: Optional[BatchAugmenter] = None, batch_size=10
+):
+    test_score = ScoreStore()
+    for feed_dict, _, _ in _test_feeds(test_data, meta, model_if, augmenter, batch_size):
         test_score.add(sess.run(score, feed_dict))
     return test_score.accuracy
 
 
+def validate_metrics(
+    sess, test_data: Data, meta: MetaData, logits, model_if, augmenter: Optional[BatchAugmenter] = None, batch_size=10
+) -> CifarMetrics:
+    """
+    テストデータを1回なめて、coarseとfineそれぞれの混同行列とtop-kの正解数を集計する。
+    モデルのモジュールがlogits(y)を定義している場合のみ使われる(apply_if_to_module参照)。
+    Args:
+        logits: (coarseのlogits, fineのlogits)
+    """
+    metrics = CifarMetrics(
+        coarse=ClassificationMetrics(len(meta.coarse_labels)),
+        fine=ClassificationMetrics(len(meta.fine_labels)),
+    )
+    for feed_dict, label_c, label_f in _test_feeds(test_data, meta, model_if, augmenter, batch_size):
+        logits_c, logits_f = sess.run(logits, feed_dict)
+        metrics.coarse.add(logits_c, label_c)
+        metrics.fine.add(logits_f, label_f)
+    return metrics
+
+
 def get_cifar_interface():
     model_if = ModelInterface("CifarClassification")
     model_if.add("input_images", tf.float32, [None, 32, 32, 3], "入力画像", Role.INPUT)
@@ -144,7 +217,15 @@ def get_cifar_interface():
     return model_if
 
 
-def __apply_if_to_module(model_if, module):
+def apply_if_to_module(model_if, module):
+    """
+    モデルのモジュール(hyper paramのmodelで指定)を入力に適用する。
+    モジュールはinference(x, is_training), loss(y, y_f, y_c), training(loss, lr), scoring(y, y_f, y_c)を定義する。
+
+    logits(y)は任意で、定義したモジュールだけが(coarseのlogits, fineのlogits)を返すものとして
+    validate_metricsによる混同行列とtop-kの集計を使う。定義していなければ従来どおりscoringとScoreStoreで検証する。
+    このリポジトリにはモデルのモジュールを同梱していないので、集計を使うにはモジュール側でlogitsを定義すること。
+    """
     x = model_if.get("input_images")
     y_c = model_if.get("coarse_labels")
     y_f = model_if.get("fine_labels")
@@ -154,57 +235,205 @@ def __apply_if_to_module(model_if, module):
     y = module.inference(x, is_training)
     train = module.training(module.loss(y, y_f, y_c), lr)
     score = module.scoring(y, y_f, y_c)
-    return train, score
+    logits = module.logits(y) if hasattr(module, "logits") else None
+    return train, score, logits
+
+
+_CACHE_FUNCS = {
+    "pickle": cache_pickle,
+    "npy": cache_npy,
+}
+# --cache_path省略時の保存先。形式ごとに分けて、pickleのファイルをnpyのディレクトリとして使わないようにする
+_CACHE_PATHS = {
+    "pickle": "_cifar100_cache.pkl",
+    "npy": "_cifar100_cache_npy",
+}
+
+
+def load_cached(data_path, cache_path, cache_format="pickle") -> DataSet:
+    """
+    Args:
+        cache_path: Noneならcache_formatごとの既定の保存先
+    """
+    cache = _CACHE_FUNCS[cache_format]
+    return cache(cache_path=cache_path or _CACHE_PATHS[cache_format], args=[data_path], func=load)
+
+
+def load_dataset(args) -> DataSet:
+    """
+    --shared_datasetが指定されていれば、共有メモリにホストされているものを使う。
+    ホストされていなければ読み込んでホストし、このプロセスの終了時に解放する。
+    """
+
+    def _load():
+        return load_cached(args.data_path, args.cache_path, args.cache_format)
+
+    if not args.shared_dataset:
+        return _load()
+
+    dataset, host = attach_or_host(args.shared_dataset, _load)
+    if host is None:
+        info(f"共有メモリの{args.shared_dataset}を使います")
+    else:
+        atexit.register(host.close)
+    return dataset
+
+
+def add_dataset_options(cmd: Command):
+    cmd.option("--data_path", required=True, type=Path, help="~/data/cifar-100-binary")
+    cmd.option("--cache_path", help="省略時はpickleなら_cifar100_cache.pkl、npyなら_cifar100_cache_npy")
+    cmd.option("--cache_format", choices=_CACHE_FUNCS.keys(), default="pickle", help="npyならディレクトリにmmap可能な形式で保存する")
+    cmd.option("--shared_dataset", help="共有メモリでデータセットを共有する際の名前")
 
 
 def run(args, *_, **__):
     hp.open_hyper_param(args.param)
-    dataset: DataSet = cache_pickle(cache_path=args.cache_path, args=[args.data_path], func=load)
+    dataset = load_dataset(args)
 
     model_if = get_cifar_interface()
     module = hp.get_hyper_param("model", dtype=import_module)
-    train, score = __apply_if_to_module(model_if, module)
+    train, score, logits = apply_if_to_module(model_if, module)
 
     saver = tf.train.Saver()
-    save_file = args.output
-    train_batch = batchnizer(dataset.train, 50, dataset.meta.train_data_count)
-
-    with tf.Session() as sess:
-        maybe_restore(sess, args.checkpoint, saver)
+    checkpoints = CheckpointManager(args.output, max_to_keep=args.max_to_keep)
+    batch_size = 50
+    sampler = PermutationSampler(
+        dataset.meta.train_data_count, batch_size, seed=hp.get_hyper_param_or_default("seed", default=0)
+    )
+    augmenter = get_augmenter(hp.get_all().get("augmentation"), seed=hp.get_hyper_param_or_default("seed"))
+
+    with tf.Session() as sess, checkpoints:
+        restored = maybe_restore(sess, args.checkpoint, saver)
+        restore_sampler(sampler, args.checkpoint, restored)
+        train_batch = Prefetcher(
+            sampled_batchnizer(dataset.train, sampler),
+            num_workers=args.prefetch_workers,
+            queue_size=args.prefetch_size,
+            transform=None if augmenter is None else augment_batch(augmenter),
+        )
 
-        lr_ = hp.get_hyper_param("learning_rate")
+        lr_table = compile_schedule_from_hyper_param()
         total_step = hp.get_hyper_param("total_step")
+        start_step = first_step(restored)
+
+        def validate_step(step):
+            if logits is None:
+                val = validate(sess, dataset.test, dataset.meta, score, model_if, augmenter)
+            else:
+                metrics = validate_metrics(sess, dataset.test, dataset.meta, logits, model_if, augmenter)
+                val = metrics.fine.accuracy
+                info(metrics.summary())
+            print(step, val)
+            return val
+
+        timer = StepTimer(
+            total_step, batch_size, output=args.step_log, interval=args.step_log_interval,
+            tag=hp.get_hyper_param("model"), initial_step=start_step - 1
+        )
+        with train_batch:
+            for i in timer.wrap(counting_iter(total_step, start_step)):
+                with timer.phase("data"):
+                    img, label_c, label_f, sampler_state = next(train_batch)
+                feed_dict = model_if.feed_dict(
+                    {
+                        "input_images": img,
+                        "coarse_labels": label_c,
+                        "fine_labels": label_f,
+                        "is_training": True,
+                        "learning_rate": lr_table[i]
+                    }
+                )
+
+                with timer.phase("run"):
+                    sess.run(train, feed_dict)
+                with timer.phase("callback"):
+                    step_callback(
+                        i,
+                        total_step,
+                        args.validate_interval,
+                        validate_step,
+                        lambda step, metric: checkpoints.save(
+                            step, snapshot_variables(sess), metric=metric, extra={"sampler": sampler_state}
+                        ),
+                    )
+            timer.emit()
+
+    stats = train_batch.stats()
+    info(f"入力待ち: {stats['wait_time']:.1f}[s] ({stats['wait_per_batch'] * 1000:.2f}[ms/batch])")
+
+
+def first_step(restored: Optional[CheckpointEntry]) -> int:
+    """
+    CheckpointManagerから再開した場合はその次のステップから始める。
+    学習率のテーブルとチェックポイントのステップ数もそこから続く。
+    """
+    return 1 if restored is None else restored.step + 1
+
+
+def step_callback(step: int, total_step: int, validate_interval: int, validate_fn, save_fn, save_interval: int = 10000):
+    """
+    ステップの終わりに検証とチェックポイントの保存を行う。
+    保存するチェックポイントの評価値は、そのステップで検証した場合だけ付ける(それ以外はNone)。
+    前回の検証結果を付けると、世代管理で最良のものを取り違えるため。
+    Args:
+        validate_fn: stepを受け取り評価値を返す関数
+        save_fn: (step, 評価値かNone)を受け取って保存する関数
+    """
+    metric = None
+    if validate_interval > 0 and step % validate_interval == 0:
+        metric = validate_fn(step)
+    if step % save_interval == 0 or step == total_step:
+        save_fn(step, metric)
+
+
+def restore_sampler(sampler: PermutationSampler, checkpoint, restored: Optional[CheckpointEntry]):
+    """
+    チェックポイントと一緒に保存したサンプラーの状態を読み込む。
+    """
+    if restored is not None and "sampler" in restored.extra:
+        sampler.load_state_dict(restored.extra["sampler"])
+    elif checkpoint and sampler_state_path(checkpoint).exists():
+        sampler.load(sampler_state_path(checkpoint))
+
+
+def host_cifar_command() -> Command:
+    cmd = Command("host_cifar", "cifarのデータセットを共有メモリに置き、終了するまでホストする")
+    add_dataset_options(cmd)
+
+    @cmd
+    def run_host(args, *_, **__):
+        if not args.shared_dataset:
+            raise Exception("--shared_datasetを指定してください。")
+        _, host = attach_or_host(
+            args.shared_dataset, lambda: load_cached(args.data_path, args.cache_path, args.cache_format)
+        )
+        if host is None:
+            info(f"{args.shared_dataset}は既にホストされています")
+            return
+        with host:
+            info(f"{args.shared_dataset}をホストしています(Ctrl-Cで終了)")
+            try:
+                signal.pause()
+            except KeyboardInterrupt:
+                pass
 
-        for i in counting_iter(total_step):
-            img, label_c, label_f = next(train_batch)
-            feed_dict = model_if.feed_dict(
-                {
-                    "input_images": img,
-                    "coarse_labels": label_c,
-                    "fine_labels": label_f,
-                    "is_training": True,
-                    "learning_rate": lr_
-                }
-            )
-
-            sess.run(train, feed_dict)
-            if i % 2000 == 0:
-                val = validate(sess, dataset.test, dataset.meta, score, model_if)
-                print(i, val)
-            if i % 100000 == 0:
-                lr_ *= 0.2
-            if i % 10000 == 0:
-                saver.save(sess, save_file)
+    return cmd
 
 
 def train_cifar_command() -> Command:
     cmd = Command("train_cifar", "cifar100の訓練")
     cmd(run)
-    cmd.option("--checkpoint")
-    cmd.option("--data_path", required=True, type=Path, help="~/data/cifar-100-binary")
-    cmd.option("--cache_path", default="_cifar100_cache.pkl")
-    cmd.option("--output", required=True)
+    cmd.option("--checkpoint", help="チェックポイントのディレクトリ(最新のものを読み込む)またはtf.train.Saverのファイル")
+    add_dataset_options(cmd)
+    cmd.option("--output", required=True, help="チェックポイントを保存するディレクトリ")
+    cmd.option("--max_to_keep", type=int, default=5, help="残す最新のチェックポイント数")
+    cmd.option("--prefetch_workers", type=int, default=1, help="バッチを先読みするスレッド数")
+    cmd.option("--prefetch_size", type=int, default=8, help="先読みするバッチ数の上限")
     cmd.option("--param", required=True)
+    cmd.option("--validate_interval", type=int, default=2000, help="検証するステップ間隔。0なら検証しない(evaluate_cifarを使う)。"
+               "0の場合はチェックポイントにmetricが付かないので、最良のものを残す世代管理は働かず最新max_to_keep個だけが残る")
+    cmd.option("--step_log", help="ステップ時間の統計を追記するJSONLファイル")
+    cmd.option("--step_log_interval", type=int, default=100, help="統計を書き出すステップ間隔")
     return cmd
 
 
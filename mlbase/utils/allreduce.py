@@ -0,0 +1,80 @@
+"""
+同じホストのプロセス間で、パラメータ(1次元のfloat32配列)の平均をとる。
+共有メモリとmultiprocessing.Barrierによる、all-reduceの代わりになる簡単な実装。
+"""
+import multiprocessing
+from multiprocessing import shared_memory
+from typing import Optional
+
+from mlbase.lazy import numpy as np
+
+
+class SharedAverager:
+    """
+    親プロセスで作成し、multiprocessing.Processの引数として各ワーカーに渡す。
+    各ワーカーは担当する区間の平均だけを計算する(reduce-scatter + all-gather)ので、1回の計算量はワーカー数によらない。
+    """
+
+    def __init__(self, num_workers: int, size: int, context=None, timeout: Optional[float] = None) -> None:
+        """
+        Args:
+            num_workers(int): ワーカー数
+            size(int): 平均をとる配列の要素数
+            context: multiprocessing.get_context()の結果。Barrierの作成に使う。
+            timeout: 他のワーカーを待つ上限(秒)。超えるとthreading.BrokenBarrierErrorになる。
+        """
+        context = multiprocessing.get_context() if context is None else context
+        itemsize = np.dtype(np.float32).itemsize
+        self.__num_workers = num_workers
+        self.__size = size
+        self.__shm = shared_memory.SharedMemory(create=True, size=max((num_workers + 1) * size * itemsize, 1))
+        self.__barrier = context.Barrier(num_workers, timeout=timeout)
+        self.__owner = True
+        self.__setup_views()
+
+    def __getstate__(self):
+        return {
+            "num_workers": self.__num_workers,
+            "size": self.__size,
+            "name": self.__shm.name,
+            "barrier": self.__barrier,
+        }
+
+    def __setstate__(self, state):
+        self.__num_workers = state["num_workers"]
+        self.__size = state["size"]
+        # ワーカーは親プロセスのresource_trackerを共有するので、登録はそのままにする(解放は親が行う)
+        self.__shm = shared_memory.SharedMemory(name=state["name"])
+        self.__barrier = state["barrier"]
+        self.__owner = False
+        self.__setup_views()
+
+    def average(self, rank: int, values: "np.ndarray") -> "np.ndarray":
+        """
+        全ワーカーのvaluesの平均を返す。全ワーカーが呼ぶまでブロックする。
+        """
+        self.__slots[rank] = values
+        self.__barrier.wait()
+
+        head, tail = self.__range(rank)
+        self.__output[head:tail] = self.__slots[:, head:tail].mean(axis=0)
+        self.__barrier.wait()
+
+        return self.__output.copy()
+
+    def close(self):
+        self.__slots = None
+        self.__output = None
+        self.__shm.close()
+        if self.__owner:
+            self.__shm.unlink()
+
+    def __range(self, rank: int):
+        chunk = -(-self.__size // self.__num_workers)
+        head = min(rank * chunk, self.__size)
+        return head, min(head + chunk, self.__size)
+
+    def __setup_views(self):
+        buffer = np.ndarray([self.__num_workers + 1, self.__size], dtype=np.float32, buffer=self.__shm.buf)
+        self.__slots = buffer[:self.__num_workers]
+        self.__output = buffer[self.__num_workers]
@@ -0,0 +1,86 @@
+"""
+ndarrayを含むNamedTupleの入れ子を、JSONで書けるマニフェストと配列の集まりに分解する。
+配列の置き場所(ファイル、共有メモリ等)は呼び出し側が決める。
+
+>>> from typing import NamedTuple
+>>> class Pair(NamedTuple):
+...     values: list
+...     name: str
+>>> store = {}
+>>> manifest = dump_tree(Pair(values=[1, 2], name="a"), store.__setitem__)
+>>> manifest["kind"], manifest["fields"]["name"]
+('namedtuple', {'kind': 'value', 'value': 'a'})
+"""
+from importlib import import_module
+from typing import Any, Callable
+
+from mlbase.lazy import numpy as np
+
+_KIND_NAMEDTUPLE = "namedtuple"
+_KIND_ARRAY = "array"
+_KIND_VALUE = "value"
+
+
+def _is_namedtuple(obj) -> bool:
+    return isinstance(obj, tuple) and hasattr(obj, "_fields")
+
+
+def type_name(cls) -> str:
+    """
+    import_typeで読み込み直せるクラスの名前("モジュール:クラス")
+    """
+    return f"{cls.__module__}:{cls.__qualname__}"
+
+
+def import_type(name: str):
+    """
+    type_nameの名前からクラスを読み込む。
+    """
+    module_name, qualname = name.split(":")
+    obj = import_module(module_name)
+    for attr in qualname.split("."):
+        obj = getattr(obj, attr)
+    return obj
+
+
+def dump_tree(obj, put_array: Callable[[str, "np.ndarray"], None], key: str = "") -> dict:
+    """
+    objを分解してマニフェストを作成する。
+    Args:
+        obj: NamedTuple、ndarray、またはJSONで書ける値
+        put_array: (キー, 配列)を受け取り保存する関数。キーは"train.images"のようなフィールドのパス。
+        key: objのキー
+    Return: JSONで書けるマニフェスト
+    """
+    if _is_namedtuple(obj):
+        fields = {}
+        for name, value in zip(obj._fields, obj):
+            fields[name] = dump_tree(value, put_array, f"{key}.{name}" if key else name)
+        return {"kind": _KIND_NAMEDTUPLE, "type": type_name(type(obj)), "fields": fields}
+
+    if isinstance(obj, np.ndarray):
+        put_array(key, obj)
+        return {"kind": _KIND_ARRAY, "key": key}
+
+    return {"kind": _KIND_VALUE, "value": obj}
+
+
+def load_tree(manifest: dict, get_array: Callable[[str], "np.ndarray"]) -> Any:
+    """
+    dump_treeのマニフェストから元のオブジェクトを組み立てる。
+    Args:
+        manifest: dump_treeの結果
+        get_array: キーを受け取り配列を返す関数
+    """
+    kind = manifest["kind"]
+    if kind == _KIND_NAMEDTUPLE:
+        cls = import_type(manifest["type"])
+        return cls(**{name: load_tree(field, get_array) for name, field in manifest["fields"].items()})
+
+    if kind == _KIND_ARRAY:
+        return get_array(manifest["key"])
+
+    if kind == _KIND_VALUE:
+        return manifest["value"]
+
+    raise Exception(f"不明な種類です: {kind}")
@@ -1,5 +1,15 @@
 from pathlib import Path
+import json
+import os
 import pickle
+import shutil
+
+from mlbase.lazy import numpy as np
+from mlbase.utils.array_tree import dump_tree, load_tree
+
+_NPY_MANIFEST = "manifest.json"
+_NPY_FORMAT = "mlbase.cache_npy"
+_NPY_VERSION = 1
 
 
 def cache_pickle(cache_path, func, args=[], kwargs={}):
@@ -22,3 +32,74 @@ def cache_pickle(cache_path, func, args=[], kwargs={}):
     pickle.dump(result, open(cache_path, "wb"))
 
     return result
+
+
+def cache_npy(cache_path, func, args=[], kwargs={}, mmap_mode="r"):
+    """
+    ndarrayを含むNamedTupleを返す関数の結果を、配列ごとの.npyとJSONのマニフェストでディレクトリに保存し、
+    そのディレクトリがあればそれを読み込む。
+    読み込み時はmmap_modeで配列をマップするので、コピーが発生せず、同じホストのプロセス間でページキャッシュを共有できる。
+    Args:
+        cache_path: 出力ディレクトリ
+        func: 実行関数
+        args(list): 関数の引数
+        kwargs(dict): 関数のキーワード引数
+        mmap_mode: np.loadのmmap_mode。Noneなら全体をメモリに読み込む。
+    """
+    # 読み込み
+    if cache_path is not None and (Path(cache_path) / _NPY_MANIFEST).exists():
+        return load_npy_tree(cache_path, mmap_mode=mmap_mode)
+    if cache_path is not None and Path(cache_path).is_file():
+        # pickleのキャッシュ等。funcを実行してから保存に失敗しないよう先に確認する
+        raise Exception(f"{cache_path}はファイルです。cache_npyの保存先にはディレクトリのパスを指定してください。")
+
+    # 作成
+    result = func(*args, **kwargs)
+
+    # 保存
+    if cache_path is not None:
+        save_npy_tree(cache_path, result)
+        if mmap_mode is not None:
+            return load_npy_tree(cache_path, mmap_mode=mmap_mode)
+
+    return result
+
+
+def save_npy_tree(path, obj):
+    """
+    objをディレクトリに保存する。
+    一時ディレクトリに書き出してから名前を変えるので、途中で落ちても壊れたキャッシュは残らない。
+    """
+    path = Path(path)
+    tmp = path.parent / f".{path.name}.tmp{os.getpid()}"
+    if tmp.exists():
+        shutil.rmtree(tmp)
+    tmp.mkdir(parents=True)
+
+    def put_array(key, array):
+        np.save(tmp / f"{key}.npy", array, allow_pickle=False)
+
+    manifest = {"format": _NPY_FORMAT, "version": _NPY_VERSION, "tree": dump_tree(obj, put_array)}
+    with open(tmp / _NPY_MANIFEST, "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    try:
+        os.rename(tmp, path)
+    except OSError:
+        # 他のプロセスが先に作成した場合はそちらを使う
+        shutil.rmtree(tmp)
+        if not (path / _NPY_MANIFEST).exists():
+            raise
+
+
+def load_npy_tree(path, mmap_mode="r"):
+    """
+    save_npy_treeで保存したものを読み込む。
+    """
+    path = Path(path)
+    with open(path / _NPY_MANIFEST) as f:
+        manifest = json.load(f)
+    if manifest.get("format") != _NPY_FORMAT:
+        raise Exception(f"{path}は{_NPY_FORMAT}の形式ではありません。")
+
+    return load_tree(manifest["tree"], lambda key: np.load(path / f"{key}.npy", mmap_mode=mmap_mode))
@@ -0,0 +1,186 @@
+"""
+変数の値(ndarrayの辞書)をチェックポイントとして別スレッドで書き込み、世代を管理する。
+
+ディレクトリ構成:
+/path/to/checkpoints/checkpoint.json: チェックポイントの一覧
+/path/to/checkpoints/ckpt-00010000.npz: 各チェックポイント
+"""
+import json
+import os
+import queue
+import threading
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+
+from mlbase.lazy import numpy as np
+from mlbase.logger import error
+
+_MANIFEST = "checkpoint.json"
+_END = object()
+
+
+class CheckpointEntry(NamedTuple):
+    step: int
+    path: str
+    size: int
+    metric: Optional[float]
+    extra: dict
+
+
+def _write_atomically(path: Path, write):
+    """
+    一時ファイルに書いてからos.replaceするので、途中で落ちても壊れたファイルは残らない。
+    """
+    tmp = path.parent / f".{path.name}.tmp{os.getpid()}"
+    with open(tmp, "wb") as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class CheckpointManager:
+    """
+    最新max_to_keep個とmetricが最良のものを残す。
+    metricは保存するプロセスがsaveに渡したものだけを使う。evaluate_cifarのような別プロセスの評価結果は反映されないので、
+    metricを渡さない場合は最新max_to_keep個だけが残る。
+    書き込みはバックグラウンドのスレッドで行うので、saveに渡す値は以後変更されないもの(スナップショット)にする。
+    """
+
+    def __init__(self, directory, max_to_keep: int = 5, mode: str = "max", queue_size: int = 1) -> None:
+        """
+        Args:
+            directory: 保存先ディレクトリ
+            max_to_keep(int): 残す最新のチェックポイント数
+            mode(str): "max"ならmetricが大きいほど、"min"なら小さいほど良い
+            queue_size(int): 書き込み待ちにできるチェックポイント数。超えるとsaveがブロックする。
+        """
+        assert max_to_keep > 0
+        assert mode in ["max", "min"]
+        self.__directory = Path(directory)
+        self.__max_to_keep = max_to_keep
+        self.__mode = mode
+        self.__queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.__thread: Optional[threading.Thread] = None
+        self.__error: Optional[Exception] = None
+
+    @property
+    def directory(self) -> Path:
+        return self.__directory
+
+    def save(self, step: int, values: Dict[str, "np.ndarray"], metric: Optional[float] = None, extra=None):
+        """
+        チェックポイントの書き込みを予約する。
+        Args:
+            step(int): ステップ数
+            values: 変数名から値への辞書
+            metric: 検証スコア。最良のものは世代管理で消されない。
+            extra(dict): 一緒に保存するJSONで書ける値(サンプラーの状態等)
+        """
+        self.__raise_if_failed()
+        if self.__thread is None:
+            self.__directory.mkdir(parents=True, exist_ok=True)
+            self.__thread = threading.Thread(target=self.__work, daemon=True)
+            self.__thread.start()
+        self.__queue.put((step, values, metric, {} if extra is None else extra))
+
+    def wait(self):
+        """
+        予約済みの書き込みが終わるのを待つ。
+        """
+        self.__queue.join()
+        self.__raise_if_failed()
+
+    def close(self):
+        if self.__thread is not None:
+            self.__queue.put(_END)
+            self.__thread.join()
+            self.__thread = None
+        self.__raise_if_failed()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def entries(self) -> List[CheckpointEntry]:
+        """
+        一覧にあるチェックポイント(step順)
+        """
+        path = self.__directory / _MANIFEST
+        if not path.exists():
+            return []
+        with open(path) as f:
+            obj = json.load(f)
+        return [CheckpointEntry(**entry) for entry in obj["checkpoints"]]
+
+    def is_valid(self, entry: CheckpointEntry) -> bool:
+        path = self.__directory / entry.path
+        return path.exists() and path.stat().st_size == entry.size
+
+    def latest(self) -> Optional[CheckpointEntry]:
+        """
+        正常に書き込まれた最新のチェックポイント
+        """
+        for entry in reversed(self.entries()):
+            if self.is_valid(entry):
+                return entry
+        return None
+
+    def best(self) -> Optional[CheckpointEntry]:
+        """
+        metricが最良のチェックポイント
+        """
+        return self.__best(entry for entry in self.entries() if self.is_valid(entry))
+
+    def restore(self, entry: CheckpointEntry) -> Dict[str, "np.ndarray"]:
+        with np.load(self.__directory / entry.path, allow_pickle=False) as loaded:
+            return {key: loaded[key] for key in loaded.files}
+
+    def __best(self, entries) -> Optional[CheckpointEntry]:
+        scored = [entry for entry in entries if entry.metric is not None]
+        if not scored:
+            return None
+        select = max if self.__mode == "max" else min
+        return select(scored, key=lambda entry: entry.metric)
+
+    def __work(self):
+        while True:
+            item = self.__queue.get()
+            try:
+                if item is _END:
+                    return
+                if self.__error is None:
+                    self.__write(*item)
+            except Exception as e:
+                error(f"チェックポイントの書き込みに失敗しました: {e}")
+                self.__error = e
+            finally:
+                self.__queue.task_done()
+
+    def __write(self, step: int, values: Dict[str, "np.ndarray"], metric: Optional[float], extra: dict):
+        name = f"ckpt-{step:08d}.npz"
+        path = self.__directory / name
+        _write_atomically(path, lambda f: np.savez(f, **values))
+
+        entries = [entry for entry in self.entries() if entry.step != step]
+        metric = None if metric is None else float(metric)
+        entries.append(CheckpointEntry(step=step, path=name, size=path.stat().st_size, metric=metric, extra=extra))
+        entries.sort(key=lambda entry: entry.step)
+
+        keep = entries[-self.__max_to_keep:]
+        best = self.__best(entries)
+        if best is not None and best not in keep:
+            keep.insert(0, best)
+
+        manifest = {"checkpoints": [entry._asdict() for entry in keep]}
+        _write_atomically(self.__directory / _MANIFEST, lambda f: f.write(json.dumps(manifest, indent=2).encode()))
+
+        for entry in entries:
+            if entry not in keep:
+                (self.__directory / entry.path).unlink(missing_ok=True)
+
+    def __raise_if_failed(self):
+        if self.__error is not None:
+            raise self.__error
@@ -0,0 +1,124 @@
+"""
+分類の評価指標をバッチごとに集計する。
+メモリはクラス数にのみ依存し、評価データの件数には依存しない。
+"""
+from typing import Sequence
+
+from mlbase.lazy import numpy as np
+
+
+class ClassificationMetrics:
+    """
+    logitsと正解ラベルから混同行列とtop-kの正解数を集計する。
+
+    >>> metrics = ClassificationMetrics(3, top_k=(1, 2))
+    >>> metrics.add(np.array([[3., 2., 1.], [1., 2., 3.], [1., 3., 2.]]), np.array([0, 1, 2]))
+    >>> float(metrics.accuracy), float(metrics.top_k_accuracy(2))
+    (0.3333333333333333, 1.0)
+    >>> metrics.confusion_matrix.tolist()
+    [[1, 0, 0], [0, 0, 1], [0, 1, 0]]
+    """
+
+    def __init__(self, num_classes: int, top_k: Sequence[int] = (1, 5)) -> None:
+        """
+        Args:
+            num_classes(int): クラス数
+            top_k: 集計するtop-kのk。num_classes以上のkは全クラスを候補にするので常に正解になる
+        """
+        if any(k < 1 for k in top_k):
+            raise ValueError(f"top_kは1以上にしてください: {top_k}")
+        self.__num_classes = num_classes
+        self.__top_k = tuple(top_k)
+        self.__matrix = np.zeros([num_classes, num_classes], dtype=np.int64)
+        self.__top_k_hits = {k: 0 for k in self.__top_k}
+
+    def add(self, logits: "np.ndarray", labels: "np.ndarray"):
+        """
+        Args:
+            logits: [N, num_classes]
+            labels: [N]
+        """
+        n = self.__num_classes
+        logits = np.asarray(logits)
+        labels = np.asarray(labels, dtype=np.int64)
+        predictions = logits.argmax(axis=1)
+        self.__matrix += np.bincount(labels * n + predictions, minlength=n * n).reshape([n, n])
+
+        # 正解クラスより大きいlogitの数が順位になる
+        label_logits = logits[np.arange(len(labels)), labels]
+        ranks = (logits > label_logits[:, None]).sum(axis=1)
+        for k in self.__top_k:
+            self.__top_k_hits[k] += int((ranks < k).sum())
+
+    @property
+    def confusion_matrix(self) -> "np.ndarray":
+        """
+        行が正解、列が予測
+        """
+        return self.__matrix
+
+    @property
+    def count(self) -> int:
+        return int(self.__matrix.sum())
+
+    @property
+    def accuracy(self) -> float:
+        count = self.count
+        return np.nan if count == 0 else np.trace(self.__matrix) / count
+
+    def top_k_accuracy(self, k: int) -> float:
+        if k not in self.__top_k_hits:
+            raise KeyError(f"top-{k}は集計していません(top_k={self.__top_k})")
+        count = self.count
+        return np.nan if count == 0 else self.__top_k_hits[k] / count
+
+    @property
+    def per_class_recall(self) -> "np.ndarray":
+        return self.__safe_divide(np.diag(self.__matrix), self.__matrix.sum(axis=1))
+
+    @property
+    def per_class_precision(self) -> "np.ndarray":
+        return self.__safe_divide(np.diag(self.__matrix), self.__matrix.sum(axis=0))
+
+    @property
+    def macro_recall(self) -> float:
+        return self.__nanmean(self.per_class_recall)
+
+    @property
+    def macro_precision(self) -> float:
+        return self.__nanmean(self.per_class_precision)
+
+    @property
+    def macro_f1(self) -> float:
+        recall = self.per_class_recall
+        precision = self.per_class_precision
+        f1 = self.__safe_divide(2 * recall * precision, recall + precision)
+        return self.__nanmean(f1)
+
+    def summary(self) -> dict:
+        """
+        JSONで書ける形の集計結果
+        """
+        result = {
+            "count": self.count,
+            "accuracy": float(self.accuracy),
+            "macro_recall": float(self.macro_recall),
+            "macro_precision": float(self.macro_precision),
+            "macro_f1": float(self.macro_f1),
+        }
+        for k in self.__top_k:
+            result[f"top_{k}_accuracy"] = float(self.top_k_accuracy(k))
+        return result
+
+    @staticmethod
+    def __safe_divide(numerator, denominator) -> "np.ndarray":
+        numerator = np.asarray(numerator, dtype=np.float64)
+        denominator = np.asarray(denominator, dtype=np.float64)
+        result = np.full(numerator.shape, np.nan)
+        np.divide(numerator, denominator, out=result, where=denominator > 0)
+        return result
+
+    @staticmethod
+    def __nanmean(values) -> float:
+        values = values[~np.isnan(values)]
+        return np.nan if len(values) == 0 else float(values.mean())
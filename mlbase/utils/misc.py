@@ -38,17 +38,49 @@ def plugin_root(path):
     sys.path.append(str(path))
 
 
-def counting_iter(cnt):
-    for i in range(1, cnt + 1):
+def counting_iter(cnt, start=1):
+    for i in range(start, cnt + 1):
         sys.stdout.write(f"{i}\r")
         yield i
 
 
 def maybe_restore(sess, checkpoint: str, saver):
+    """
+    チェックポイントがあれば読み込み、なければ変数を初期化する。
+    checkpointがCheckpointManagerのディレクトリなら、正常に書き込まれた最新のものを読み込んでそのCheckpointEntryを返す。
+    """
+    if checkpoint and Path(checkpoint).is_dir():
+        from mlbase.utils.checkpoint import CheckpointManager
+
+        sess.run(tf.global_variables_initializer())
+        manager = CheckpointManager(checkpoint)
+        entry = manager.latest()
+        if entry is not None:
+            restore_variables(sess, manager.restore(entry))
+        return entry
+
     if checkpoint:
         saver.restore(sess, checkpoint)
     else:
         sess.run(tf.global_variables_initializer())
+    return None
+
+
+def snapshot_variables(sess) -> dict:
+    """
+    全変数の現在の値を、変数名からndarrayへの辞書として取り出す。
+    """
+    variables = tf.global_variables()
+    return dict(zip([v.name for v in variables], sess.run(variables)))
+
+
+def restore_variables(sess, values: dict):
+    """
+    snapshot_variablesの値を変数に戻す。
+    """
+    for v in tf.global_variables():
+        if v.name in values:
+            v.load(values[v.name], sess)
 
 
 class ToolPath(NamedTuple):
@@ -0,0 +1,165 @@
+"""
+訓練ループの1ステップごとの時間を計測し、定期的にJSONLに書き出す。
+
+>>> timer = StepTimer(total_step=10, batch_size=2, interval=100)
+>>> for i in timer.wrap(range(4)):
+...     with timer.phase("data"):
+...         pass
+>>> summary = timer.summary()
+>>> summary["step"], summary["steps"], sorted(summary["phases"])
+(4, 4, ['data', 'other'])
+"""
+import json
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional
+
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """
+    最近傍順位法による百分位数
+
+    >>> percentile([1.0, 2.0, 3.0, 4.0], 50)
+    2.0
+    >>> percentile([1.0, 2.0, 3.0, 4.0], 99)
+    4.0
+    """
+    if not sorted_values:
+        return float("nan")
+    rank = max(int(-(-q * len(sorted_values) // 100)), 1)
+    return sorted_values[rank - 1]
+
+
+class StepTimer:
+    """
+    ステップの時間と、その内訳(データ待ち、session.run、コールバック等)を記録する。
+    内訳はphaseで囲んだ区間の合計で、囲まれていない時間は"other"になる。
+    """
+
+    def __init__(
+        self,
+        total_step: int,
+        batch_size: int,
+        output: Optional[str] = None,
+        interval: int = 100,
+        tag: Optional[str] = None,
+        initial_step: int = 0,
+        clock: Callable[[], float] = time.perf_counter,
+    ) -> None:
+        """
+        Args:
+            total_step(int): 全ステップ数(ETAの計算に使う)
+            batch_size(int): 1ステップのサンプル数
+            output: 統計を追記するJSONLファイル。Noneなら書き出さない。
+            interval(int): 何ステップごとに統計を書き出すか
+            tag: 記録に含める名前(モデル名等)
+            initial_step(int): 再開時のステップ数
+            clock: 時刻を返す関数
+        """
+        assert interval > 0
+        self.__total_step = total_step
+        self.__batch_size = batch_size
+        self.__output = output
+        self.__interval = interval
+        self.__tag = tag
+        self.__clock = clock
+
+        self.__step = initial_step
+        self.__step_start: Optional[float] = None
+        self.__current: Dict[str, float] = defaultdict(float)
+        self.__window_steps: List[float] = []
+        self.__window_phases: Dict[str, float] = defaultdict(float)
+        self.__total_time = 0.0
+        self.__total_count = 0
+
+    def start(self):
+        """
+        最初のステップの開始時刻を記録する。wrapを使う場合は不要。
+        """
+        self.__step_start = self.__clock()
+
+    @contextmanager
+    def phase(self, name: str):
+        start = self.__clock()
+        try:
+            yield
+        finally:
+            self.__current[name] += self.__clock() - start
+
+    def step(self):
+        """
+        ステップの終わりに呼ぶ。
+        """
+        now = self.__clock()
+        if self.__step_start is None:
+            self.__step_start = now
+        elapsed = now - self.__step_start
+        self.__step_start = now
+        self.__step += 1
+
+        self.__window_steps.append(elapsed)
+        measured = 0.0
+        for name, value in self.__current.items():
+            self.__window_phases[name] += value
+            measured += value
+        self.__window_phases["other"] += max(elapsed - measured, 0.0)
+        self.__current.clear()
+        self.__total_time += elapsed
+        self.__total_count += 1
+
+        if len(self.__window_steps) >= self.__interval:
+            self.emit()
+
+    def wrap(self, iterable: Iterable):
+        """
+        各要素の処理が終わるごとにstepを呼ぶ。
+        """
+        self.start()
+        for item in iterable:
+            yield item
+            self.step()
+
+    def summary(self) -> dict:
+        """
+        前回の書き出し以降の統計
+        """
+        steps = sorted(self.__window_steps)
+        count = len(steps)
+        window_time = sum(steps)
+        mean = window_time / count if count else float("nan")
+        remaining = max(self.__total_step - self.__step, 0)
+        return {
+            "time": time.time(),
+            "tag": self.__tag,
+            "step": self.__step,
+            "steps": count,
+            "samples_per_sec": self.__batch_size * count / window_time if window_time > 0 else float("nan"),
+            "step_time": {
+                "mean": mean,
+                **{f"p{q}": percentile(steps, q) for q in PERCENTILES},
+            },
+            "phases": {name: value / count for name, value in self.__window_phases.items()} if count else {},
+            "eta_sec": remaining * mean if count else float("nan"),
+        }
+
+    def emit(self) -> dict:
+        """
+        統計を書き出して集計をリセットする。
+        """
+        record = self.summary()
+        if self.__output is not None and record["steps"] > 0:
+            with open(self.__output, "a") as f:
+                f.write(json.dumps(record) + "\n")
+        self.__window_steps = []
+        self.__window_phases = defaultdict(float)
+        return record
+
+    @property
+    def mean_step_time(self) -> float:
+        """
+        計測開始からの平均ステップ時間
+        """
+        return self.__total_time / self.__total_count if self.__total_count else float("nan")
@@ -0,0 +1,39 @@
+import multiprocessing
+import unittest
+
+import numpy as np
+
+from mlbase.utils.allreduce import SharedAverager
+
+
+def _worker(rank, averager, results):
+    values = np.full([5], rank, dtype=np.float32)
+    for _ in range(3):
+        values = averager.average(rank, values + rank)
+    results.put((rank, values.tolist()))
+    averager.close()
+
+
+class SharedAveragerTest(unittest.TestCase):
+    def test_average(self):
+        """
+        全ワーカーで同じ平均が得られることのテスト
+        """
+        context = multiprocessing.get_context("spawn")
+        averager = SharedAverager(3, 5, context)
+        results = context.Queue()
+        workers = [context.Process(target=_worker, args=(rank, averager, results)) for rank in range(3)]
+        for worker in workers:
+            worker.start()
+        outputs = dict(results.get(timeout=60) for _ in workers)
+        for worker in workers:
+            worker.join()
+        averager.close()
+
+        # 平均は 2(=mean(0, 2, 4)) -> 3 -> 4 と変わる
+        for rank in range(3):
+            self.assertEqual(outputs[rank], [4.0] * 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+from mlbase.template.cifar.train import Data, MetaData, DataSet
+from mlbase.utils.cache import cache_npy
+
+
+def _dataset():
+    images = np.arange(2 * 3 * 4 * 4, dtype=np.uint8).reshape([2, 3, 4, 4]).transpose([0, 2, 3, 1])
+    data = Data(images=images, coarse_labels=np.array([0, 1]), fine_labels=np.array([3, 4]))
+    meta = MetaData(coarse_labels=["a", "b"], fine_labels=["c", "d"], train_data_count=2, test_data_count=2)
+    return DataSet(train=data, test=data, meta=meta)
+
+
+class CacheNpyTest(unittest.TestCase):
+    def test_round_trip(self):
+        """
+        NamedTupleの入れ子を保存し、mmapで読み込めることのテスト
+        """
+        expected = _dataset()
+        calls = []
+
+        def func():
+            calls.append(0)
+            return expected
+
+        with tempfile.TemporaryDirectory() as tmp:
+            cache_path = Path(tmp) / "cache"
+            cache_npy(cache_path, func)
+            result = cache_npy(cache_path, func)
+
+            self.assertEqual(len(calls), 1)
+            self.assertIsInstance(result, DataSet)
+            self.assertEqual(result.meta, expected.meta)
+            self.assertIsInstance(result.train.images, np.memmap)
+            np.testing.assert_array_equal(result.train.images, expected.train.images)
+            np.testing.assert_array_equal(result.test.fine_labels, expected.test.fine_labels)
+
+    def test_existing_file(self):
+        """
+        保存先に別のファイルがあれば、関数を実行する前に例外になることのテスト
+        """
+        calls = []
+        with tempfile.TemporaryDirectory() as tmp:
+            cache_path = Path(tmp) / "cache.pkl"
+            cache_path.write_bytes(b"pickle")
+            with self.assertRaises(Exception):
+                cache_npy(cache_path, lambda: calls.append(0))
+            self.assertEqual(calls, [])
+            self.assertEqual(cache_path.read_bytes(), b"pickle")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import tempfile
+import unittest
+
+import numpy as np
+
+from mlbase.lr_schedule import compile_schedule
+from mlbase.template.cifar.train import first_step, step_callback
+from mlbase.utils.checkpoint import CheckpointManager
+from mlbase.utils.misc import counting_iter
+
+
+class CheckpointManagerTest(unittest.TestCase):
+    def test_retention(self):
+        """
+        最新max_to_keep個と最良のものが残ることのテスト
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            with CheckpointManager(tmp, max_to_keep=2) as manager:
+                for step, metric in [(1, 0.1), (2, 0.9), (3, 0.2), (4, 0.3)]:
+                    manager.save(step, {"w": np.full([2], step)}, metric=metric, extra={"step": step})
+
+            self.assertEqual([entry.step for entry in manager.entries()], [2, 3, 4])
+            self.assertEqual(manager.latest().step, 4)
+            self.assertEqual(manager.best().step, 2)
+            np.testing.assert_array_equal(manager.restore(manager.latest())["w"], [4, 4])
+            self.assertEqual(manager.latest().extra, {"step": 4})
+
+    def test_skip_broken(self):
+        """
+        壊れたチェックポイントを飛ばして最新の正常なものを選ぶことのテスト
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            with CheckpointManager(tmp) as manager:
+                manager.save(1, {"w": np.zeros([2])})
+                manager.save(2, {"w": np.ones([2])})
+            (manager.directory / manager.latest().path).write_bytes(b"broken")
+
+            self.assertEqual(manager.latest().step, 1)
+
+    def test_resume_step(self):
+        """
+        再開したときにステップ数と学習率が中断した位置から続き、チェックポイントのステップ数も重ならないことのテスト
+        """
+        schedule = {"type": "warmup", "warmup_steps": 10, "then": {"type": "cosine"}}
+        lr_table = compile_schedule(schedule, base_lr=1.0, total_step=40)
+        with tempfile.TemporaryDirectory() as tmp:
+            self.assertEqual(first_step(None), 1)
+            with CheckpointManager(tmp) as manager:
+                for i in counting_iter(25):
+                    if i % 10 == 0:
+                        manager.save(i, {"w": np.zeros([1])})
+
+            restored = manager.latest()
+            steps = list(counting_iter(40, first_step(restored)))
+            self.assertEqual(steps[0], 21)
+            self.assertEqual(steps[-1], 40)
+            np.testing.assert_array_equal([lr_table[i] for i in steps], lr_table[21:])
+            self.assertNotIn(restored.step, steps)
+
+
+    def test_metric_only_when_validated(self):
+        """
+        検証と保存の間隔がずれていても、検証していないステップのチェックポイントに古い評価値が付かないことのテスト
+        """
+        saved = []
+        for step in range(1, 26):
+            step_callback(step, 25, 4, lambda s: s / 100, lambda s, m: saved.append((s, m)), save_interval=6)
+        self.assertEqual(saved, [(6, None), (12, 0.12), (18, None), (24, 0.24), (25, None)])
+
+        with tempfile.TemporaryDirectory() as tmp:
+            with CheckpointManager(tmp, max_to_keep=1) as manager:
+                for step, metric in saved:
+                    manager.save(step, {"w": np.full([2], step)}, metric=metric)
+            self.assertEqual(manager.best().step, 24)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,26 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from mlbase.arxiv2vec.corpus import LineCorpus, TaggedCorpus
+
+
+class LineCorpusTest(unittest.TestCase):
+    def test_reiterable(self):
+        """
+        何度イテレートしても先頭から同じ行が返ることのテスト
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "train.txt"
+            path.write_text("a b\nc d\n")
+            corpus = LineCorpus(str(path))
+            self.assertEqual(list(corpus), ["a b\n", "c d\n"])
+            self.assertEqual(list(corpus), ["a b\n", "c d\n"])
+
+    def test_reject_iterator(self):
+        with self.assertRaises(TypeError):
+            TaggedCorpus(iter(["a"]), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+from mlbase.arxiv2vec.index import build_index, load_index, normalize
+from mlbase.arxiv2vec.model import attach_index_if_valid
+
+
+class _Model:
+    def __init__(self, count):
+        self.count = count
+        self.index = None
+
+    def doc_vectors(self):
+        return np.zeros([self.count, 16])
+
+    def attach_index(self, index):
+        self.index = index
+
+
+class VectorIndexTest(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.vectors = rng.normal(size=[1000, 16]).astype(np.float32)
+        self.queries = rng.normal(size=[7, 16]).astype(np.float32)
+        scores = normalize(self.queries) @ normalize(self.vectors).T
+        self.expected = np.argsort(-scores, axis=1)[:, :5]
+
+    def test_exact(self):
+        """
+        ブロックに分けても全件の内積と同じ結果になることのテスト
+        """
+        ids, scores = build_index(self.vectors, "exact", block_size=64).search(self.queries, 5)
+        np.testing.assert_array_equal(ids, self.expected)
+        self.assertTrue(np.all(np.diff(scores, axis=1) <= 0))
+
+    def test_ivf(self):
+        """
+        全クラスタを調べれば厳密な探索と一致し、保存して読み込んでも同じ結果になることのテスト
+        """
+        index = build_index(self.vectors, "ivf", nlist=10, nprobe=10)
+        np.testing.assert_array_equal(index.search(self.queries, 5)[0], self.expected)
+        with tempfile.TemporaryDirectory() as tmp:
+            index.save(Path(tmp) / "index")
+            loaded = load_index(Path(tmp) / "index")
+            self.assertEqual(len(loaded), 1000)
+            np.testing.assert_array_equal(loaded.search(self.queries, 5, nprobe=2)[0],
+                                          index.search(self.queries, 5, nprobe=2)[0])
+
+    def test_attach_only_matching_index(self):
+        """
+        文書数がモデルと異なる索引は使わないことのテスト
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            build_index(self.vectors, "exact").save(Path(tmp) / "index")
+            self.assertFalse(attach_index_if_valid(_Model(999), Path(tmp) / "index"))
+            model = _Model(1000)
+            self.assertTrue(attach_index_if_valid(model, Path(tmp) / "index"))
+            self.assertEqual(len(model.index), 1000)
+            self.assertFalse(attach_index_if_valid(model, Path(tmp) / "missing"))
+
+
+if __name__ == '__main__':
+    unittest.main()
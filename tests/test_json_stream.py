@@ -0,0 +1,136 @@
+import json
+import random
+import tempfile
+import unittest
+from pathlib import Path
+
+from mlbase.arxiv2vec.dataset import json_arxiv, merge_json
+from mlbase.arxiv2vec.dataset.json_stream import iter_json_array
+from mlbase.arxiv2vec.dataset.utils import fix_needless_new_line
+
+
+def _papers(rng, count, offset=0):
+    return [{
+        "id": f"{offset + i:04d}",
+        "summary": "  We study\n  $x$ " + "word " * rng.randint(0, 30),
+        "score": rng.randint(0, 10**9) / 7,
+        "tags": [None, True, "[,]"],
+    } for i in range(count)]
+
+
+class IterJSONArrayTest(unittest.TestCase):
+    def test_same_as_json_load(self):
+        """
+        チャンクの大きさによらずjson.loadと同じ要素が返ることのテスト
+        """
+        rng = random.Random(0)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "a.json"
+            for papers in [[], _papers(rng, 50), [12345, -1.5e3, "x"]]:
+                for indent in [None, 2]:
+                    path.write_text(json.dumps(papers, indent=indent))
+                    for chunk_size in [1, 7, 1 << 16]:
+                        self.assertEqual(list(iter_json_array(str(path), chunk_size=chunk_size)), papers)
+
+    def test_invalid(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "a.json"
+            for text in ['{"a": 1}', '[1, 2', '[1] 2']:
+                path.write_text(text)
+                with self.assertRaises(ValueError):
+                    list(iter_json_array(str(path), chunk_size=2))
+
+
+class MergeJSONTest(unittest.TestCase):
+    def test_run(self):
+        """
+        並列に処理しても入力の順に出力されることのテスト
+        """
+        rng = random.Random(0)
+        with tempfile.TemporaryDirectory() as tmp:
+            inputs = []
+            expected = []
+            for i in range(3):
+                papers = _papers(rng, 5 + i, offset=100 * i)
+                inputs.append(str(Path(tmp) / f"in{i}.json"))
+                Path(inputs[-1]).write_text(json.dumps(papers))
+                expected += papers
+
+            merge_json.run(inputs, str(Path(tmp) / "merged"), jobs=2)
+            merged = list(merge_json.iter_papers(str(Path(tmp) / "merged")))
+            self.assertEqual([paper["id"] for paper in merged], [paper["id"] for paper in expected])
+            self.assertEqual(merged[0]["summary"], fix_needless_new_line(expected[0]["summary"]))
+
+            json_arxiv.run(inputs, str(Path(tmp) / "train.txt"), jobs=2)
+            lines = Path(tmp, "train.txt").read_text().splitlines()
+            self.assertEqual(lines, [paper["summary"] for paper in merged])
+
+    def test_incremental(self):
+        """
+        変更の無いファイルは読まず、重複した論文は追記せず、内容が変わった論文は新しいものだけが読まれることのテスト
+        """
+        rng = random.Random(0)
+        with tempfile.TemporaryDirectory() as tmp:
+            output = str(Path(tmp) / "merged")
+            day1 = _papers(rng, 4)
+            Path(tmp, "day1.json").write_text(json.dumps(day1))
+            stats = merge_json.run([str(Path(tmp) / "day1.json")], output, incremental=True)
+            self.assertEqual(stats, {"files": 1, "appended": 4, "skipped": 0})
+
+            # 2日目は1日目と2件重複し、そのうち1件は内容が変わっている
+            day2 = [day1[2], dict(day1[3], summary="updated")] + _papers(rng, 2, offset=10)
+            Path(tmp, "day2.json").write_text(json.dumps(day2))
+            inputs = [str(Path(tmp) / "day1.json"), str(Path(tmp) / "day2.json")]
+            stats = merge_json.run(inputs, output, jobs=2, incremental=True)
+            self.assertEqual(stats, {"files": 1, "appended": 3, "skipped": 1})
+            self.assertEqual(merge_json.run(inputs, output, incremental=True)["files"], 0)
+
+            merged = list(merge_json.iter_papers(output))
+            self.assertEqual([paper["id"] for paper in merged], ["0000", "0001", "0002", "0003", "0010", "0011"])
+            self.assertEqual(merged[3]["summary"], "updated")
+
+            # 訓練データはmerge_jsonの出力と同じ順になる
+            self.assertEqual(json_arxiv.from_merged(output, str(Path(tmp) / "train.txt")), 6)
+            lines = Path(tmp, "train.txt").read_text().splitlines()
+            self.assertEqual(lines, [paper["summary"] for paper in merged])
+
+    def test_incremental_after_full_merge(self):
+        """
+        全体を統合したディレクトリに差分を追記しても、既存の論文が残ることのテスト
+        """
+        rng = random.Random(0)
+        with tempfile.TemporaryDirectory() as tmp:
+            output = str(Path(tmp) / "merged")
+            Path(tmp, "day1.json").write_text(json.dumps(_papers(rng, 3)))
+            merge_json.run([str(Path(tmp) / "day1.json")], output)
+
+            Path(tmp, "day2.json").write_text(json.dumps(_papers(rng, 2, offset=10)))
+            stats = merge_json.run([str(Path(tmp) / "day2.json")], output, incremental=True)
+            self.assertEqual(stats["appended"], 2)
+            ids = [paper["id"] for paper in merge_json.iter_papers(output)]
+            self.assertEqual(ids, ["0000", "0001", "0002", "0010", "0011"])
+
+    def test_incremental_keeps_doc_numbers(self):
+        """
+        途中の論文の内容が変わっても、全体を統合したときの重複を含めて既存の論文の文書番号が変わらないことのテスト
+        """
+        rng = random.Random(0)
+        with tempfile.TemporaryDirectory() as tmp:
+            output = str(Path(tmp) / "merged")
+            day1 = _papers(rng, 4)
+            Path(tmp, "day1.json").write_text(json.dumps(day1 + [day1[0]]))
+            merge_json.run([str(Path(tmp) / "day1.json")], output)
+            before = [paper["id"] for paper in merge_json.iter_papers(output)]
+
+            day2 = [dict(day1[1], summary="updated")] + _papers(rng, 1, offset=10)
+            Path(tmp, "day2.json").write_text(json.dumps(day2))
+            stats = merge_json.run([str(Path(tmp) / "day2.json")], output, incremental=True)
+            self.assertEqual(stats["appended"], 2)
+
+            merged = list(merge_json.iter_papers(output))
+            self.assertEqual([paper["id"] for paper in merged], before + ["0010"])
+            self.assertEqual(merged[1]["summary"], "updated")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+
+import numpy as np
+
+from mlbase.lr_schedule import compile_schedule, DEFAULT_SCHEDULE
+
+
+class LRScheduleTest(unittest.TestCase):
+    def test_default_matches_legacy(self):
+        """
+        デフォルトが以前の「100000ステップごとに0.2倍」と同じであることのテスト
+        """
+        table = compile_schedule(DEFAULT_SCHEDULE, 0.1, 250000)
+        for i in [1, 100000, 100001, 200000, 200001, 250000]:
+            expected = 0.1 * 0.2 ** ((i - 1) // 100000)
+            self.assertAlmostEqual(table[i], expected, places=6)
+        self.assertAlmostEqual(table[0], 0.1)
+
+    def test_piecewise(self):
+        table = compile_schedule({"type": "piecewise", "boundaries": [2, 4], "values": [1.0, 0.5, 0.1]}, 1.0, 6)
+        np.testing.assert_allclose(table[1:], [1.0, 1.0, 0.5, 0.5, 0.1, 0.1])
+
+    def test_warmup_cosine(self):
+        config = {"type": "warmup", "warmup_steps": 10, "then": {"type": "cosine", "min_lr": 0.0}}
+        table = compile_schedule(config, 1.0, 100)
+        self.assertAlmostEqual(table[1], 0.1, places=3)
+        self.assertTrue(np.all(np.diff(table[1:10]) > 0))
+        self.assertTrue(np.all(np.diff(table[10:]) <= 0))
+        self.assertAlmostEqual(table[100], 0.0)
+
+    def test_one_cycle(self):
+        table = compile_schedule({"type": "one_cycle", "pct_start": 0.25}, 1.0, 100)
+        self.assertAlmostEqual(table[1], 1.0 / 25, places=6)
+        self.assertAlmostEqual(table.max(), 1.0, places=6)
+        self.assertAlmostEqual(table[100], 1.0 / 25 / 1e4, places=8)
+
+    def test_unknown(self):
+        self.assertRaises(Exception, compile_schedule, {"type": "unknown"}, 1.0, 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import contextlib
+import io
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from mlbase.arxiv2vec.dataset import json_arxiv, merge_json
+from mlbase.arxiv2vec.dataset.metadata import open_metadata_store
+
+
+class MetadataStoreTest(unittest.TestCase):
+    def test_random_access(self):
+        """
+        文書番号で論文が読め、作成元が更新されれば作り直されることのテスト
+        """
+        papers = [{"id": f"{i}", "title": f"タイトル{i}", "summary": "s" * i, "authors": ["x"]} for i in range(20)]
+        with tempfile.TemporaryDirectory() as tmp:
+            source = Path(tmp) / "papers.json"
+            source.write_text(json.dumps(papers))
+            merged = str(Path(tmp) / "merged")
+            merge_json.run([str(source)], merged)
+
+            with open_metadata_store(merged) as store:
+                self.assertEqual(len(store), 20)
+                self.assertEqual(store[13], {"id": "13", "title": "タイトル13", "summary": "s" * 13})
+                self.assertEqual([paper["id"] for paper in store.take([19, 0])], ["19", "0"])
+
+            source.write_text(json.dumps(papers[:5]))
+            merge_json.run([str(source)], merged)
+            with open_metadata_store(merged) as store:
+                self.assertEqual(len(store), 5)
+
+    def test_stale_source(self):
+        """
+        訓練後に作成元が更新されても、訓練時のメタデータが残っていれば作り直さずに使うことのテスト
+        """
+        papers = [{"id": f"{i}", "title": f"タイトル{i}", "summary": "s" * i} for i in range(10)]
+        with tempfile.TemporaryDirectory() as tmp:
+            source = Path(tmp) / "papers.json"
+            source.write_text(json.dumps(papers))
+            merged = str(Path(tmp) / "merged")
+            merge_json.run([str(source)], merged)
+            train_txt = str(Path(tmp) / "train.txt")
+            json_arxiv.from_merged(merged, train_txt)
+            train_source = json_arxiv.load_source(train_txt)
+            self.assertEqual(train_source["train_data"], merged)
+            open_metadata_store(merged).close()
+
+            source.write_text(json.dumps(papers[::-1]))
+            merge_json.run([str(source)], merged)
+            stderr = io.StringIO()
+            with contextlib.redirect_stderr(stderr), open_metadata_store(merged, train_source["stamp"]) as store:
+                self.assertEqual(store[3]["id"], "3")
+            self.assertIn("訓練後に更新されています", stderr.getvalue())
+
+            with open_metadata_store(merged) as store:
+                self.assertEqual(store[3]["id"], "6")
+
+            json_arxiv.run([str(source)], train_txt)
+            self.assertIsNone(json_arxiv.load_source(train_txt))
+
+
+if __name__ == '__main__':
+    unittest.main()
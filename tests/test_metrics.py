@@ -0,0 +1,55 @@
+import unittest
+
+import numpy as np
+
+from mlbase.utils.metrics import ClassificationMetrics
+
+
+class ClassificationMetricsTest(unittest.TestCase):
+    def test_streaming(self):
+        """
+        バッチに分けて集計しても一括の場合と同じ結果になることのテスト
+        """
+        rng = np.random.default_rng(0)
+        logits = rng.normal(size=[100, 7])
+        labels = rng.integers(0, 7, size=100)
+
+        whole = ClassificationMetrics(7, top_k=(1, 3))
+        whole.add(logits, labels)
+        batched = ClassificationMetrics(7, top_k=(1, 3))
+        for head in range(0, 100, 30):
+            batched.add(logits[head:head + 30], labels[head:head + 30])
+
+        np.testing.assert_array_equal(whole.confusion_matrix, batched.confusion_matrix)
+        self.assertEqual(whole.summary(), batched.summary())
+
+        top3 = np.argsort(-logits, axis=1)[:, :3]
+        expected = np.mean([label in row for label, row in zip(labels, top3)])
+        self.assertAlmostEqual(batched.top_k_accuracy(3), expected)
+        self.assertAlmostEqual(batched.accuracy, np.mean(logits.argmax(axis=1) == labels))
+
+    def test_missing_class(self):
+        """
+        正解に現れないクラスのrecallはnanになり、マクロ平均からは除かれることのテスト
+        """
+        metrics = ClassificationMetrics(3, top_k=(1,))
+        metrics.add(np.array([[1., 0., 0.], [0., 1., 0.]]), np.array([0, 0]))
+        recall = metrics.per_class_recall
+        self.assertEqual(recall[0], 0.5)
+        self.assertTrue(np.isnan(recall[1]))
+        self.assertEqual(metrics.macro_recall, 0.5)
+
+    def test_top_k_over_num_classes(self):
+        """
+        クラス数より大きいkは全件正解として集計され、1未満のkは作成時に例外になることのテスト
+        """
+        metrics = ClassificationMetrics(3)
+        metrics.add(np.array([[1., 0., 0.], [0., 1., 0.]]), np.array([0, 2]))
+        self.assertEqual(metrics.top_k_accuracy(5), 1.0)
+        self.assertEqual(metrics.summary()["top_5_accuracy"], 1.0)
+        with self.assertRaises(ValueError):
+            ClassificationMetrics(3, top_k=(0, ))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,22 @@
+import unittest
+
+from mlbase.arxiv2vec.preprocess import TeXMixedTextPreprocessor
+from mlbase.arxiv2vec.preprocess.parallel import ParallelPreprocessor
+
+
+class ParallelPreprocessorTest(unittest.TestCase):
+    def test_same_as_serial(self):
+        """
+        複数プロセスでも1プロセスと同じ結果が同じ順で返ることのテスト
+        """
+        lines = [f"line {i} with $x_{i}$ and $$y$$." for i in range(1000)]
+        preprocessor = TeXMixedTextPreprocessor()
+        expected = [preprocessor.preprocess(line) for line in lines]
+        with ParallelPreprocessor(preprocessor, jobs=3, chunksize=7, max_pending=2) as parallel:
+            self.assertEqual(list(parallel.preprocess_lines(iter(lines))), expected)
+            # プールを使い回して再度走査できる
+            self.assertEqual(list(parallel.preprocess_lines(lines[:10])), expected[:10])
+
+
+if __name__ == '__main__':
+    unittest.main()
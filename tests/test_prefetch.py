@@ -0,0 +1,78 @@
+import threading
+import time
+import unittest
+
+from mlbase.dataset.prefetch import Prefetcher
+
+
+class PrefetcherTest(unittest.TestCase):
+    def test_order(self):
+        """
+        複数ワーカーでも元の順番で取り出せることのテスト
+        """
+
+        def slow_double(x):
+            time.sleep(0.001 * (x % 3))
+            return x * 2
+
+        with Prefetcher(range(50), num_workers=4, queue_size=2, transform=slow_double) as batches:
+            self.assertEqual(list(batches), [x * 2 for x in range(50)])
+
+    def test_error(self):
+        """
+        sourceの例外が取り出し側で送出されることのテスト
+        """
+
+        def source():
+            yield 1
+            raise ValueError("broken")
+
+        batches = Prefetcher(source())
+        self.assertEqual(next(batches), 1)
+        self.assertRaises(ValueError, next, batches)
+        self.assertRaises(StopIteration, next, batches)
+
+    def test_close_infinite_source(self):
+        """
+        無限に続くsourceでもcloseでワーカーが終了することのテスト
+        """
+
+        def source():
+            while True:
+                yield 0
+
+        before = threading.active_count()
+        with Prefetcher(source(), num_workers=3, queue_size=1, poll_interval=0.01) as batches:
+            next(batches)
+        self.assertEqual(threading.active_count(), before)
+        self.assertEqual(batches.count, 1)
+        # 閉じた後に取り出しても待ち続けない
+        self.assertRaises(StopIteration, next, batches)
+
+    def test_bounded_lookahead(self):
+        """
+        先頭のtransformが遅くても、sourceからqueue_sizeを超えて先読みしないことのテスト
+        """
+        release = threading.Event()
+        pulled = []
+
+        def source():
+            for i in range(20):
+                pulled.append(i)
+                yield i
+
+        def transform(x):
+            if x == 0:
+                release.wait()
+            return x
+
+        with Prefetcher(source(), num_workers=4, queue_size=3, transform=transform, poll_interval=0.01) as batches:
+            time.sleep(0.1)
+            pulled_before_release = len(pulled)
+            release.set()
+            self.assertEqual(list(batches), list(range(20)))
+        self.assertEqual(pulled_before_release, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,25 @@
+import json
+import unittest
+
+from mlbase.arxiv2vec.preprocess import (
+    SimplePreprocessor,
+    TeXMixedTextPreprocessor,
+    preprocessor_manifest,
+    preprocessor_from_manifest,
+)
+
+
+class PreprocessorManifestTest(unittest.TestCase):
+    def test_round_trip(self):
+        """
+        マニフェストから同じ種類、同じ設定の前処理が復元できることのテスト
+        """
+        for preprocessor in [TeXMixedTextPreprocessor(), SimplePreprocessor(deacc=True, min_len=3)]:
+            manifest = json.loads(json.dumps(preprocessor_manifest(preprocessor)))
+            restored = preprocessor_from_manifest(manifest)
+            self.assertIs(type(restored), type(preprocessor))
+            self.assertEqual(restored.settings(), preprocessor.settings())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+from mlbase.template.cifar.train import Data
+from mlbase.dataset.record import write_records, RecordReader, RecordWriter, RecordCorruptedError
+
+
+def _data(count):
+    rng = np.random.default_rng(0)
+    images = rng.integers(0, 256, size=[count, 4, 4, 3], dtype=np.uint8)
+    return Data(images=images, coarse_labels=np.arange(count) % 3, fine_labels=np.arange(count, dtype=np.int16))
+
+
+class RecordTest(unittest.TestCase):
+    def test_round_trip(self):
+        """
+        圧縮の有無によらず、ランダムアクセスとシャード単位の読み込みで同じ値が返ることのテスト
+        """
+        data = _data(23)
+        for compression in [None, "zlib", "lzma"]:
+            with tempfile.TemporaryDirectory() as tmp:
+                path = Path(tmp) / "records"
+                write_records(path, data, records_per_shard=5, compression=compression)
+                with RecordReader(path) as reader:
+                    self.assertEqual(len(reader), 23)
+                    self.assertEqual(reader.num_shards, 5)
+
+                    record = reader[17]
+                    np.testing.assert_array_equal(record.images, data.images[17])
+                    self.assertEqual(record.fine_labels, 17)
+                    self.assertEqual(reader[-1].coarse_labels, data.coarse_labels[-1])
+
+                    batch = reader.take([4, 0, 22])
+                    self.assertIsInstance(batch, Data)
+                    np.testing.assert_array_equal(batch.images, data.images[[4, 0, 22]])
+                    self.assertEqual(batch.fine_labels.dtype, np.int16)
+
+                    shards = list(reader.iter_shards(num_workers=3))
+                    np.testing.assert_array_equal(np.concatenate([s.images for s in shards]), data.images)
+                    np.testing.assert_array_equal(np.concatenate([s.fine_labels for s in shards]), data.fine_labels)
+
+    def test_incremental_write(self):
+        """
+        バッチを分けて書いても1回で書いたものと同じになることのテスト
+        """
+        data = _data(10)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "records"
+            with RecordWriter(path, records_per_shard=4) as writer:
+                writer.write(Data(*[x[:3] for x in data]))
+                writer.write(Data(*[x[3:] for x in data]))
+            with RecordReader(path) as reader:
+                batches = list(reader.batches([[0, 1], [9]]))
+                np.testing.assert_array_equal(batches[1].images[0], data.images[9])
+
+    def test_empty(self):
+        """
+        0件のバッチは読めるように書け、一度もwriteしなければ何も作らずに例外になることのテスト
+        """
+        data = _data(0)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "records"
+            write_records(path, data)
+            with RecordReader(path) as reader:
+                self.assertEqual(len(reader), 0)
+
+            path = Path(tmp) / "never_written"
+            with self.assertRaises(Exception):
+                with RecordWriter(path):
+                    pass
+            self.assertFalse(path.exists())
+            self.assertEqual(sorted(p.name for p in Path(tmp).iterdir()), ["records"])
+
+    def test_corrupted(self):
+        """
+        本体が書き換わっていればCRCで検出することのテスト
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "records"
+            write_records(path, _data(3), records_per_shard=10)
+            with open(path / "shard-00000.rec", "r+b") as f:
+                f.seek(10)
+                byte = f.read(1)
+                f.seek(10)
+                f.write(bytes([byte[0] ^ 0xff]))
+            with RecordReader(path) as reader:
+                with self.assertRaises(RecordCorruptedError):
+                    reader[0]
+                reader[1]
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+
+import numpy as np
+
+from mlbase.dataset.sampler import PermutationSampler
+
+
+class PermutationSamplerTest(unittest.TestCase):
+    def test_without_replacement(self):
+        """
+        1エポック内でインデックスが重複しないことのテスト
+        """
+        sampler = PermutationSampler(10, 3, seed=1)
+        ids = np.concatenate([next(sampler) for _ in range(10)])
+        for epoch in range(3):
+            self.assertEqual(sorted(ids[epoch * 10:(epoch + 1) * 10]), list(range(10)))
+
+    def test_resume(self):
+        """
+        保存した状態から再開すると、続きのインデックスが得られることのテスト
+        """
+        sampler = PermutationSampler(10, 4, seed=2)
+        for _ in range(4):
+            next(sampler)
+        state = sampler.state_dict()
+        expected = [next(sampler) for _ in range(5)]
+
+        resumed = PermutationSampler(10, 4, seed=2)
+        resumed.load_state_dict(state)
+        result = [next(resumed) for _ in range(5)]
+        for r, e in zip(result, expected):
+            np.testing.assert_array_equal(r, e)
+
+    def test_shard(self):
+        """
+        ワーカーごとのインデックスが重複せず、合わせると1エポック分になることのテスト
+        """
+        ids = []
+        for rank in range(3):
+            shard_size = len(range(rank, 10, 3))
+            ids.append(next(PermutationSampler(10, shard_size, seed=3, rank=rank, world_size=3)))
+        self.assertEqual(sorted(np.concatenate(ids).tolist()), list(range(10)))
+
+    def test_mismatched_state(self):
+        sampler = PermutationSampler(10, 4, seed=2)
+        other = PermutationSampler(10, 4, seed=3)
+        self.assertRaises(Exception, other.load_state_dict, sampler.state_dict())
+
+
+if __name__ == '__main__':
+    unittest.main()
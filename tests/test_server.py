@@ -0,0 +1,74 @@
+import json
+import pickle
+import socket
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from mlbase.arxiv2vec.server import InferenceServer, RemoteError, connect
+
+
+class FakeModel:
+    def infer_vectors(self, texts, jobs=1):
+        return [np.array([len(text), text.count("a")], dtype=np.float32) for text in texts]
+
+    def find_neighbors(self, vec, k=10):
+        return [(int(vec[0]), 0.5)] * k
+
+
+class InferenceServerTest(unittest.TestCase):
+    def test_requests(self):
+        """
+        同時に送ったリクエストがまとめて処理され、それぞれに正しい結果が返ることのテスト
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            model_path = Path(tmp) / "model.pkl"
+            socket_path = str(Path(tmp) / "server.sock")
+            pickle.dump(FakeModel(), open(model_path, "wb"))
+
+            server = InferenceServer(str(model_path), socket_path, workers=2, batch_window=0.05)
+            ready = threading.Event()
+            thread = threading.Thread(target=server.run, args=(ready, ))
+            thread.start()
+            try:
+                self.assertTrue(ready.wait(60))
+                self.assertIsNone(connect(socket_path, model_path=str(Path(tmp) / "other.pkl")))
+
+                def request(i):
+                    with connect(socket_path, model_path=str(model_path)) as remote:
+                        return remote.infer_vectors(["a" * i, "b"])
+
+                with ThreadPoolExecutor(8) as executor:
+                    results = list(executor.map(request, range(8)))
+                for i, (vec_a, vec_b) in enumerate(results):
+                    np.testing.assert_array_equal(vec_a, [i, i])
+                    np.testing.assert_array_equal(vec_b, [1, 0])
+
+                with connect(socket_path) as remote:
+                    self.assertEqual(remote.find_neighbors(np.array([3.0, 0.0]), k=2), [(3, 0.5)] * 2)
+                    self.assertAlmostEqual(remote.request("compare", texts=["aa", "ab"])["cos"], 3 / np.sqrt(10))
+                    with self.assertRaises(RemoteError):
+                        remote.request("compare", texts=["a"])
+
+                # 壊れたリクエストにはエラーを返し、同じ接続で続けて使える
+                with socket.socket(socket.AF_UNIX) as sock:
+                    sock.connect(socket_path)
+                    sock.sendall(b'not json\n[1]\n{"id": 7, "action": "ping"}\n')
+                    with sock.makefile("rb") as f:
+                        responses = [json.loads(f.readline()) for _ in range(3)]
+                self.assertIn("invalid request", responses[0]["error"])
+                self.assertIn("invalid request", responses[1]["error"])
+                self.assertEqual(responses[2]["id"], 7)
+                self.assertEqual(responses[2]["result"]["model"], str(model_path))
+            finally:
+                server.stop()
+                thread.join()
+            self.assertFalse(Path(socket_path).exists())
+
+
+if __name__ == '__main__':
+    unittest.main()
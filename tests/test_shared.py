@@ -0,0 +1,58 @@
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+from mlbase.dataset.shared import SharedDatasetHost, attach_dataset, attach_or_host
+from mlbase.template.cifar.train import Data
+
+_ATTACH_SCRIPT = """
+import sys
+from mlbase.dataset.shared import attach_dataset
+data = attach_dataset("test", registry=sys.argv[1])
+print(int(data.images.sum()), data.images.flags.writeable)
+"""
+
+
+def _data():
+    images = np.arange(2 * 4 * 4 * 3, dtype=np.uint8).reshape([2, 4, 4, 3])
+    return Data(images=images, coarse_labels=np.array([0, 1]), fine_labels=np.array([2, 3]))
+
+
+class SharedDatasetTest(unittest.TestCase):
+    def test_attach_from_other_process(self):
+        """
+        別プロセスから読み込み専用で参照できることのテスト
+        """
+        data = _data()
+        with tempfile.TemporaryDirectory() as registry, SharedDatasetHost("test", data, registry):
+            output = subprocess.run(
+                [sys.executable, "-c", _ATTACH_SCRIPT, registry], capture_output=True, text=True, check=True
+            )
+            self.assertEqual(output.stdout.split(), [str(int(data.images.sum())), "False"])
+
+    def test_attach_or_host(self):
+        """
+        ホストされていなければ読み込み、されていれば読み込まないことのテスト
+        """
+        calls = []
+
+        def load():
+            calls.append(0)
+            return _data()
+
+        with tempfile.TemporaryDirectory() as registry:
+            first, host = attach_or_host("test", load, registry)
+            second, other_host = attach_or_host("test", load, registry)
+            self.assertIsNone(other_host)
+            self.assertEqual(len(calls), 1)
+            np.testing.assert_array_equal(first.images, second.images)
+
+            host.close()
+            self.assertIsNone(attach_dataset("test", registry))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import csv
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+from mlbase.arxiv2vec.similarity import top_k_similar, write_similarity
+
+
+class SimilarityTest(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.vectors = rng.normal(size=[37, 8]).astype(np.float32)
+        normalized = self.vectors / np.linalg.norm(self.vectors, axis=1, keepdims=True)
+        self.expected = normalized @ normalized.T
+        self.names = [f"doc{i}" for i in range(37)]
+
+    def test_matrix(self):
+        """
+        ブロックに分けて書き出しても全体の行列積と同じになることのテスト
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            npy = str(Path(tmp) / "cos.npy")
+            write_similarity(npy, self.names, self.vectors, block_size=5)
+            np.testing.assert_allclose(np.load(npy), self.expected, atol=1e-5)
+
+            path = str(Path(tmp) / "cos.csv")
+            write_similarity(path, self.names, self.vectors, block_size=5)
+            rows = list(csv.reader(open(path)))
+            self.assertEqual(rows[0][1:], self.names)
+            np.testing.assert_allclose(np.array(rows[3][1:], dtype=float), self.expected[2], atol=1e-5)
+
+    def test_top_k(self):
+        """
+        自分自身を除いた類似度の大きい順になることのテスト
+        """
+        result = top_k_similar(self.vectors, 3, block_size=4)
+        scores = self.expected - 2 * np.eye(37)
+        np.testing.assert_array_equal(result["index"], np.argsort(-scores, axis=1)[:, :3])
+        np.testing.assert_allclose(result["cos"], np.sort(scores, axis=1)[:, ::-1][:, :3], atol=1e-5)
+        self.assertTrue(np.all(top_k_similar(self.vectors[:2], 3)["index"][:, 1:] == -1))
+
+    def test_unsupported_output(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = str(Path(tmp) / "cos.txt")
+            with self.assertRaises(Exception):
+                write_similarity(path, self.names, self.vectors)
+            self.assertFalse(Path(path).exists())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from mlbase.utils.step_timer import StepTimer
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, sec: float):
+        self.now += sec
+
+
+class StepTimerTest(unittest.TestCase):
+    def test_summary(self):
+        """
+        内訳、百分位数、ETA、JSONLへの書き出し、再開時のステップ数のテスト
+        """
+        clock = FakeClock()
+        # (データ待ち, session.run, それ以外)の秒数
+        steps = [(1, 2, 1), (1, 2, 0), (2, 2, 1), (1, 4, 1)]
+        with tempfile.TemporaryDirectory() as tmp:
+            output = str(Path(tmp) / "steps.jsonl")
+            timer = StepTimer(10, 4, output=output, interval=3, tag="model", initial_step=5, clock=clock)
+            for data, run, other in timer.wrap(steps):
+                with timer.phase("data"):
+                    clock.advance(data)
+                with timer.phase("run"):
+                    clock.advance(run)
+                clock.advance(other)
+
+            # 3ステップで書き出され、その後の1ステップだけが集計中
+            current = timer.summary()
+            self.assertEqual((current["step"], current["steps"]), (9, 1))
+            self.assertEqual(current["eta_sec"], 6.0)
+            self.assertEqual(timer.mean_step_time, 4.5)
+
+            timer.emit()
+            records = [json.loads(line) for line in open(output)]
+            self.assertEqual(len(records), 2)
+            first = records[0]
+            self.assertEqual((first["tag"], first["step"], first["steps"]), ("model", 8, 3))
+            self.assertEqual(first["step_time"], {"mean": 4.0, "p50": 4.0, "p95": 5.0, "p99": 5.0})
+            self.assertEqual(first["samples_per_sec"], 1.0)
+            self.assertEqual(first["eta_sec"], 8.0)
+            self.assertEqual(set(first["phases"]), {"data", "run", "other"})
+            self.assertAlmostEqual(first["phases"]["data"], 4 / 3)
+            self.assertAlmostEqual(first["phases"]["run"], 2.0)
+            self.assertAlmostEqual(first["phases"]["other"], 2 / 3)
+            self.assertEqual(records[1]["step"], 9)
+
+            # 集計中のステップが無ければ書き出さない
+            timer.emit()
+            self.assertEqual(len(open(output).readlines()), 2)
+
+    def test_eta_after_total_step(self):
+        """
+        全ステップを超えて再開してもETAが負にならないことのテスト
+        """
+        clock = FakeClock()
+        timer = StepTimer(3, 1, initial_step=3, clock=clock)
+        timer.start()
+        clock.advance(2)
+        timer.step()
+        self.assertEqual(timer.summary()["eta_sec"], 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
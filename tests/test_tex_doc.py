@@ -0,0 +1,33 @@
+import random
+import unittest
+
+from mlbase.arxiv2vec.preprocess.tex_doc import split_tex_doc, legacy_split_tex_doc
+
+
+class SplitTeXDocTest(unittest.TestCase):
+    def test_equivalent_to_legacy(self):
+        """
+        ランダムな文字列に対して以前の状態遷移による実装と同じ結果になることのテスト
+        """
+        rng = random.Random(0)
+        alphabet = "$$$  ab,.\t\n\\"
+        for _ in range(20000):
+            line = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 24)))
+            self.assertEqual(split_tex_doc(line), legacy_split_tex_doc(line), repr(line))
+
+    def test_examples(self):
+        cases = {
+            "a$b$c": ["a", "$b$", "c"],
+            "$$ x $$ y": ["$$ x $$", "y"],
+            "$$$$": ["$$$$"],
+            "a $$x$ b": ["a"],
+            "a$": ["a"],
+            "  \n": [],
+        }
+        for line, expected in cases.items():
+            self.assertEqual(split_tex_doc(line), expected)
+            self.assertEqual(legacy_split_tex_doc(line), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
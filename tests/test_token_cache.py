@@ -0,0 +1,60 @@
+import tempfile
+import unittest
+from pathlib import Path
+from typing import List
+
+from mlbase.arxiv2vec.preprocess import TeXMixedTextPreprocessor
+from mlbase.arxiv2vec.token_cache import load_or_build_token_cache, token_cache_key, write_token_cache, TokenCorpus
+
+
+class CountingPreprocessor(TeXMixedTextPreprocessor):
+    """
+    前処理した行数を数える
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    def preprocess(self, line: str) -> List[str]:
+        self.calls += 1
+        return super().preprocess(line)
+
+
+class TokenCacheTest(unittest.TestCase):
+    def test_round_trip(self):
+        """
+        保存したコーパスから前処理の結果が復元でき、2回目はキャッシュが使われることのテスト
+        """
+        lines = ["We show $x^2$ is positive.\n", "\n", "A $$y$$ b, c\n"]
+        preprocessor = CountingPreprocessor()
+        with tempfile.TemporaryDirectory() as tmp:
+            train_data = Path(tmp) / "train.txt"
+            train_data.write_text("".join(lines))
+            corpus = load_or_build_token_cache(Path(tmp) / "cache", str(train_data), preprocessor)
+            self.assertEqual(preprocessor.calls, 3)
+
+            self.assertEqual(len(corpus), 3)
+            for i, line in enumerate(lines):
+                self.assertEqual(corpus.words(i), preprocessor.preprocess(line))
+            self.assertEqual(corpus.tokens.dtype.name, "int32")
+            self.assertEqual(corpus.meta["key"], token_cache_key(preprocessor, str(train_data)))
+
+            preprocessor.calls = 0
+            again = load_or_build_token_cache(Path(tmp) / "cache", str(train_data), preprocessor)
+            self.assertEqual(preprocessor.calls, 0)
+            self.assertEqual(again.words(2), corpus.words(2))
+
+    def test_special_characters(self):
+        """
+        改行等を含む単語も語彙として読み戻せることのテスト
+        """
+        docs = [["$a\nb$", "x\ry", " "], ["", "x\ry"]]
+        with tempfile.TemporaryDirectory() as tmp:
+            write_token_cache(Path(tmp) / "cache", docs)
+            corpus = TokenCorpus(Path(tmp) / "cache")
+            self.assertEqual([corpus.words(i) for i in range(len(corpus))], docs)
+
+
+if __name__ == '__main__':
+    unittest.main()
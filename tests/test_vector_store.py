@@ -0,0 +1,42 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+from mlbase.arxiv2vec.vector_store import VectorStore
+
+
+class VectorStoreTest(unittest.TestCase):
+    def test_append_and_resume(self):
+        """
+        中断後に開き直すと確定したチャンクから続きを追記でき、連結したビューで読めることのテスト
+        """
+        vectors = np.arange(11 * 3, dtype=np.float32).reshape([11, 3])
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "store"
+            store = VectorStore(path, chunk_size=4)
+            for i in range(6):
+                store.append(f"doc{i}", vectors[i])
+            # closeせずに中断すると、確定していない2件は失われる
+            del store
+
+            with VectorStore(path, chunk_size=4) as store:
+                self.assertEqual(store.done_ids(), {f"doc{i}" for i in range(4)})
+                for i in range(4, 11):
+                    store.append(f"doc{i}", vectors[i])
+
+            store = VectorStore(path)
+            self.assertEqual(store.ids, [f"doc{i}" for i in range(11)])
+            view = store.vectors()
+            self.assertEqual(view.shape, (11, 3))
+            self.assertIsInstance(view[1:3], np.memmap)
+            np.testing.assert_array_equal(np.asarray(view), vectors)
+            np.testing.assert_array_equal(view[2:9], vectors[2:9])
+            np.testing.assert_array_equal(view[[10, 0, 5]], vectors[[10, 0, 5]])
+            np.testing.assert_array_equal(view[-1], vectors[-1])
+            np.testing.assert_array_equal(view[::3], vectors[::3])
+
+
+if __name__ == '__main__':
+    unittest.main()